@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块 Merkle 指纹 - 大文件按固定大小分块哈希
+
+功能说明：
+1. 按固定块大小（与 dock_transfer_config.chunked_transfer.chunk_size_mb 一致）计算每块的摘要，
+   块哈希在哈希线程池中并行计算；需要整文件摘要（如 md5）时在同一次读取中一并计算
+2. 由块哈希自底向上两两合并得到 Merkle 根，作为大文件的完整内容指纹
+   （替代只覆盖头、中、尾各 1MB 的采样哈希）
+3. 与远端逐块比较，得到需要重新发送的字节范围（相邻块合并为一个范围）
+4. 远端块哈希通过一次 SSH 会话（dd | sha256sum 循环）获取
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import shlex
+import hashlib
+import logging
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from file_hasher import FileHasher, get_file_hasher
+from ssh_connection_pool import SSHConnectionPool
+
+DEFAULT_CHUNK_SIZE = 10 * 1024 * 1024
+
+# 远端计算块摘要使用的命令
+REMOTE_DIGEST_COMMANDS = {
+    'sha256': 'sha256sum',
+    'md5': 'md5sum',
+}
+
+
+def merkle_root(chunk_hashes: Sequence[str]) -> str:
+    """由块哈希计算 Merkle 根
+
+    每层相邻两个节点拼接后取 sha256，奇数个节点时最后一个直接进入上一层。
+    只有一个块时根即该块的哈希，没有块（空文件）时为空内容的 sha256。
+
+    Args:
+        chunk_hashes: 按顺序排列的块哈希（十六进制）
+
+    Returns:
+        str: Merkle 根（十六进制）
+    """
+    if not chunk_hashes:
+        return hashlib.sha256(b'').hexdigest()
+
+    level = [bytes.fromhex(h) for h in chunk_hashes]
+    while len(level) > 1:
+        next_level = [hashlib.sha256(level[i] + level[i + 1]).digest()
+                      for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].hex()
+
+
+@dataclass
+class ChunkManifest:
+    """文件的分块指纹"""
+    chunk_size: int
+    file_size: int
+    chunk_hashes: List[str] = field(default_factory=list)
+    algorithm: str = 'sha256'
+    digests: Dict[str, str] = field(default_factory=dict)   # 同一次读取得到的整文件摘要
+
+    @property
+    def chunk_count(self) -> int:
+        """块数量"""
+        return len(self.chunk_hashes)
+
+    @property
+    def root(self) -> str:
+        """Merkle 根"""
+        return merkle_root(self.chunk_hashes)
+
+    def chunk_range(self, index: int) -> Tuple[int, int]:
+        """块的字节范围
+
+        Returns:
+            (起始偏移, 长度)
+        """
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.file_size - offset)
+
+    def mismatched_chunks(self, other_hashes: Sequence[str]) -> List[int]:
+        """与另一组块哈希逐块比较，返回不一致（含缺失）的块序号"""
+        return [index for index, chunk_hash in enumerate(self.chunk_hashes)
+                if index >= len(other_hashes) or other_hashes[index] != chunk_hash]
+
+    def mismatched_ranges(self, other_hashes: Sequence[str]) -> List[Tuple[int, int]]:
+        """返回需要重新发送的字节范围，相邻的不一致块合并为一个范围
+
+        Returns:
+            List[Tuple[int, int]]: (起始偏移, 长度) 列表
+        """
+        ranges: List[Tuple[int, int]] = []
+        for index in self.mismatched_chunks(other_hashes):
+            offset, length = self.chunk_range(index)
+            if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((offset, length))
+        return ranges
+
+
+def compute_chunk_manifest(file_path: str,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           hasher: FileHasher = None,
+                           algorithm: str = 'sha256',
+                           file_size: int = None,
+                           digests: Sequence[str] = ()) -> ChunkManifest:
+    """并行计算文件的分块指纹
+
+    不需要整文件摘要时各块按字节范围并行读取；需要时顺序读取一次，
+    块摘要与读取重叠计算，整文件摘要保存在 manifest.digests 中。
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 块大小（字节）
+        hasher: 哈希服务，None 时使用进程内共享实例
+        algorithm: 块摘要算法
+        file_size: 已知的文件大小，None 时重新获取
+        digests: 同一次读取中一并计算的整文件摘要算法，如 ('sha256', 'md5')
+
+    Returns:
+        ChunkManifest: 分块指纹
+
+    Raises:
+        OSError: 文件读取失败
+    """
+    hasher = hasher or get_file_hasher()
+    if file_size is None:
+        file_size = os.path.getsize(file_path)
+
+    if digests:
+        chunk_hashes, file_digests = hasher.hash_chunks(file_path, chunk_size, algorithm, digests, file_size)
+        return ChunkManifest(chunk_size, file_size, chunk_hashes, algorithm, file_digests)
+
+    offsets = range(0, file_size, chunk_size)
+    chunk_hashes = list(hasher.map(
+        lambda offset: hasher.hash_range(file_path, offset, chunk_size, algorithm), offsets))
+    return ChunkManifest(chunk_size, file_size, chunk_hashes, algorithm)
+
+
+def fetch_remote_chunk_hashes(pool: SSHConnectionPool,
+                              remote_path: str,
+                              manifest: ChunkManifest,
+                              timeout: float = None,
+                              logger: logging.Logger = None) -> Optional[List[str]]:
+    """在一次 SSH 会话中逐块计算远端文件的摘要
+
+    Args:
+        pool: SSH 连接池
+        remote_path: 远程文件路径
+        manifest: 本地分块指纹（提供块大小、块数量和算法）
+        timeout: 超时时间（秒），None 时按文件大小估算（约 50MB/s 加 60 秒）
+        logger: 日志记录器
+
+    Returns:
+        List[str]: 远端块哈希（远端文件较短时数量少于本地），失败返回None
+    """
+    logger = logger or logging.getLogger('ChunkManifest')
+    digest_command = REMOTE_DIGEST_COMMANDS.get(manifest.algorithm)
+    if digest_command is None:
+        logger.error(f"远端不支持的块摘要算法: {manifest.algorithm}")
+        return None
+    if timeout is None:
+        timeout = 60 + manifest.file_size / (50 * 1024 * 1024)
+
+    path = shlex.quote(remote_path)
+    command = (
+        f"[ -f {path} ] || exit 2; i=0; "
+        f"while [ $i -lt {manifest.chunk_count} ]; do "
+        f"dd if={path} bs={manifest.chunk_size} skip=$i count=1 2>/dev/null | {digest_command}; "
+        f"i=$((i+1)); done"
+    )
+
+    try:
+        result = pool.run(command, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f"远端块哈希计算超时: {remote_path}")
+        return None
+
+    if result.returncode == 2:
+        return []
+    if result.returncode != 0:
+        logger.error(f"远端块哈希计算失败: {remote_path}, {result.stderr.strip()}")
+        return None
+
+    # 远端文件较短时，超出末尾的块读到空内容，其哈希与本地块必然不同
+    return [line.split()[0] for line in result.stdout.splitlines() if line.strip()]
+
+
+def verify_remote_chunks(pool: SSHConnectionPool,
+                         remote_path: str,
+                         manifest: ChunkManifest,
+                         timeout: float = None,
+                         logger: logging.Logger = None) -> Optional[List[Tuple[int, int]]]:
+    """逐块校验远端文件
+
+    Returns:
+        List[Tuple[int, int]]: 需要重新发送的字节范围（空列表表示完全一致），校验失败返回None
+    """
+    remote_hashes = fetch_remote_chunk_hashes(pool, remote_path, manifest, timeout, logger)
+    if remote_hashes is None:
+        return None
+    return manifest.mismatched_ranges(remote_hashes)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块上传 - Edge -> NAS 大文件断点续传
+
+功能说明：
+1. 大文件按块大小切分，每块经 SSH 复用连接写入远端分块目录（{前缀}{文件名}.parts/{序号}.part），
+   多个分块并发上传（max_concurrent_chunks）
+2. 逐块状态记录在 MediaStatusDB（upload_tasks / upload_chunks），进程崩溃、超时或网络中断后
+   只重传未完成的分块，而不是整个文件从头开始
+3. 读取分块的同时计算摘要，远端写入后在同一会话中返回摘要比对；续传前列出远端已有分块，
+   缺失或大小不符的分块重新上传
+4. 全部分块到齐后在远端按序拼接为临时文件，校验大小后改名为目标文件并删除分块目录
+5. 每个分块和组装的超时按数据量估算；发送速率受上传带宽限制器约束
+6. 可选的组装后校验：远端文件与分块指纹不一致时，只把涉及的分块置回 pending 重新上传，
+   在远端原位写回目标文件；校验通过前保留上传任务和逐块状态
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import time
+import shlex
+import logging
+import tempfile
+import threading
+import posixpath
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chunk_manifest import REMOTE_DIGEST_COMMANDS
+from file_hasher import new_digest
+from media_status_db import MediaStatusDB, UploadChunk
+from rate_limiter import BandwidthLimiter
+from ssh_connection_pool import SSHConnectionPool
+from stream_uploader import DEFAULT_COPY_BUFFER, MIN_THROUGHPUT_BYTES
+
+DEFAULT_CHUNK_SIZE = 10 * 1024 * 1024
+
+# 远端：写入临时分块，完整接收后改名并返回摘要（中断时不会留下大小正确但内容不全的 .part）
+REMOTE_CHUNK_COMMAND = "mkdir -p {parts} && cat > {tmp} && mv -f {tmp} {part} && {digest} {part}"
+
+# 远端：列出已有分块及大小
+REMOTE_LIST_COMMAND = "cd {parts} 2>/dev/null && for f in *.part; do [ -f \"$f\" ] && echo \"$(wc -c <\"$f\") $f\"; done; true"
+
+# 远端：按序拼接分块，校验大小后改名为目标文件并删除分块目录
+REMOTE_ASSEMBLE_COMMAND = (
+    "cd {parts} && : > {tmp} && i=0 && "
+    "while [ $i -lt {count} ]; do cat \"$(printf '%08d' $i).part\" >> {tmp} || exit 1; i=$((i+1)); done && "
+    "[ \"$(wc -c < {tmp})\" -eq {size} ] && mv -f {tmp} {target} && cd / && rm -rf {parts}"
+)
+
+# 远端：把重新上传的分块按序号原位写回目标文件（不截断），然后删除分块目录
+REMOTE_PATCH_COMMAND = (
+    "[ -f {target} ] && cd {parts} && "
+    "for i in {indexes}; do dd if=\"$(printf '%08d' $i).part\" of={target} bs={bs} seek=$i conv=notrunc 2>/dev/null "
+    "|| exit 1; done && cd / && rm -rf {parts}"
+)
+
+
+class ChunkedUploader:
+    """通过 SSH 复用连接分块上传大文件，支持断点续传"""
+
+    def __init__(self,
+                 pool: SSHConnectionPool,
+                 db: MediaStatusDB,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_concurrent_chunks: int = 3,
+                 retry_attempts: int = 3,
+                 retry_delay: float = 2,
+                 temp_prefix: str = '.chunk_',
+                 limiter: BandwidthLimiter = None,
+                 algorithm: str = 'sha256',
+                 logger: logging.Logger = None):
+        """初始化上传器
+
+        Args:
+            pool: SSH 连接池
+            db: 记录逐块状态的媒体状态数据库
+            chunk_size: 块大小（字节）
+            max_concurrent_chunks: 并发上传的分块数
+            retry_attempts: 单个分块失败后的重试次数
+            retry_delay: 重试间隔（秒）
+            temp_prefix: 远端分块目录和组装临时文件的名称前缀
+            limiter: 上传带宽限制器，None 表示不限速
+            algorithm: 分块校验摘要算法（远端需有对应的 *sum 命令）
+            logger: 日志记录器
+
+        Raises:
+            ValueError: 块大小无效或远端不支持的摘要算法
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"无效的块大小: {chunk_size}")
+        if algorithm not in REMOTE_DIGEST_COMMANDS:
+            raise ValueError(f"远端不支持的摘要算法: {algorithm}")
+        self.pool = pool
+        self.db = db
+        self.chunk_size = int(chunk_size)
+        self.max_concurrent_chunks = max(1, int(max_concurrent_chunks))
+        self.retry_attempts = max(0, int(retry_attempts))
+        self.retry_delay = retry_delay
+        self.temp_prefix = temp_prefix
+        self.limiter = limiter
+        self.algorithm = algorithm
+        self.logger = logger or logging.getLogger('ChunkedUploader')
+
+    def _parts_dir(self, remote_path: str) -> str:
+        remote_dir, name = posixpath.split(remote_path)
+        return posixpath.join(remote_dir, f"{self.temp_prefix}{name}.parts")
+
+    @staticmethod
+    def _part_name(index: int) -> str:
+        return f"{index:08d}.part"
+
+    def upload(self,
+               file_path: str,
+               remote_path: str,
+               on_progress: Callable[[int, int], None] = None,
+               verify: Callable[[], Optional[List[Tuple[int, int]]]] = None) -> Tuple[bool, str]:
+        """分块上传一个文件，已完成的分块不再重传
+
+        Args:
+            file_path: 本地文件路径
+            remote_path: 远端目标文件路径
+            on_progress: 每完成一个分块在调用线程中回调 (已完成字节数, 文件大小)，可用于续约
+            verify: 组装后的校验，返回远端不一致的字节范围 [(offset, length)]（一致为空列表，
+                    校验失败为 None）；不一致的范围只重传涉及的分块
+
+        Returns:
+            tuple: (是否成功, 错误信息)
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False, "源文件不存在"
+
+        chunks = self.db.start_upload_task(file_path, remote_path, stat.st_size, stat.st_mtime_ns, self.chunk_size)
+        if not chunks:
+            return False, "创建分块上传任务失败"
+
+        parts_dir = self._parts_dir(remote_path)
+        remote_sizes = self._list_remote_parts(parts_dir)
+        if remote_sizes is None:
+            return False, "列出远端分块失败"
+
+        pending = []
+        for chunk in chunks:
+            if chunk.status == 'completed' and remote_sizes.get(chunk.index) == chunk.size:
+                continue
+            pending.append(chunk)
+        done_bytes = stat.st_size - sum(chunk.size for chunk in pending)
+        if done_bytes:
+            self.logger.info(f"续传 {os.path.basename(file_path)}: 已完成 {len(chunks) - len(pending)}/{len(chunks)} 块")
+        else:
+            self.logger.info(f"开始分块上传 {os.path.basename(file_path)}: {len(chunks)} 块 -> {remote_path}")
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_chunks, thread_name_prefix='chunk-upload') as executor:
+            futures = {executor.submit(self._upload_chunk_with_retry, file_path, parts_dir, chunk): chunk
+                       for chunk in pending}
+            for future in as_completed(futures):
+                if future.result():
+                    done_bytes += futures[future].size
+                    if on_progress is not None:
+                        on_progress(done_bytes, stat.st_size)
+                else:
+                    failed += 1
+        if failed:
+            return False, f"{failed}/{len(chunks)} 个分块上传失败"
+
+        try:
+            current = os.stat(file_path)
+        except OSError:
+            return False, "源文件不存在"
+        if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            # 下次上传时任务按新的大小和 mtime 重建
+            return False, "源文件在上传过程中被修改"
+
+        success, error_message = self._assemble(parts_dir, remote_path, len(chunks), stat.st_size)
+        if success and verify is not None:
+            success, error_message = self._verify_and_repair(file_path, remote_path, parts_dir, chunks, verify)
+        if success:
+            self.db.finish_upload_task(file_path)
+            self.logger.info(f"分块上传完成: {remote_path}")
+        return success, error_message
+
+    def _verify_and_repair(self, file_path: str, remote_path: str, parts_dir: str, chunks: List[UploadChunk],
+                           verify: Callable[[], Optional[List[Tuple[int, int]]]]) -> Tuple[bool, str]:
+        """校验组装后的远端文件，只重传与不一致范围重叠的分块并原位写回
+
+        Returns:
+            tuple: (是否成功, 错误信息)；失败时保留上传任务，不一致的分块为 pending / failed
+        """
+        ranges = verify()
+        if ranges is None:
+            return False, "远端分块校验失败"
+        if not ranges:
+            return True, ""
+
+        bad = [chunk for chunk in chunks
+               if any(offset < chunk.offset + chunk.size and chunk.offset < offset + length
+                      for offset, length in ranges)]
+        for chunk in bad:
+            self.db.update_upload_chunk(file_path, chunk.index, 'pending')
+        self.logger.warning(f"远端文件与分块指纹不一致，重传 {len(bad)}/{len(chunks)} 个分块: {remote_path}")
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_chunks, thread_name_prefix='chunk-upload') as executor:
+            results = list(executor.map(lambda chunk: self._upload_chunk_with_retry(file_path, parts_dir, chunk), bad))
+        if not all(results):
+            return False, f"{results.count(False)}/{len(bad)} 个重传分块上传失败"
+
+        command = REMOTE_PATCH_COMMAND.format(target=shlex.quote(remote_path), parts=shlex.quote(parts_dir),
+                                              indexes=' '.join(str(chunk.index) for chunk in bad), bs=self.chunk_size)
+        size = sum(chunk.size for chunk in bad)
+        try:
+            result = self.pool.run(command, timeout=60 + size / MIN_THROUGHPUT_BYTES)
+        except subprocess.TimeoutExpired:
+            return False, "远端写回分块超时"
+        if result.returncode != 0:
+            return False, f"远端写回分块失败 (返回码 {result.returncode}): {result.stderr.strip()[-500:]}"
+
+        if verify() != []:
+            return False, "远端分块校验不一致"
+        return True, ""
+
+    def _list_remote_parts(self, parts_dir: str) -> Optional[Dict[int, int]]:
+        """列出远端已有分块
+
+        Returns:
+            Dict[int, int]: 分块序号 -> 大小，SSH 失败返回 None
+        """
+        try:
+            result = self.pool.run(REMOTE_LIST_COMMAND.format(parts=shlex.quote(parts_dir)), timeout=60)
+        except subprocess.TimeoutExpired:
+            return None
+        if result.returncode != 0:
+            self.logger.error(f"列出远端分块失败: {result.stderr.strip()}")
+            return None
+
+        sizes = {}
+        for line in result.stdout.splitlines():
+            size, _, name = line.strip().partition(' ')
+            if name.endswith('.part') and size.isdigit() and name[:-len('.part')].isdigit():
+                sizes[int(name[:-len('.part')])] = int(size)
+        return sizes
+
+    def _upload_chunk_with_retry(self, file_path: str, parts_dir: str, chunk: UploadChunk) -> bool:
+        """上传一个分块，失败时按配置重试，并记录分块状态"""
+        for attempt in range(self.retry_attempts + 1):
+            if attempt:
+                time.sleep(self.retry_delay)
+            success, result = self._upload_chunk(file_path, parts_dir, chunk)
+            if success:
+                self.db.update_upload_chunk(file_path, chunk.index, 'completed', result)
+                return True
+            self.db.update_upload_chunk(file_path, chunk.index, 'failed')
+            self.logger.warning(f"分块 {chunk.index} 上传失败 (第 {attempt + 1} 次): {result}")
+        return False
+
+    def _upload_chunk(self, file_path: str, parts_dir: str, chunk: UploadChunk) -> Tuple[bool, str]:
+        """通过一个 SSH 会话上传一个分块
+
+        Returns:
+            tuple: (是否成功, 成功时为摘要、失败时为错误信息)
+        """
+        part = posixpath.join(parts_dir, self._part_name(chunk.index))
+        command = REMOTE_CHUNK_COMMAND.format(parts=shlex.quote(parts_dir), tmp=shlex.quote(part + '.tmp'),
+                                              part=shlex.quote(part), digest=REMOTE_DIGEST_COMMANDS[self.algorithm])
+        digest = new_digest(self.algorithm)
+
+        with tempfile.TemporaryFile() as stderr_file:
+            process = self.pool.popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr_file)
+            # 远端无响应时写入会一直阻塞，超时后结束进程
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                process.kill()
+
+            watchdog = threading.Timer(60 + chunk.size / MIN_THROUGHPUT_BYTES, on_timeout)
+            watchdog.start()
+            try:
+                write_error = self._write_chunk(process, file_path, chunk, digest)
+                stdout, _ = process.communicate()
+            finally:
+                watchdog.cancel()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+
+        if timed_out.is_set():
+            return False, "分块上传超时"
+        if write_error:
+            return False, write_error
+        if process.returncode != 0:
+            return False, f"远端写入失败 (返回码 {process.returncode}): {stderr[-500:]}"
+        remote_digest = stdout.decode('utf-8', errors='replace').split(' ', 1)[0].lstrip('\\')
+        if remote_digest != digest.hexdigest():
+            return False, "远端校验和不一致"
+        return True, remote_digest
+
+    def _write_chunk(self, process: subprocess.Popen, file_path: str, chunk: UploadChunk, digest) -> str:
+        """把分块内容写入远端进程，同时计算摘要
+
+        Returns:
+            str: 写入中断时的错误信息，正常结束为空字符串
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                f.seek(chunk.offset)
+                remaining = chunk.size
+                while remaining > 0:
+                    data = f.read(min(DEFAULT_COPY_BUFFER, remaining))
+                    if not data:
+                        raise OSError("源文件被截断")
+                    digest.update(data)
+                    if self.limiter is not None:
+                        self.limiter.consume(len(data))
+                    process.stdin.write(data)
+                    remaining -= len(data)
+            return ""
+        except OSError as e:
+            # 不完整的分块停留在 .tmp 文件中，不会被当作已完成分块
+            process.kill()
+            return f"分块写入中断: {e}"
+
+    def _assemble(self, parts_dir: str, remote_path: str, count: int, size: int) -> Tuple[bool, str]:
+        """在远端按序拼接分块为目标文件
+
+        Returns:
+            tuple: (是否成功, 错误信息)
+        """
+        remote_dir, name = posixpath.split(remote_path)
+        tmp = posixpath.join(remote_dir, f"{self.temp_prefix}{name}.assembling")
+        command = REMOTE_ASSEMBLE_COMMAND.format(parts=shlex.quote(parts_dir), tmp=shlex.quote(tmp),
+                                                 count=count, size=size, target=shlex.quote(remote_path))
+        try:
+            result = self.pool.run(command, timeout=60 + size / MIN_THROUGHPUT_BYTES)
+        except subprocess.TimeoutExpired:
+            return False, "远端组装超时"
+        if result.returncode != 0:
+            self.logger.error(f"远端组装失败: {remote_path}, {result.stderr.strip()[-500:]}")
+            return False, f"远端组装失败 (返回码 {result.returncode}): {result.stderr.strip()[-500:]}"
+        return True, ""
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟删除队列 - SQLite 持久化的待删除任务表
+
+功能说明：
+1. 待删除任务保存在按 scheduled_time 建索引的表中，安排删除只追加一行，
+   不再整体重写 JSON 文件
+2. "计划时间早于 T 的任务" 通过索引范围查询获得，无需扫描全部任务
+3. 一轮处理的结果（删除已完成任务、更新重试任务）在一个事务中提交
+4. 一次性导入旧的 pending_deletes.json：导入的任务和导入记录在同一个事务中提交，
+   已导入的文件不会重复导入，源文件保持不变
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+
+@dataclass
+class DeleteTask:
+    """删除任务数据类"""
+    local_file_path: str          # 本地文件路径
+    remote_file_path: str         # 远程文件路径
+    local_checksum: str           # 本地文件校验和
+    scheduled_time: float         # 计划删除时间（时间戳）
+    retry_count: int = 0          # 重试次数
+    max_retries: int = 3          # 最大重试次数
+    created_time: float = None    # 创建时间
+    task_id: Optional[int] = None  # 队列中的记录ID
+
+    def __post_init__(self):
+        if self.created_time is None:
+            self.created_time = time.time()
+
+    def is_ready_for_deletion(self) -> bool:
+        """检查是否可以执行删除"""
+        return time.time() >= self.scheduled_time
+
+    def should_retry(self) -> bool:
+        """检查是否应该重试"""
+        return self.retry_count < self.max_retries
+
+    def increment_retry(self):
+        """增加重试次数"""
+        self.retry_count += 1
+
+
+class DeleteQueue:
+    """延迟删除队列（SQLite）"""
+
+    TASK_COLUMNS = """id, local_file_path, remote_file_path, local_checksum, scheduled_time,
+                      retry_count, max_retries, created_time"""
+
+    def __init__(self, db_path: str):
+        """初始化删除队列
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('DeleteQueue')
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30.0)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pending_deletes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                local_file_path TEXT NOT NULL,
+                remote_file_path TEXT NOT NULL,
+                local_checksum TEXT DEFAULT '',
+                scheduled_time REAL NOT NULL,
+                retry_count INTEGER DEFAULT 0,
+                max_retries INTEGER DEFAULT 3,
+                created_time REAL NOT NULL
+            )
+        """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pending_deletes_scheduled ON pending_deletes(scheduled_time)")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS queue_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self.connection.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            if self.connection:
+                self.connection.close()
+                self.connection = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """当前数据库连接，队列已关闭时抛出 sqlite3.ProgrammingError（由各方法按数据库错误处理）"""
+        if not self.connection:
+            raise sqlite3.ProgrammingError("删除队列已关闭")
+        return self.connection
+
+    @staticmethod
+    def _row_to_task(row: sqlite3.Row) -> DeleteTask:
+        return DeleteTask(
+            local_file_path=row['local_file_path'],
+            remote_file_path=row['remote_file_path'],
+            local_checksum=row['local_checksum'] or "",
+            scheduled_time=row['scheduled_time'],
+            retry_count=row['retry_count'],
+            max_retries=row['max_retries'],
+            created_time=row['created_time'],
+            task_id=row['id']
+        )
+
+    @staticmethod
+    def _task_values(task: DeleteTask) -> tuple:
+        return (task.local_file_path, task.remote_file_path, task.local_checksum or "",
+                task.scheduled_time, task.retry_count, task.max_retries, task.created_time)
+
+    def add(self, task: DeleteTask) -> bool:
+        """追加一个删除任务（成功后设置 task.task_id）
+
+        Returns:
+            是否成功
+        """
+        try:
+            with self.lock:
+                cursor = self._db.execute("""
+                    INSERT INTO pending_deletes (local_file_path, remote_file_path, local_checksum,
+                                                 scheduled_time, retry_count, max_retries, created_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, self._task_values(task))
+                self._db.commit()
+                task.task_id = cursor.lastrowid
+                return True
+        except sqlite3.Error as e:
+            self.logger.error(f"添加删除任务失败: {e}")
+            return False
+
+    def add_many(self, tasks: Iterable[DeleteTask]) -> int:
+        """在一个事务中追加多个删除任务
+
+        Returns:
+            追加的任务数量，失败返回-1
+        """
+        rows = [self._task_values(task) for task in tasks]
+        if not rows:
+            return 0
+        try:
+            with self.lock:
+                self._db.executemany("""
+                    INSERT INTO pending_deletes (local_file_path, remote_file_path, local_checksum,
+                                                 scheduled_time, retry_count, max_retries, created_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                self._db.commit()
+                return len(rows)
+        except sqlite3.Error as e:
+            self.logger.error(f"批量添加删除任务失败: {e}")
+            return -1
+
+    def get_by_ids(self, task_ids: List[int]) -> List[DeleteTask]:
+        """按任务ID获取任务（已移除的ID被忽略，结果按计划时间排序）"""
+        tasks = []
+        try:
+            with self.lock:
+                for start in range(0, len(task_ids), 500):
+                    chunk = task_ids[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    tasks.extend(self._row_to_task(row) for row in self._db.execute(
+                        f"SELECT {self.TASK_COLUMNS} FROM pending_deletes WHERE id IN ({placeholders})", chunk))
+        except sqlite3.Error as e:
+            self.logger.error(f"查询删除任务失败: {e}")
+        tasks.sort(key=lambda task: task.scheduled_time)
+        return tasks
+
+    def schedule_entries(self) -> List[Tuple[float, int]]:
+        """全部任务的 (计划时间, 任务ID)，用于重建内存调度堆"""
+        try:
+            with self.lock:
+                return [(row[0], row[1]) for row in self._db.execute(
+                    "SELECT scheduled_time, id FROM pending_deletes")]
+        except sqlite3.Error as e:
+            self.logger.error(f"查询删除任务计划失败: {e}")
+            return []
+
+    def all_tasks(self) -> List[DeleteTask]:
+        """获取全部任务（按计划时间排序）"""
+        try:
+            with self.lock:
+                return [self._row_to_task(row) for row in self._db.execute(
+                    f"SELECT {self.TASK_COLUMNS} FROM pending_deletes ORDER BY scheduled_time")]
+        except sqlite3.Error as e:
+            self.logger.error(f"查询删除任务失败: {e}")
+            return []
+
+    def count(self) -> int:
+        """任务总数（查询失败返回0）"""
+        try:
+            with self.lock:
+                return self._db.execute("SELECT COUNT(*) FROM pending_deletes").fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.error(f"统计删除任务失败: {e}")
+            return 0
+
+    def count_ready(self, now: float = None) -> int:
+        """到期任务数（查询失败返回0）"""
+        now = time.time() if now is None else now
+        try:
+            with self.lock:
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM pending_deletes WHERE scheduled_time <= ?", (now,)).fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.error(f"统计到期删除任务失败: {e}")
+            return 0
+
+    def next_scheduled_time(self) -> Optional[float]:
+        """最早的计划删除时间，队列为空或查询失败返回None"""
+        try:
+            with self.lock:
+                return self._db.execute("SELECT MIN(scheduled_time) FROM pending_deletes").fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.error(f"查询最早删除任务失败: {e}")
+            return None
+
+    def apply_results(self, completed_ids: Iterable[int], retried: Iterable[DeleteTask] = ()) -> bool:
+        """在一个事务中提交一轮处理结果
+
+        Args:
+            completed_ids: 已完成（删除成功或最终失败）的任务ID，从队列中移除
+            retried: 需要重试的任务（写回 retry_count 和新的 scheduled_time）
+
+        Returns:
+            是否成功
+        """
+        completed = [(task_id,) for task_id in completed_ids]
+        retries = [(task.retry_count, task.scheduled_time, task.task_id) for task in retried]
+        if not completed and not retries:
+            return True
+        try:
+            with self.lock:
+                try:
+                    self._db.executemany("DELETE FROM pending_deletes WHERE id = ?", completed)
+                    self._db.executemany(
+                        "UPDATE pending_deletes SET retry_count = ?, scheduled_time = ? WHERE id = ?", retries)
+                    self._db.commit()
+                    return True
+                except sqlite3.Error:
+                    self._db.rollback()
+                    raise
+        except sqlite3.Error as e:
+            self.logger.error(f"提交删除任务处理结果失败: {e}")
+            return False
+
+    def remove(self, task_ids: Iterable[int]) -> bool:
+        """移除任务"""
+        return self.apply_results(task_ids)
+
+    def migrate_json(self, json_path: str) -> int:
+        """一次性导入旧的 JSON 待删除任务文件
+
+        导入记录（queue_meta 中的一行）与任务在同一个事务中提交，
+        同一文件只导入一次；源文件保持不变。
+
+        Args:
+            json_path: pending_deletes.json 路径
+
+        Returns:
+            导入的任务数量，文件不存在或已导入返回0，失败返回-1
+        """
+        if not os.path.exists(json_path):
+            return 0
+        meta_key = 'migrated:' + os.path.abspath(json_path)
+        try:
+            with self.lock:
+                if self._db.execute("SELECT 1 FROM queue_meta WHERE key = ?", (meta_key,)).fetchone():
+                    return 0
+        except sqlite3.Error as e:
+            self.logger.error(f"查询导入记录失败: {e}")
+            return -1
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            fields = set(DeleteTask.__dataclass_fields__) - {'task_id'}
+            tasks = [DeleteTask(**{key: value for key, value in item.items() if key in fields})
+                     for item in data]
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.error(f"读取待删除任务文件失败: {json_path}, 错误: {e}")
+            return -1
+
+        try:
+            with self.lock:
+                try:
+                    self._db.executemany("""
+                        INSERT INTO pending_deletes (local_file_path, remote_file_path, local_checksum,
+                                                     scheduled_time, retry_count, max_retries, created_time)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, [self._task_values(task) for task in tasks])
+                    self._db.execute("INSERT INTO queue_meta (key, value) VALUES (?, ?)",
+                                     (meta_key, str(time.time())))
+                    self._db.commit()
+                except sqlite3.Error:
+                    self._db.rollback()
+                    raise
+        except sqlite3.Error as e:
+            self.logger.error(f"导入待删除任务失败: {json_path}, 错误: {e}")
+            return -1
+        self.logger.info(f"已从 {json_path} 导入 {len(tasks)} 个待删除任务")
+        return len(tasks)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件过滤引擎 - 预编译的文件名过滤规则
+
+功能说明：
+1. 配置加载时将全部排除模式编译为一个组合正则表达式，
+   每个文件名只需一次正则匹配，不再逐个模式调用 fnmatch
+2. 过滤策略（media_only / extended / all_files / custom）的扩展名使用 frozenset 查找
+3. 目录级剪枝：匹配目录排除模式的子树（如 .Trash、.tmp_*）在扫描时不再进入
+4. 排除语义与原实现一致：文件名匹配通配符模式，或以模式去掉末尾 * 后的前缀开头
+5. 已压缩格式的扩展名表，供传输压缩策略使用
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import re
+import fnmatch
+from typing import Iterable, Optional, Pattern
+
+# 预定义的扩展名集合 - 统一使用小写，确保不区分大小写
+MEDIA_EXTENSIONS = frozenset({
+    '.mp4', '.mov', '.jpg', '.jpeg', '.png', '.dng'
+})
+
+EXTENDED_EXTENSIONS = frozenset({
+    # 视频文件
+    '.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm', '.m4v',
+    # 图片文件
+    '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif', '.webp',
+    # RAW格式
+    '.dng', '.raw', '.cr2', '.nef', '.arw', '.orf', '.rw2',
+    # 文档文件
+    '.txt', '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    # 数据文件
+    '.csv', '.json', '.xml', '.log', '.las', '.laz',
+    # 压缩文件
+    '.zip', '.rar', '.7z', '.tar', '.gz',
+    # 其他常见格式
+    '.kml', '.kmz', '.gpx', '.shp'
+})
+
+# 已压缩的格式（EXTENDED_EXTENSIONS 的子集）：传输时再压缩几乎不减少字节数
+COMPRESSED_EXTENSIONS = frozenset({
+    # 视频文件
+    '.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm', '.m4v',
+    # 图片文件
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    # RAW格式（相机内无损压缩）
+    '.dng', '.cr2', '.nef', '.arw', '.orf', '.rw2',
+    # 文档文件（ZIP 容器）
+    '.pdf', '.docx', '.xlsx', '.pptx',
+    # 数据和压缩文件
+    '.laz', '.kmz', '.zip', '.rar', '.7z', '.gz'
+})
+
+DEFAULT_EXCLUDE_PATTERNS = ('.*', '.tmp_*', '*.tmp', '.DS_Store', 'Thumbs.db', 'desktop.ini')
+
+DEFAULT_EXCLUDE_DIR_PATTERNS = ('.Trash*', '.tmp_*', '@eaDir', '$RECYCLE.BIN', 'System Volume Information')
+
+FILTER_STRATEGIES = ('media_only', 'extended', 'all_files', 'custom')
+
+
+def compile_exclude_patterns(patterns: Iterable[str]) -> Optional[Pattern]:
+    """将排除模式编译为一个组合正则表达式
+
+    每个模式对应两个分支：通配符整体匹配，以及去掉末尾 * 后的前缀匹配。
+
+    Args:
+        patterns: 排除模式列表
+
+    Returns:
+        编译后的正则表达式（使用 match），没有模式时返回None
+    """
+    branches = []
+    for pattern in patterns:
+        branches.append(fnmatch.translate(pattern))
+        branches.append('(?s:' + re.escape(pattern.rstrip('*')) + ')')
+    if not branches:
+        return None
+    return re.compile('|'.join(f'(?:{branch})' for branch in branches))
+
+
+class FileFilter:
+    """预编译的文件过滤器"""
+
+    def __init__(self,
+                 strategy: str = 'extended',
+                 custom_extensions: Iterable[str] = (),
+                 exclude_patterns: Iterable[str] = DEFAULT_EXCLUDE_PATTERNS,
+                 exclude_dir_patterns: Iterable[str] = DEFAULT_EXCLUDE_DIR_PATTERNS):
+        """初始化并编译过滤规则
+
+        Args:
+            strategy: 过滤策略（media_only / extended / all_files / custom），未知策略按 extended 处理
+            custom_extensions: custom 策略的扩展名（不区分大小写）
+            exclude_patterns: 文件名排除模式
+            exclude_dir_patterns: 目录名排除模式（匹配的子树不进入）
+        """
+        self.strategy = strategy
+        self.custom_extensions = frozenset(ext.lower() for ext in custom_extensions)
+        self.exclude_patterns = tuple(exclude_patterns)
+        self.exclude_dir_patterns = tuple(exclude_dir_patterns)
+
+        self._exclude_match = self._bound_match(compile_exclude_patterns(self.exclude_patterns))
+        self._exclude_dir_match = self._bound_match(compile_exclude_patterns(self.exclude_dir_patterns))
+
+        # all_files 不检查扩展名；其余策略决定扩展名集合以及是否接受无扩展名文件
+        if strategy == 'all_files':
+            self._extensions = None
+            self._allow_no_extension = True
+        elif strategy == 'media_only':
+            self._extensions = MEDIA_EXTENSIONS
+            self._allow_no_extension = False
+        elif strategy == 'custom':
+            self._extensions = self.custom_extensions
+            self._allow_no_extension = True
+        else:
+            # 默认使用扩展策略
+            self._extensions = EXTENDED_EXTENSIONS
+            self._allow_no_extension = True
+
+    @staticmethod
+    def _bound_match(regex: Optional[Pattern]):
+        """返回正则的 match 方法，没有模式时返回始终不匹配的函数"""
+        if regex is None:
+            return lambda name: None
+        return regex.match
+
+    def should_process(self, filename: str) -> bool:
+        """判断文件是否应该处理
+
+        Args:
+            filename: 文件名（不含目录）
+
+        Returns:
+            bool: 应该处理返回True
+        """
+        if self._exclude_match(filename):
+            return False
+
+        extensions = self._extensions
+        if extensions is None:
+            return True
+
+        file_ext = os.path.splitext(filename)[1]
+        if not file_ext:
+            return self._allow_no_extension
+        return file_ext.lower() in extensions
+
+    def should_descend(self, dirname: str) -> bool:
+        """判断扫描时是否进入该目录
+
+        Args:
+            dirname: 目录名（不含上级路径）
+
+        Returns:
+            bool: 应该进入返回True
+        """
+        return not self._exclude_dir_match(dirname)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件哈希服务 - 大块读取、单次读取多摘要、线程池并行
+
+功能说明：
+1. 使用 1~8MB 的 readinto 缓冲区（每个线程复用同一个 bytearray/memoryview），
+   替代 4KB 小块读取
+2. 小于上限的文件可使用 mmap，直接把映射内存交给摘要算法
+3. 一次读取同时计算多个摘要（如 sha256 和 md5），避免重复读取大文件
+4. 线程池并行计算多个文件（hashlib 在大块数据上释放 GIL），充分利用多核和 NVMe 带宽
+5. 进程内共享一个哈希服务实例，供守护进程和安全删除管理共同使用
+6. 支持 hashlib 的全部算法（sha256、md5、blake2b 等），安装 xxhash 时支持 xxh3
+7. 按字节范围计算摘要，供大文件分块（Merkle）哈希在线程池中并行使用
+8. 一次顺序读取同时得到分块摘要和整文件摘要（块摘要在线程池中与读取重叠计算）
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import mmap
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    xxhash = None
+    XXHASH_AVAILABLE = False
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+MIN_BUFFER_SIZE = 1024 * 1024
+MAX_BUFFER_SIZE = 8 * 1024 * 1024
+DEFAULT_MMAP_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_ALGORITHMS = ('sha256',)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def new_digest(algorithm: str):
+    """创建摘要对象（hashlib 支持的算法名，或 xxh3）
+
+    Raises:
+        ValueError: 不支持的算法（xxh3 需要安装 xxhash）
+    """
+    if algorithm == 'xxh3':
+        if not XXHASH_AVAILABLE:
+            raise ValueError("xxh3 需要安装 xxhash 模块")
+        return xxhash.xxh3_64()
+    return hashlib.new(algorithm)
+
+
+def supported_algorithms(algorithms: Iterable[str]) -> tuple:
+    """过滤出当前环境可用的摘要算法（保持顺序、去重）"""
+    result = []
+    for algorithm in algorithms:
+        algorithm = algorithm.lower()
+        if algorithm in result:
+            continue
+        if algorithm == 'xxh3':
+            if XXHASH_AVAILABLE:
+                result.append(algorithm)
+        elif algorithm in hashlib.algorithms_available:
+            result.append(algorithm)
+    return tuple(result)
+
+
+class FileHasher:
+    """文件哈希服务"""
+
+    def __init__(self,
+                 max_workers: int = 0,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 mmap_max_bytes: int = DEFAULT_MMAP_MAX_BYTES):
+        """初始化哈希服务
+
+        Args:
+            max_workers: 并行计算的线程数，<=0 表示按 CPU 核数自动选择（最多 8）
+            buffer_size: 读取缓冲区大小（字节），限制在 1~8MB
+            mmap_max_bytes: 不超过该大小的文件使用 mmap，<=0 表示不使用
+        """
+        if max_workers <= 0:
+            max_workers = min(8, os.cpu_count() or 1)
+        self.max_workers = max_workers
+        self.buffer_size = min(MAX_BUFFER_SIZE, max(MIN_BUFFER_SIZE, int(buffer_size)))
+        self.mmap_max_bytes = mmap_max_bytes
+        self.logger = logging.getLogger('FileHasher')
+
+        self._local = threading.local()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _buffer(self) -> memoryview:
+        """当前线程复用的读取缓冲区"""
+        view = getattr(self._local, 'view', None)
+        if view is None or len(view) != self.buffer_size:
+            view = memoryview(bytearray(self.buffer_size))
+            self._local.view = view
+        return view
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='hasher',
+                                                    initializer=self._mark_worker)
+            return self._executor
+
+    def _mark_worker(self):
+        """标记线程池工作线程（工作线程内的嵌套 map 串行执行，避免占满线程池后互相等待）"""
+        self._local.in_pool = True
+
+    def hash_file(self, file_path: str, algorithms: Sequence[str] = DEFAULT_ALGORITHMS) -> Dict[str, str]:
+        """一次读取计算文件的多个摘要（在调用线程中执行）
+
+        Args:
+            file_path: 文件路径
+            algorithms: 摘要算法列表，如 ('sha256', 'md5')
+
+        Returns:
+            Dict[str, str]: 算法 -> 十六进制摘要
+
+        Raises:
+            OSError: 文件读取失败
+        """
+        digests = [new_digest(algorithm) for algorithm in algorithms]
+
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if 0 < file_size <= self.mmap_max_bytes:
+                self._update_from_mmap(f, file_size, digests)
+            else:
+                self._update_from_reads(f, digests)
+
+        return {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, digests)}
+
+    def hash_range(self, file_path: str, offset: int, length: int, algorithm: str = 'sha256') -> str:
+        """计算文件指定字节范围的摘要（用于分块哈希，各线程可并行读取同一文件的不同范围）
+
+        Args:
+            file_path: 文件路径
+            offset: 起始偏移
+            length: 最大长度（超出文件末尾的部分忽略）
+            algorithm: 摘要算法
+
+        Returns:
+            str: 十六进制摘要
+
+        Raises:
+            OSError: 文件读取失败
+        """
+        digest = new_digest(algorithm)
+        view = self._buffer()
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                n = f.readinto(view[:min(remaining, len(view))])
+                if not n:
+                    break
+                digest.update(view[:n])
+                remaining -= n
+        return digest.hexdigest()
+
+    def hash_chunks(self, file_path: str, chunk_size: int, chunk_algorithm: str = 'sha256',
+                    algorithms: Sequence[str] = (), file_size: int = None) -> Tuple[List[str], Dict[str, str]]:
+        """一次顺序读取计算每块的摘要和整个文件的摘要
+
+        整文件摘要在调用线程中按顺序更新，块摘要提交到线程池与后续读取重叠计算；
+        在途的块不超过线程数加一，内存占用约为 (线程数 + 1) * 块大小。
+
+        Args:
+            file_path: 文件路径
+            chunk_size: 块大小（字节）
+            chunk_algorithm: 块摘要算法
+            algorithms: 整文件摘要算法列表，如 ('sha256', 'md5')
+            file_size: 只读取前 file_size 字节，None 时读到文件末尾
+
+        Returns:
+            tuple: (按顺序排列的块摘要, 算法 -> 整文件摘要)
+
+        Raises:
+            OSError: 文件读取失败
+        """
+        digests = [new_digest(algorithm) for algorithm in algorithms]
+        parallel = self.max_workers > 1 and not getattr(self._local, 'in_pool', False)
+        chunk_hashes: List[str] = []
+        in_flight = deque()
+
+        def hash_chunk(data: bytes) -> str:
+            digest = new_digest(chunk_algorithm)
+            digest.update(data)
+            return digest.hexdigest()
+
+        with open(file_path, 'rb') as f:
+            remaining = file_size if file_size is not None else os.fstat(f.fileno()).st_size
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                for digest in digests:
+                    digest.update(data)
+                if parallel:
+                    in_flight.append(self._get_executor().submit(hash_chunk, data))
+                    if len(in_flight) > self.max_workers:
+                        chunk_hashes.append(in_flight.popleft().result())
+                else:
+                    chunk_hashes.append(hash_chunk(data))
+        chunk_hashes.extend(future.result() for future in in_flight)
+
+        return chunk_hashes, {algorithm: digest.hexdigest() for algorithm, digest in zip(algorithms, digests)}
+
+    def _update_from_reads(self, f, digests: list):
+        """使用复用缓冲区 readinto 读取并更新摘要"""
+        view = self._buffer()
+        readinto = f.readinto
+        while True:
+            n = readinto(view)
+            if not n:
+                break
+            chunk = view[:n]
+            for digest in digests:
+                digest.update(chunk)
+
+    def _update_from_mmap(self, f, file_size: int, digests: list):
+        """通过 mmap 更新摘要，按缓冲区大小分段以便释放 GIL 并限制单次映射页访问"""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, file_size, self.buffer_size):
+                    chunk = view[offset:offset + self.buffer_size]
+                    for digest in digests:
+                        digest.update(chunk)
+                    chunk.release()
+            finally:
+                view.release()
+
+    def submit(self, file_path: str, algorithms: Sequence[str] = DEFAULT_ALGORITHMS) -> Future:
+        """提交到线程池异步计算摘要
+
+        Returns:
+            Future: 结果为 Dict[str, str]
+        """
+        return self._get_executor().submit(self.hash_file, file_path, algorithms)
+
+    def map(self, func: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """在哈希线程池中并行执行任意哈希函数，按输入顺序返回结果
+
+        Args:
+            func: 对单个输入计算哈希的函数
+            items: 输入列表
+
+        Returns:
+            Iterator[R]: 结果迭代器
+        """
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1 or getattr(self._local, 'in_pool', False):
+            return iter([func(item) for item in items])
+        return self._get_executor().map(func, items)
+
+    def hash_files(self, file_paths: Iterable[str],
+                   algorithms: Sequence[str] = DEFAULT_ALGORITHMS) -> Iterator[tuple]:
+        """并行计算多个文件的摘要
+
+        Args:
+            file_paths: 文件路径列表
+            algorithms: 摘要算法列表
+
+        Returns:
+            Iterator[tuple]: 按输入顺序返回 (文件路径, 摘要字典或None, 错误信息)
+        """
+        def hash_one(file_path: str) -> tuple:
+            try:
+                return file_path, self.hash_file(file_path, algorithms), ''
+            except OSError as e:
+                self.logger.error(f"计算文件哈希失败: {file_path}, 错误: {e}")
+                return file_path, None, str(e)
+
+        return self.map(hash_one, file_paths)
+
+    def close(self):
+        """关闭线程池"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_shared_hasher: Optional[FileHasher] = None
+_shared_lock = threading.Lock()
+
+
+def get_file_hasher(**kwargs) -> FileHasher:
+    """获取进程内共享的哈希服务
+
+    首次创建时使用传入的参数（FileHasher 的构造参数）。
+    """
+    global _shared_hasher
+    with _shared_lock:
+        if _shared_hasher is None:
+            _shared_hasher = FileHasher(**kwargs)
+        return _shared_hasher
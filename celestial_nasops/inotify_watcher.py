@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于 Linux inotify 的媒体目录监听器
+
+功能说明：
+1. 通过 ctypes 直接调用 libc 的 inotify 接口，无需额外依赖
+2. 递归监听媒体目录，新建子目录时自动追加监听
+3. 仅上报写入完成（IN_CLOSE_WRITE）或移入（IN_MOVED_TO）的文件
+4. 监听数量耗尽（ENOSPC）或事件队列溢出时通知调用方回退/重新全量扫描
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+from typing import Callable, Dict, List, Optional
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_BUFFER_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    """递归 inotify 目录监听器"""
+
+    def __init__(self, root_directory: str, logger: logging.Logger = None,
+                 directory_filter: Callable[[str], bool] = None):
+        """初始化监听器
+
+        Args:
+            root_directory: 需要递归监听的根目录
+            logger: 日志记录器
+            directory_filter: 按目录名判断是否监听该子目录，None 表示全部监听
+        """
+        self.root_directory = root_directory
+        self.directory_filter = directory_filter or (lambda name: True)
+        self.logger = logger or logging.getLogger('InotifyWatcher')
+
+        self._libc = None
+        self._fd = -1
+        self._watches: Dict[int, str] = {}
+
+        # 监听数量耗尽，调用方应回退到轮询模式
+        self.exhausted = False
+        # 事件可能丢失，调用方应执行一次全量扫描
+        self.needs_rescan = False
+
+    @property
+    def active(self) -> bool:
+        """监听器是否可用"""
+        return self._fd >= 0 and not self.exhausted
+
+    def start(self) -> bool:
+        """初始化 inotify 并递归添加目录监听
+
+        Returns:
+            bool: 启动成功返回True，失败时调用方应使用轮询模式
+        """
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            self.logger.warning("未找到libc，无法启用inotify")
+            return False
+
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            inotify_init1 = self._libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            self.logger.warning(f"当前系统不支持inotify: {e}")
+            return False
+
+        self._fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            self.logger.warning(f"inotify初始化失败: {os.strerror(err)}")
+            return False
+
+        self._add_watch_recursive(self.root_directory)
+        if self.exhausted:
+            self.close()
+            return False
+
+        self.logger.info(f"inotify监听已启动: {self.root_directory}, 监听目录数: {len(self._watches)}")
+        return True
+
+    def close(self):
+        """关闭 inotify 文件描述符"""
+        if self._fd >= 0:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = -1
+        self._watches.clear()
+
+    def _add_watch(self, directory: str) -> bool:
+        """为单个目录添加监听"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                self.exhausted = True
+                self.logger.warning(
+                    f"inotify监听数量已达上限（fs.inotify.max_user_watches），无法监听: {directory}"
+                )
+            else:
+                self.logger.warning(f"添加目录监听失败: {directory}, 错误: {os.strerror(err)}")
+            return False
+
+        self._watches[wd] = directory
+        return True
+
+    def _add_watch_recursive(self, directory: str) -> List[str]:
+        """递归添加监听，并返回监听建立前已存在的文件
+
+        新目录可能在监听建立前就已写入文件，这些文件需要直接上报。
+        """
+        existing_files = []
+        stack = [directory]
+
+        while stack and not self.exhausted:
+            current = stack.pop()
+            if not self._add_watch(current):
+                continue
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.directory_filter(entry.name):
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            existing_files.append(entry.path)
+            except OSError as e:
+                self.logger.warning(f"读取目录失败: {current}, 错误: {e}")
+
+        return existing_files
+
+    def read_events(self, timeout: Optional[float] = None) -> List[str]:
+        """等待并读取文件事件
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            List[str]: 写入完成的文件路径列表（已去重，保持事件顺序）
+        """
+        if self._fd < 0:
+            return []
+
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except InterruptedError:
+            return []
+        if not readable:
+            return []
+
+        completed = {}
+        while True:
+            try:
+                data = os.read(self._fd, _READ_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self._parse_events(data, completed)
+
+        return list(completed)
+
+    def _parse_events(self, data: bytes, completed: Dict[str, None]):
+        """解析 inotify 事件缓冲区"""
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            raw_name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                self.needs_rescan = True
+                self.logger.warning("inotify事件队列溢出，需要全量扫描")
+                continue
+
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None or not raw_name:
+                continue
+            path = os.path.join(directory, os.fsdecode(raw_name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.directory_filter(os.path.basename(path)):
+                    for file_path in self._add_watch_recursive(path):
+                        completed[file_path] = None
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                completed[path] = None
@@ -14,18 +14,19 @@ Media Finding Daemon - 统一同步架构优化方案核心组件
 """
 
 import os
+import re
 import sys
 import time
 import hashlib
 import logging
 import sqlite3
 import json
-import fnmatch
 import shutil
+import tempfile
 import subprocess
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional, Set
+from typing import Iterable, Iterator, List, Dict, NamedTuple, Optional, Set, Union
 from logging.handlers import RotatingFileHandler
 from enum import Enum
 
@@ -34,6 +35,26 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config_manager import ConfigManager
 from media_status_db import MediaStatusDB
+from inotify_watcher import InotifyWatcher
+from transfer_engine import TransferEngine
+from ssh_connection_pool import get_ssh_pool, close_all_pools
+from nas_structure_manager import get_remote_dir_cache
+from file_hasher import get_file_hasher, supported_algorithms
+from chunk_manifest import ChunkManifest, compute_chunk_manifest, verify_remote_chunks
+from safe_delete_manager import SafeDeleteManager
+from transfer_policy import CompressionPolicy, DEFAULT_ENTROPY_THRESHOLD
+from rate_limiter import BandwidthLimiter, BandwidthSchedule
+from stream_uploader import TarStreamUploader, MIN_THROUGHPUT_BYTES
+from chunked_uploader import ChunkedUploader
+from file_filter import (FileFilter, MEDIA_EXTENSIONS, EXTENDED_EXTENSIONS,
+                         DEFAULT_EXCLUDE_PATTERNS, DEFAULT_EXCLUDE_DIR_PATTERNS)
+
+class ScannedFile(NamedTuple):
+    """扫描得到的文件记录（stat 信息来自 os.scandir 的 DirEntry 缓存）"""
+    path: str
+    inode: int
+    size: int
+    mtime_ns: int
 
 class FileStatus(Enum):
     """文件传输状态枚举"""
@@ -45,6 +66,10 @@ class FileStatus(Enum):
 class MediaFindingDaemon:
     """媒体文件发现和传输管理守护进程"""
     
+    # rsync --out-format='%i %n' 中变更项（%i）的固定宽度，以及文件名中的 \#ooo 转义
+    RSYNC_ITEM_WIDTH = 11
+    RSYNC_NAME_ESCAPE = re.compile(rb'\\#([0-7]{3})')
+    
     def __init__(self, config_path: str = None):
         """初始化守护进程
         
@@ -61,9 +86,83 @@ class MediaFindingDaemon:
         self.logger = self._setup_logging()
         
         # 初始化数据库
-        self.db = MediaStatusDB(self.db_path)
+        self.db = MediaStatusDB(self.db_path, read_pool_size=self.db_read_pool_size)
         self.db.connect()
         
+        # 共享的 SSH 复用连接
+        self.ssh_pool = get_ssh_pool(
+            self.nas_ssh_alias,
+            control_dir=self.ssh_control_dir,
+            control_persist=self.ssh_control_persist
+        )
+        
+        # 文件哈希服务（线程池并行、大块读取）
+        self.file_hasher = get_file_hasher(
+            max_workers=self.hash_workers,
+            buffer_size=self.hash_buffer_bytes,
+            mmap_max_bytes=self.hash_mmap_max_bytes
+        )
+        
+        # 远程目录存在性缓存：日期目录每天只确认一次，而不是每个文件都 mkdir -p
+        self.remote_dir_cache = get_remote_dir_cache()
+        self.remote_dir_cache.ttl_seconds = self.dir_cache_ttl
+        
+        # 初始化并发传输引擎
+        self.transfer_engine = TransferEngine(
+            self.db,
+            self._transfer_claimed_file,
+            max_workers=self.max_concurrent_transfers,
+            max_inflight_bytes=self.max_inflight_bytes,
+            lease_seconds=self.claim_lease_seconds,
+            logger=self.logger
+        )
+        
+        # 上传带宽限制：全部并发传输共享一个上限，每个 rsync 进程分得 上限/并发数
+        self.bandwidth_limiter = BandwidthLimiter(
+            BandwidthSchedule(self.bandwidth_limit_mbps, self.bandwidth_schedule),
+            streams=self.max_concurrent_transfers
+        )
+        
+        # tar 流上传后端（transfer.backend 为 tar_stream 时使用）
+        self.stream_uploader = TarStreamUploader(self.ssh_pool, limiter=self.bandwidth_limiter,
+                                                 temp_prefix=self.temp_file_prefix, logger=self.logger)
+        
+        # 大文件分块上传（逐块状态记录在数据库中，超时或崩溃后只重传未完成的分块）
+        self.chunked_uploader = ChunkedUploader(
+            self.ssh_pool,
+            self.db,
+            chunk_size=self.upload_chunk_size,
+            max_concurrent_chunks=self.max_concurrent_chunks,
+            retry_attempts=self.chunk_retry_attempts,
+            retry_delay=self.chunk_retry_delay,
+            temp_prefix=self.temp_chunk_prefix,
+            limiter=self.bandwidth_limiter,
+            logger=self.logger
+        )
+        
+        # 延迟删除管理器（仅在同步后删除本地文件时启用），到期任务在主循环中处理
+        self.delete_manager = None
+        if self.delete_after_sync:
+            self.delete_manager = SafeDeleteManager(
+                nas_host=self.nas_host,
+                nas_username=self.nas_username,
+                delay_minutes=self.safe_delete_delay_minutes,
+                pending_file=self.pending_deletes_file,
+                enable_checksum=self.verify_before_delete,
+                nas_alias=self.nas_ssh_alias,
+                status_db=self.db,
+                queue_db=self.delete_queue_db
+            )
+        
+        # 文件指纹缓存（路径 -> (inode, 大小, mtime_ns)），首次发现时加载
+        self._fingerprints = None
+        
+        # 已登记文件路径集合，每次完整扫描时一次查询刷新，注册新文件时增量更新
+        self._known_paths = None
+        
+        # inotify 监听器（仅 inotify 发现模式下启用）
+        self.watcher = None
+        
         # 运行状态
         self.running = False
         
@@ -77,6 +176,7 @@ class MediaFindingDaemon:
         # 基础配置
         self.media_directory = self.config_manager.get('local_settings.media_directory', '/home/celestial/dev/esdk-test/Edge-SDK/celestial_works/media')
         self.db_path = self.config_manager.get('database.path', '/home/celestial/dev/esdk-test/Edge-SDK/celestial_works/media_status.db')
+        self.db_read_pool_size = self.config_manager.get('database.read_pool_size', MediaStatusDB.DEFAULT_READ_POOL_SIZE)
         
         # 日志配置
         self.log_file_path = self.config_manager.get('logging.media_finding_log', '/home/celestial/dev/esdk-test/Edge-SDK/celestial_nasops/logs/media_finding.log')
@@ -88,44 +188,151 @@ class MediaFindingDaemon:
         # 传输配置
         self.scan_interval = self.config_manager.get('transfer.scan_interval', 30)  # 扫描间隔（秒）
         self.batch_size = self.config_manager.get('transfer.batch_size', 10)  # 批处理大小
+        self.scan_batch_size = self.config_manager.get('transfer.scan_batch_size', 500)  # 扫描后每批注册的文件数
+        
+        # 哈希计算配置
+        self.hash_workers = self.config_manager.get('hashing.max_workers', 0)  # 0 表示按 CPU 核数自动选择
+        self.hash_buffer_bytes = int(self.config_manager.get('hashing.buffer_size_mb', 4) * 1024 * 1024)
+        self.hash_mmap_max_bytes = int(self.config_manager.get('hashing.mmap_max_mb', 256) * 1024 * 1024)
+        self.full_hash_max_bytes = int(self.config_manager.get('hashing.full_hash_max_mb', 100) * 1024 * 1024)
+        # 一次读取同时计算的全部摘要（sha256 始终包含，用作 file_hash）
+        self.hash_algorithms = supported_algorithms(
+            ['sha256'] + list(self.config_manager.get('hashing.algorithms', ['sha256', 'md5'])))
+        # 大文件指纹策略：sampled（头、中、尾采样，默认）或 merkle（分块哈希 + Merkle 根，覆盖全部内容）
+        self.large_file_strategy = self.config_manager.get('hashing.large_file_strategy', 'sampled')
+        chunk_size_mb = self.config_manager.get('hashing.chunk_size_mb',
+                                                self.config_manager.get('dock_transfer_config.chunked_transfer.chunk_size_mb', 10))
+        self.chunk_size = int(chunk_size_mb * 1024 * 1024)
+        self.verify_chunks_after_transfer = self.config_manager.get('hashing.verify_chunks_after_transfer', False)
+        
+        # 发现模式：poll（定时全量扫描）或 inotify（事件驱动 + 低频全量对账）
+        self.discovery_mode = self.config_manager.get('transfer.discovery_mode', 'poll')
+        self.reconcile_interval = self.config_manager.get('transfer.reconcile_interval', 3600)  # 对账扫描间隔（秒）
+        
+        # 并发传输配置
+        self.max_concurrent_transfers = self.config_manager.get('security.max_concurrent_transfers', 1)
+        self.max_inflight_bytes = int(self.config_manager.get('transfer.max_inflight_mb', 512)) * 1024 * 1024
+        
+        # 小文件聚合：不超过阈值的文件在常规传输前以一个 tar 流上传到各自的日期目录
+        self.small_file_aggregation = self.config_manager.get('transfer.small_file_aggregation', False)
+        self.small_file_max_bytes = int(self.config_manager.get('transfer.small_file_max_kb', 1024) * 1024)
+        self.small_file_batch_max = self.config_manager.get('transfer.small_file_batch_max', 2000)
+        
+        # 大文件分块上传：不小于阈值的文件分块并发上传，支持断点续传
+        self.chunked_upload = self.config_manager.get('transfer.chunked_upload', False)
+        self.chunked_upload_min_bytes = int(self.config_manager.get('transfer.chunked_upload_min_mb', 512) * 1024 * 1024)
+        self.upload_chunk_size = int(self.config_manager.get('dock_transfer_config.chunked_transfer.chunk_size_mb', 10) * 1024 * 1024)
+        self.max_concurrent_chunks = self.config_manager.get('dock_transfer_config.chunked_transfer.max_concurrent_chunks', 3)
+        self.chunk_retry_attempts = self.config_manager.get('dock_transfer_config.chunked_transfer.retry_attempts', 3)
+        self.chunk_retry_delay = self.config_manager.get('dock_transfer_config.chunked_transfer.retry_delay_seconds', 2)
+        self.temp_chunk_prefix = self.config_manager.get('dock_transfer_config.chunked_transfer.temp_chunk_prefix', '.chunk_')
+        
+        # 传输后端：rsync，或 tar_stream（一个 SSH 会话内以 tar 流连续发送、读取时计算校验和）
+        self.transfer_backend = self.config_manager.get('transfer.backend', 'rsync')
+        # 远端临时文件（tar 流解包目录）前缀，校验通过后才移动到最终路径
+        self.temp_file_prefix = self.config_manager.get('sync_settings.temp_file_prefix', '.tmp_')
+        
+        # 传输模式：single（每个文件一次 rsync）或 batch（按目标日期目录分组，每组一次 rsync --files-from）
+        self.transfer_mode = self.config_manager.get('transfer.transfer_mode', 'single')
+        self.rsync_batch_max_files = self.config_manager.get('transfer.rsync_batch_max_files', 1000)
+        self.claim_lease_seconds = self.config_manager.get('transfer.claim_lease_seconds', 1800)
+        self.rsync_mkpath = self.config_manager.get('transfer.rsync_mkpath', False)  # 需要 rsync >= 3.2.3
+        
+        # 上传带宽上限（Mbit/s，0 表示不限速）和分时段上限
+        self.bandwidth_limit_mbps = self.config_manager.get('dock_transfer_config.performance.bandwidth_limit_mbps', 0)
+        self.bandwidth_schedule = self.config_manager.get('dock_transfer_config.performance.bandwidth_schedule', [])
+        
+        # 传输压缩策略：auto（已压缩格式和高熵内容不压缩）、always 或 never，受 enable_compression 总开关控制
+        self.compression_policy = CompressionPolicy(
+            enabled=self.config_manager.get('dock_transfer_config.performance.enable_compression', True),
+            mode=self.config_manager.get('transfer.compression', 'auto'),
+            entropy_threshold=self.config_manager.get('transfer.compression_entropy_threshold', DEFAULT_ENTROPY_THRESHOLD)
+        )
         
         # NAS配置 - 修正配置路径以匹配 unified_config.json 结构
         self.nas_host = self.config_manager.get('nas_settings.host', '192.168.200.103')
         self.nas_username = self.config_manager.get('nas_settings.username', 'edge_sync')
         self.nas_ssh_alias = self.config_manager.get('nas_settings.ssh_alias', 'nas-edge')
         self.nas_destination = self.config_manager.get('nas_settings.base_path', '/volume1/homes/edge_sync/drone_media')
+        
+        # SSH 复用连接配置
+        self.ssh_control_dir = self.config_manager.get('nas_settings.ssh_control_dir', None)
+        self.ssh_control_persist = self.config_manager.get('nas_settings.ssh_control_persist_seconds', 600)
+        self.dir_cache_ttl = self.config_manager.get('nas_settings.dir_cache_ttl_seconds', 86400)
+        
+        # 同步后延迟删除本地文件
+        self.delete_after_sync = self.config_manager.get('sync_settings.delete_after_sync', False)
+        self.safe_delete_delay_minutes = self.config_manager.get('sync_settings.safe_delete_delay_minutes', 30)
+        self.verify_before_delete = self.config_manager.get('sync_settings.verify_remote_before_delete', True)
+        self.pending_deletes_file = self.config_manager.get('sync_settings.pending_deletes_file', None)
+        self.delete_queue_db = self.config_manager.get(
+            'sync_settings.delete_queue_db', os.path.join(os.path.dirname(self.db_path), 'pending_deletes.db'))
     
     def _load_filter_config(self):
-        """加载文件过滤配置"""
-        self.filter_strategy = self.config_manager.get('file_sync.filter_strategy', 'extended')
+        """加载文件过滤配置，并预编译为过滤器"""
+        self._filter_strategy = self.config_manager.get('file_sync.filter_strategy', 'extended')
         # 将自定义扩展名转换为小写，确保不区分大小写
         custom_exts = self.config_manager.get('file_sync.custom_extensions', [])
-        self.custom_extensions = set(ext.lower() for ext in custom_exts)
-        self.exclude_patterns = self.config_manager.get('file_sync.exclude_patterns', [
-            '.*', '.tmp_*', '*.tmp', '.DS_Store', 'Thumbs.db', 'desktop.ini'
-        ])
+        self._custom_extensions = set(ext.lower() for ext in custom_exts)
+        self._exclude_patterns = self.config_manager.get('file_sync.exclude_patterns', list(DEFAULT_EXCLUDE_PATTERNS))
+        # 目录排除模式：匹配的子树在扫描时不进入
+        self._exclude_dir_patterns = self.config_manager.get('file_sync.exclude_dir_patterns',
+                                                             list(DEFAULT_EXCLUDE_DIR_PATTERNS))
         
         # 预定义的扩展名集合 - 统一使用小写，确保不区分大小写
-        self.media_extensions = {
-            '.mp4', '.mov', '.jpg', '.jpeg', '.png', '.dng'
-        }
-        
-        self.extended_extensions = {
-            # 视频文件
-            '.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm', '.m4v',
-            # 图片文件
-            '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif', '.webp',
-            # RAW格式
-            '.dng', '.raw', '.cr2', '.nef', '.arw', '.orf', '.rw2',
-            # 文档文件
-            '.txt', '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
-            # 数据文件
-            '.csv', '.json', '.xml', '.log', '.las', '.laz',
-            # 压缩文件
-            '.zip', '.rar', '.7z', '.tar', '.gz',
-            # 其他常见格式
-            '.kml', '.kmz', '.gpx', '.shp'
-        }
+        self.media_extensions = MEDIA_EXTENSIONS
+        self.extended_extensions = EXTENDED_EXTENSIONS
+        
+        self._rebuild_filter()
+    
+    def _rebuild_filter(self):
+        """按当前过滤配置重新编译文件过滤器（过滤配置的 setter 调用）"""
+        self.file_filter = FileFilter(
+            strategy=self._filter_strategy,
+            custom_extensions=self._custom_extensions,
+            exclude_patterns=self._exclude_patterns,
+            exclude_dir_patterns=self._exclude_dir_patterns
+        )
+    
+    @property
+    def filter_strategy(self) -> str:
+        """过滤策略"""
+        return self._filter_strategy
+    
+    @filter_strategy.setter
+    def filter_strategy(self, value: str):
+        self._filter_strategy = value
+        self._rebuild_filter()
+    
+    @property
+    def custom_extensions(self) -> Set[str]:
+        """自定义扩展名（custom 策略使用）"""
+        return self._custom_extensions
+    
+    @custom_extensions.setter
+    def custom_extensions(self, value: Set[str]):
+        self._custom_extensions = value
+        self._rebuild_filter()
+    
+    @property
+    def exclude_patterns(self) -> List[str]:
+        """文件排除模式"""
+        return self._exclude_patterns
+    
+    @exclude_patterns.setter
+    def exclude_patterns(self, value: List[str]):
+        self._exclude_patterns = value
+        self._rebuild_filter()
+    
+    @property
+    def exclude_dir_patterns(self) -> List[str]:
+        """目录排除模式"""
+        return self._exclude_dir_patterns
+    
+    @exclude_dir_patterns.setter
+    def exclude_dir_patterns(self, value: List[str]):
+        self._exclude_dir_patterns = value
+        self._rebuild_filter()
     
     def _setup_logging(self) -> logging.Logger:
         """设置详细的日志记录系统"""
@@ -164,87 +371,99 @@ class MediaFindingDaemon:
     
     def _should_process_file(self, filename: str) -> bool:
         """根据配置的策略判断是否应该处理该文件"""
-        # 检查排除模式
-        for pattern in self.exclude_patterns:
-            if fnmatch.fnmatch(filename, pattern) or filename.startswith(pattern.rstrip('*')):
-                return False
-        
-        # 根据策略决定是否处理
-        if self.filter_strategy == 'all_files':
-            return True
-        
-        file_ext = os.path.splitext(filename)[1].lower()
-        
-        if self.filter_strategy == 'media_only':
-            return file_ext in self.media_extensions
-        
-        elif self.filter_strategy == 'extended':
-            # 如果文件没有扩展名，也允许同步（如某些数据文件）
-            return not file_ext or file_ext in self.extended_extensions
-        
-        elif self.filter_strategy == 'custom':
-            return not file_ext or file_ext in self.custom_extensions
-        
-        # 默认使用扩展策略
-        return not file_ext or file_ext in self.extended_extensions
+        return self.file_filter.should_process(filename)
     
-    def _scan_media_directory(self) -> List[str]:
-        """扫描媒体目录发现新文件"""
-        new_files = []
+    def _iter_media_files(self) -> Iterator[ScannedFile]:
+        """基于 os.scandir 流式扫描媒体目录，逐个产出通过过滤的文件
         
+        复用 DirEntry 的 stat 结果，目录逐层展开，不在内存中构建完整文件列表；
+        匹配目录排除模式的子树不会进入。
+        """
         if not os.path.exists(self.media_directory):
             self.logger.warning(f"媒体目录不存在: {self.media_directory}")
-            return new_files
+            return
         
         self.logger.info(f"正在扫描目录: {self.media_directory}")
         
-        try:
-            for root, dirs, files in os.walk(self.media_directory):
-                self.logger.info(f"扫描子目录: {root}, 发现 {len(files)} 个文件")
-                for filename in files:
-                    self.logger.info(f"检查文件: {filename}")
-                    if self._should_process_file(filename):
-                        file_path = os.path.join(root, filename)
-                        self.logger.info(f"文件通过过滤: {file_path}")
-                        new_files.append(file_path)
-                    else:
-                        self.logger.info(f"文件被过滤: {filename}")
-        
-        except Exception as e:
-            self.logger.error(f"扫描目录失败: {str(e)}")
-        
-        return new_files
+        file_filter = self.file_filter
+        pending_dirs = [self.media_directory]
+        while pending_dirs:
+            current = pending_dirs.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if file_filter.should_descend(entry.name):
+                                    pending_dirs.append(entry.path)
+                                else:
+                                    self.logger.debug(f"跳过排除的目录: {entry.path}")
+                                continue
+                            if not entry.is_file():
+                                continue
+                            if not file_filter.should_process(entry.name):
+                                self.logger.debug(f"文件被过滤: {entry.name}")
+                                continue
+                            stat = entry.stat()
+                        except OSError as e:
+                            self.logger.warning(f"读取文件信息失败: {entry.path}, 错误: {e}")
+                            continue
+                        yield ScannedFile(entry.path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            except OSError as e:
+                self.logger.error(f"扫描目录失败: {current}, 错误: {e}")
     
-    def _calculate_file_hash(self, file_path: str) -> str:
+    def _scan_media_directory(self) -> List[str]:
+        """扫描媒体目录发现新文件"""
+        return [scanned.path for scanned in self._iter_media_files()]
+    
+    def _calculate_file_hash(self, file_path: str, file_size: int = None,
+                             digests: Dict[str, str] = None) -> str:
         """计算文件哈希值，针对大文件优化
         
-        对于大文件（>100MB），使用采样哈希策略：
+        对于大文件（默认 >100MB），使用采样哈希策略：
         - 文件头部 1MB + 文件中部 1MB + 文件尾部 1MB
         - 文件大小和修改时间
+        
+        Args:
+            file_path: 文件路径
+            file_size: 已知的文件大小（来自扫描时的 stat），None 时重新获取
+            digests: 传入字典时，同一次读取得到的全部完整摘要写入其中（小文件和 merkle 策略的大文件）
         """
         try:
-            file_size = os.path.getsize(file_path)
+            if file_size is None:
+                file_size = os.path.getsize(file_path)
             
             # 小文件直接计算完整哈希
-            if file_size < 100 * 1024 * 1024:  # 100MB
-                return self._calculate_full_hash(file_path)
+            if file_size < self.full_hash_max_bytes:
+                return self._calculate_full_hash(file_path, digests)
             
-            # 大文件使用采样哈希
+            # 大文件使用分块 Merkle 根或采样哈希
+            if self.large_file_strategy == 'merkle':
+                manifest = self._calculate_chunk_manifest(file_path, file_size)
+                if digests is not None:
+                    digests.update(manifest.digests)
+                return manifest.root
             return self._calculate_sampled_hash(file_path, file_size)
         
         except Exception as e:
             self.logger.error(f"计算文件哈希失败: {file_path}, 错误: {str(e)}")
             return ""
     
-    def _calculate_full_hash(self, file_path: str) -> str:
-        """计算完整文件哈希"""
-        hasher = hashlib.sha256()
-        
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hasher.update(chunk)
-        
-        return hasher.hexdigest()
+    def _calculate_full_hash(self, file_path: str, digests: Dict[str, str] = None) -> str:
+        """计算完整文件哈希（大块复用缓冲区读取，一次读取计算全部配置的摘要）"""
+        result = self.file_hasher.hash_file(file_path, self.hash_algorithms)
+        if digests is not None:
+            digests.update(result)
+        return result['sha256']
+    
+    def _uses_chunk_manifest(self, file_size: int) -> bool:
+        """该大小的文件是否使用分块 Merkle 指纹"""
+        return self.large_file_strategy == 'merkle' and file_size >= self.full_hash_max_bytes
+    
+    def _calculate_chunk_manifest(self, file_path: str, file_size: int = None) -> ChunkManifest:
+        """计算大文件的分块指纹，同一次读取计算全部配置的整文件摘要（块哈希在哈希线程池中并行计算）"""
+        return compute_chunk_manifest(file_path, self.chunk_size, self.file_hasher, file_size=file_size,
+                                      digests=self.hash_algorithms)
     
     def _calculate_sampled_hash(self, file_path: str, file_size: int) -> str:
         """大文件采样哈希计算 - 30GB文件约耗时1-2秒"""
@@ -272,128 +491,495 @@ class MediaFindingDaemon:
         
         return hasher.hexdigest()
     
+    def _get_fingerprint_cache(self) -> Dict[str, tuple]:
+        """获取常驻内存的文件指纹缓存，首次调用时从数据库加载"""
+        if self._fingerprints is None:
+            self._fingerprints = self.db.load_fingerprints()
+            self.logger.info(f"已加载 {len(self._fingerprints)} 条文件指纹缓存")
+        return self._fingerprints
+    
+    def _get_known_paths(self, refresh: bool = False) -> Set[str]:
+        """获取常驻内存的已登记文件路径集合
+        
+        Args:
+            refresh: 重新从数据库加载（一次流式查询）
+        """
+        if refresh or self._known_paths is None:
+            self._known_paths = self.db.get_known_file_paths()
+            self.logger.debug(f"已加载 {len(self._known_paths)} 条已登记文件路径")
+        return self._known_paths
+    
     def discover_and_register_files(self):
-        """发现新文件并注册到数据库"""
+        """发现新文件并注册到数据库
+        
+        扫描结果以流的方式按 scan_batch_size 分批注册，首批文件无需等待整个目录遍历完成。
+        使用 (路径, inode, 大小, mtime_ns) 指纹判断文件是否变化：
+        未变化的文件直接跳过，不计算哈希也不查询数据库。
+        是否已登记通过与已登记路径集合做集合差判断，每轮只需一次查询。
+        """
         start_time = time.time()
         
-        # 1. 扫描文件夹发现新文件
         self.logger.info("开始扫描媒体文件目录")
-        new_files = self._scan_media_directory()
-        self.logger.info(f"扫描完成，发现 {len(new_files)} 个文件")
+        fingerprints = self._get_fingerprint_cache()
         
-        if not new_files:
-            self.logger.info("没有发现新文件")
-            return
+        # 每轮完整扫描刷新一次已登记路径集合（兼顾其他进程的写入和记录清理）
+        self._get_known_paths(refresh=True)
+        
+        seen_paths = set()
+        batch = []
+        registered_count = 0
+        for scanned in self._iter_media_files():
+            seen_paths.add(scanned.path)
+            batch.append(scanned)
+            if len(batch) >= self.scan_batch_size:
+                registered_count += self._register_files(batch, start_time)
+                batch = []
+        if batch:
+            registered_count += self._register_files(batch, start_time)
+        
+        self.logger.info(f"扫描完成，发现 {len(seen_paths)} 个文件, 新注册 {registered_count} 个, "
+                         f"总耗时: {time.time() - start_time:.2f}秒")
+        
+        # 清理已消失文件的指纹，避免缓存无限增长
+        stale_paths = set(fingerprints) - seen_paths
+        if stale_paths:
+            self.db.delete_fingerprints(list(stale_paths))
+            for path in stale_paths:
+                fingerprints.pop(path, None)
+    
+    def _register_files(self, files: Iterable[Union[str, ScannedFile]], start_time: float = None) -> int:
+        """注册一组文件到数据库（指纹未变化或已注册的文件会被跳过）
+        
+        Args:
+            files: 文件路径或扫描记录（已带 stat 信息）列表
+            start_time: 统计耗时的起始时间
+            
+        Returns:
+            int: 新注册的文件数量
+        """
+        start_time = start_time or time.time()
+        fingerprints = self._get_fingerprint_cache()
+        known_paths = self._get_known_paths()
         
         processed_count = 0
         skipped_count = 0
+        unchanged_count = 0
         registered_count = 0
+        fingerprint_updates = []
+        new_records = []
+        new_fingerprints = []
+        to_hash = []
         
-        for file_path in new_files:
+        files = list(files)
+        for scanned in files:
+            file_path = scanned if isinstance(scanned, str) else scanned.path
+            filename = os.path.basename(file_path)
             try:
                 processed_count += 1
-                filename = os.path.basename(file_path)
-                file_size = os.path.getsize(file_path)
-                
-                self.logger.info(f"处理文件 [{processed_count}/{len(new_files)}]: {filename} ({file_size} bytes)")
-                
-                # 2. 计算文件哈希（用于去重）
-                hash_start = time.time()
-                file_hash = self._calculate_file_hash(file_path)
-                hash_duration = time.time() - hash_start
+                if isinstance(scanned, str):
+                    stat = os.stat(file_path)
+                    scanned = ScannedFile(file_path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                file_size = scanned.size
+                fingerprint = (scanned.inode, scanned.size, scanned.mtime_ns)
                 
-                if not file_hash:
-                    self.logger.error(f"无法计算文件哈希，跳过: {filename}")
+                # 1. 指纹未变化：文件已处理过，跳过哈希和数据库查询
+                if fingerprints.get(file_path) == fingerprint:
+                    unchanged_count += 1
                     continue
                 
-                self.logger.info(f"文件哈希计算完成: {filename}, 哈希: {file_hash[:16]}..., 耗时: {hash_duration:.2f}秒")
-                
-                # 3. 检查数据库中是否已存在（通过文件路径）
-                if self.db.file_exists(file_path):
+                # 2. 检查是否已登记（内存集合差，无需逐个查询数据库）
+                if file_path in known_paths:
                     skipped_count += 1
-                    self.logger.info(f"文件已存在数据库，跳过: {filename}")
+                    self.logger.debug(f"文件已存在数据库，跳过: {filename}")
+                    fingerprint_updates.append((file_path, *fingerprint, ""))
                     continue
                 
-                # 4. 文件不存在，添加新记录并标记为 pending
-                success = self.db.insert_file_record(
-                    file_path=file_path,
-                    file_name=filename,
-                    file_size=file_size,
-                    file_hash=file_hash,
-                    download_status="completed",
-                    transfer_status="pending"
-                )
-                
-                if success:
-                    registered_count += 1
-                    self.logger.info(f"新文件已注册到数据库: {filename}, 状态: PENDING")
-                else:
-                    self.logger.error(f"文件注册失败: {filename}")
-
+                self.logger.debug(f"处理文件 [{processed_count}/{len(files)}]: {filename} ({file_size} bytes)")
+                to_hash.append((file_path, file_size, fingerprint))
                 
             except Exception as e:
                 self.logger.error(f"处理文件失败: {filename}, 错误: {str(e)}")
         
+        # 3. 在哈希线程池中并行计算新文件哈希（用于去重）：
+        #    小文件按文件并行，大文件逐个计算分块指纹（块之间并行），两者都在同一次读取中得到全部完整摘要
+        hash_start = time.time()
+        file_digests = [{} for _ in to_hash]
+        manifests: Dict[str, ChunkManifest] = {}
+        for (file_path, file_size, _), digests in zip(to_hash, file_digests):
+            if self._uses_chunk_manifest(file_size):
+                try:
+                    manifests[file_path] = self._calculate_chunk_manifest(file_path, file_size)
+                    digests.update(manifests[file_path].digests)
+                except OSError as e:
+                    self.logger.error(f"计算分块哈希失败: {file_path}, 错误: {e}")
+        small_files = [(item, digests) for item, digests in zip(to_hash, file_digests)
+                       if not self._uses_chunk_manifest(item[1])]
+        small_hashes = iter(self.file_hasher.map(
+            lambda entry: self._calculate_file_hash(entry[0][0], entry[0][1], entry[1]),
+            small_files))
+        for (file_path, file_size, fingerprint), digests in zip(to_hash, file_digests):
+            filename = os.path.basename(file_path)
+            if self._uses_chunk_manifest(file_size):
+                file_hash = manifests[file_path].root if file_path in manifests else ""
+            else:
+                file_hash = next(small_hashes)
+            if not file_hash:
+                self.logger.error(f"无法计算文件哈希，跳过: {filename}")
+                continue
+            
+            # 4. 文件不存在，收集新记录（pending，附带全部摘要供后续阶段复用），稍后在一个事务中批量插入
+            new_records.append((file_path, filename, file_size, file_hash, "completed", "pending", digests))
+            new_fingerprints.append((file_path, *fingerprint, file_hash))
+        if to_hash:
+            self.logger.debug(f"文件哈希计算完成: {len(to_hash)} 个文件, 耗时: {time.time() - hash_start:.2f}秒")
+        
+        # 5. 批量注册新文件
+        if new_records:
+            for record, fingerprint_record, inserted in zip(new_records, new_fingerprints,
+                                                           self.db.insert_file_records_bulk(new_records)):
+                known_paths.add(record[0])
+                if inserted:
+                    registered_count += 1
+                    fingerprint_updates.append(fingerprint_record)
+                    manifest = manifests.get(record[0])
+                    if manifest:
+                        self.db.save_chunk_hashes(record[0], manifest.chunk_size,
+                                                  manifest.chunk_hashes, manifest.root)
+                    self.logger.info(f"新文件已注册到数据库: {record[1]}, 状态: PENDING")
+                else:
+                    self.logger.error(f"文件注册失败: {record[1]}")
+        
+        # 6. 批量持久化指纹，并同步更新内存缓存
+        if fingerprint_updates and self.db.upsert_fingerprints(fingerprint_updates):
+            for file_path, inode, file_size, mtime_ns, _ in fingerprint_updates:
+                fingerprints[file_path] = (inode, file_size, mtime_ns)
+        
         total_duration = time.time() - start_time
-        self.logger.info(f"文件发现和注册完成 - 总计: {processed_count}, 新注册: {registered_count}, 跳过: {skipped_count}, 总耗时: {total_duration:.2f}秒")
+        self.logger.info(f"文件注册完成 - 本批: {processed_count}, 新注册: {registered_count}, 跳过: {skipped_count}, 未变化: {unchanged_count}, 总耗时: {total_duration:.2f}秒")
+        return registered_count
     
     def process_pending_files(self):
-        """处理数据库中 pending 状态的文件"""
+        """处理数据库中 pending 状态的文件
+        
+        single 模式：由传输引擎并发执行，每个工作线程原子领取一个文件（小文件优先），
+        本轮最多处理 batch_size 个文件。
+        batch 模式：一次领取最多 rsync_batch_max_files 个文件，按目标日期目录分组，
+        每组一次 rsync 调用，各组由传输引擎并发执行。
+        启用小文件聚合时，不超过 small_file_max_kb 的文件先分组（同名文件分到不同组），
+        每组一次批量传输（rsync --files-from，tar_stream 后端为一个 tar 流）。
+        启用分块上传时，batch 模式不领取达到分块阈值的大文件，由传输引擎逐个分块上传。
+        """
         start_time = time.time()
         
-        # 1. 查询所有待传输的文件
-        self.logger.info("开始查询待传输文件")
-        pending_files = self.db.get_ready_to_transfer_files()
-        self.logger.info(f"查询到 {len(pending_files)} 个待传输文件")
+        # 回收崩溃等原因遗留、租约已过期的传输中文件
+        self.db.reclaim_expired(self.claim_lease_seconds)
+        
+        # 小文件先聚合批量上传到当天的日期目录，剩余文件走常规传输
+        small_success, small_failed = self._transfer_small_files()
         
-        if not pending_files:
+        self.logger.info(f"开始处理待传输文件，传输模式: {self.transfer_mode}, 并发数: {self.transfer_engine.max_workers}")
+        if self.transfer_mode == 'batch':
+            max_file_size = self.chunked_upload_min_bytes - 1 if self.chunked_upload else None
+            groups = self._claim_groups(self.rsync_batch_max_files, max_file_size)
+            success_count, failed_count = self.transfer_engine.run_jobs(groups, self._transfer_claimed_batch)
+            if self.chunked_upload:
+                large_success, large_failed = self.transfer_engine.run(self.batch_size)
+                success_count += large_success
+                failed_count += large_failed
+        else:
+            success_count, failed_count = self.transfer_engine.run(self.batch_size)
+        success_count += small_success
+        failed_count += small_failed
+        
+        if success_count == 0 and failed_count == 0:
             self.logger.info("没有待传输文件，跳过处理")
             return
         
-        # 按文件大小排序：小文件优先
-        pending_files.sort(key=lambda x: x.file_size)
+        total_duration = time.time() - start_time
+        self.logger.info(f"待传输文件处理完成 - 成功: {success_count}, 失败: {failed_count}, 总耗时: {total_duration:.2f}秒")
+    
+    @staticmethod
+    def _transfer_timeout(nbytes: int) -> float:
+        """按数据量估算传输超时（秒）：至少 300 秒，大文件按最低吞吐量放宽"""
+        return max(300, 60 + nbytes / MIN_THROUGHPUT_BYTES)
+    
+    def _batch_timeout(self, files: list) -> float:
+        """一组文件批量 rsync 的超时（秒）"""
+        return self._transfer_timeout(sum(file_info.file_size or 0 for file_info in files)) + len(files)
+    
+    def _renew_current_lease(self, file_path: str, lease_seconds: float):
+        """为当前工作线程持有的文件续约（传输超时可能超过领取租约）"""
+        if lease_seconds > self.claim_lease_seconds:
+            self.db.renew_lease(self.db.default_worker_id(), [file_path], lease_seconds)
+    
+    @staticmethod
+    def _get_date_path() -> str:
+        """当前传输的日期子目录（YYYY/MM/DD）"""
+        now = datetime.now()
+        return f"{now.year:04d}/{now.month:02d}/{now.day:02d}"
+    
+    def _get_remote_dir(self) -> str:
+        """获取当前传输的远程目标目录（按日期组织）"""
+        return f"{self.nas_destination}/{self._get_date_path()}"
+    
+    def _claim_groups(self, limit: int, max_file_size: int = None) -> List[list]:
+        """领取一批文件并按远程目标目录分组
+        
+        批量传输超时按每组数据量估算，领取后把租约延长到覆盖最长的一组。
+        
+        Args:
+            limit: 最多领取的文件数
+            max_file_size: 只领取不超过该大小（字节）的文件，None 表示不限制
+            
+        Returns:
+            List[list]: 分组后的已领取文件
+        """
+        worker_id = self.db.default_worker_id()
+        claimed_files = self.db.claim_batch(worker_id, limit, lease_seconds=self.claim_lease_seconds,
+                                            max_file_size=max_file_size)
+        groups = self._group_files_by_remote_dir(claimed_files)
+        lease_seconds = max([self._batch_timeout(group) for group in groups], default=0)
+        if lease_seconds > self.claim_lease_seconds:
+            self.db.renew_lease(worker_id, [file_info.file_path for file_info in claimed_files], lease_seconds)
+        return groups
+    
+    def _transfer_small_files(self) -> tuple:
+        """小文件聚合：领取不超过阈值的文件，分组后每组一次批量传输到当天的日期目录
+        
+        按 transfer.backend 使用 rsync --files-from 或 tar 流，各组由传输引擎并发执行。
+        
+        Returns:
+            (成功数量, 失败数量)
+        """
+        if not self.small_file_aggregation:
+            return 0, 0
+        
+        groups = self._claim_groups(self.small_file_batch_max, self.small_file_max_bytes)
+        if not groups:
+            return 0, 0
+        
+        self.logger.info(f"小文件聚合上传: {sum(len(group) for group in groups)} 个文件, {len(groups)} 组")
+        return self.transfer_engine.run_jobs(groups, self._transfer_claimed_batch)
+    
+    def _group_files_by_remote_dir(self, files: list) -> List[list]:
+        """按远程目标目录将文件分组
+        
+        同一组内文件名不能重复（rsync 会平铺到同一目录），重名文件放入同目录的下一组。
+        
+        Args:
+            files: 已领取的文件列表
+            
+        Returns:
+            List[list]: 分组后的文件列表
+        """
+        groups: Dict[str, List[tuple]] = {}
+        for file_info in files:
+            sub_groups = groups.setdefault(self._get_remote_dir(), [])
+            for names, members in sub_groups:
+                if file_info.file_name not in names:
+                    break
+            else:
+                names, members = set(), []
+                sub_groups.append((names, members))
+            names.add(file_info.file_name)
+            members.append(file_info)
+        
+        return [members for sub_groups in groups.values() for _, members in sub_groups]
+    
+    @classmethod
+    def _unescape_rsync_name(cls, name: str) -> str:
+        """还原 rsync 日志输出中按 \\#ooo（八进制字节）转义的文件名"""
+        raw = cls.RSYNC_NAME_ESCAPE.sub(lambda m: bytes([int(m.group(1), 8)]), name.encode('utf-8', 'surrogateescape'))
+        return raw.decode('utf-8', 'surrogateescape')
+    
+    @classmethod
+    def _parse_rsync_itemized_output(cls, output: str) -> Set[str]:
+        """解析 rsync --out-format='%i %n' 输出，返回已确认同步的文件名
+        
+        每行为固定 11 个字符的变更项、一个空格和文件名（文件名原样保留首尾空格，并还原转义）。
+        以 '<'（已发送）或 '.'（内容未变化）开头且类型为 'f' 的条目表示该文件在远端已是最新。
+        
+        Args:
+            output: rsync 标准输出
+            
+        Returns:
+            Set[str]: 已确认同步的文件名集合
+        """
+        synced = set()
+        for line in output.split('\n'):
+            if len(line) <= cls.RSYNC_ITEM_WIDTH + 1 or line[cls.RSYNC_ITEM_WIDTH] != ' ':
+                continue
+            item, name = line[:cls.RSYNC_ITEM_WIDTH], line[cls.RSYNC_ITEM_WIDTH + 1:]
+            if item[0] in '<.' and item[1] == 'f':
+                synced.add(cls._unescape_rsync_name(name))
+        return synced
+    
+    def _transfer_claimed_batch(self, files: list) -> tuple:
+        """以一次 rsync 调用传输同一远程目录下的一组已领取文件，并逐个更新状态
+        
+        Args:
+            files: 已领取（状态为 DOWNLOADING）的文件列表，由 _group_files_by_remote_dir 分组，目标目录相同
+            
+        Returns:
+            (成功数量, 失败数量)
+        """
+        remote_dir = self._get_remote_dir()
+        results = self._transfer_batch_to_nas(remote_dir, [file_info.file_path for file_info in files])
+        return self._record_batch_results(files, remote_dir, results)
+    
+    def _record_batch_results(self, files: list, remote_dir: str, results: Dict[str, tuple]) -> tuple:
+        """按逐个文件的传输结果在一个事务中更新状态，并为成功的文件安排延迟删除
+        
+        Args:
+            files: 已领取的文件列表
+            remote_dir: 远程目标目录
+            results: 文件路径 -> (是否成功, 错误信息)
+            
+        Returns:
+            (成功数量, 失败数量)
+        """
+        from media_status_db import FileStatus as DBFileStatus
         
         success_count = 0
         failed_count = 0
+        status_updates = []
+        for file_info in files:
+            success, error_message = results.get(file_info.file_path, (False, "传输失败"))
+            if success:
+                success_count += 1
+                status_updates.append((file_info.file_path, DBFileStatus.COMPLETED, ""))
+                self._schedule_local_delete(file_info.file_path, f"{remote_dir}/{file_info.file_name}")
+            else:
+                failed_count += 1
+                status_updates.append((file_info.file_path, DBFileStatus.FAILED, error_message))
+                self.logger.error(f"文件传输失败: {file_info.file_name}, 错误: {error_message}")
         
-        for index, file_info in enumerate(pending_files[:self.batch_size], 1):
-            filename = file_info.file_name
-            file_path = file_info.file_path
-            file_size = file_info.file_size
+        # 整组状态在一个事务中提交
+        self.db.update_transfer_statuses_bulk(status_updates)
+        
+        self.logger.info(f"批量传输完成: {remote_dir}, 成功: {success_count}, 失败: {failed_count}")
+        return success_count, failed_count
+    
+    def _transfer_batch_to_nas(self, remote_dir: str, file_paths: List[str]) -> Dict[str, tuple]:
+        """使用一次 rsync --files-from 调用（tar_stream 后端为一个 tar 流）把一组文件传输到同一远程目录
+        
+        Args:
+            remote_dir: 远程目标目录
+            file_paths: 本地文件路径列表（文件名在组内唯一）
             
-            try:
-                self.logger.info(f"开始处理文件 [{index}/{min(len(pending_files), self.batch_size)}]: {filename} (大小: {file_size} bytes)")
-                
-                # 2. 开始传输前，更新状态为传输中
-                from media_status_db import FileStatus as DBFileStatus
-                self.db.update_transfer_status(file_path, DBFileStatus.DOWNLOADING)
-                self.logger.info(f"文件状态已更新为 DOWNLOADING: {filename}")
-                
-                # 3. 执行文件传输
-                transfer_start_time = time.time()
-                success = self._transfer_file_to_nas(file_path)
-                transfer_duration = time.time() - transfer_start_time
+        Returns:
+            Dict[str, tuple]: 文件路径 -> (是否成功, 错误信息)
+        """
+        if self.transfer_backend == 'tar_stream':
+            return self.stream_uploader.upload(remote_dir, [(path, os.path.basename(path)) for path in file_paths])
+        
+        results = {path: (False, "传输失败") for path in file_paths}
+        existing = [path for path in file_paths if os.path.exists(path)]
+        for path in file_paths:
+            if path not in existing:
+                results[path] = (False, "源文件不存在")
+        if not existing:
+            return results
+        
+        list_file = None
+        try:
+            self.logger.info(f"开始批量传输 {len(existing)} 个文件到NAS: {self.nas_ssh_alias}:{remote_dir}")
+            
+            if not self.rsync_mkpath:
+                dir_ready, mkdir_error = self.remote_dir_cache.ensure(self.ssh_pool, remote_dir)
+                if not dir_ready:
+                    self.logger.error(f"创建远程目录失败: {mkdir_error}")
+                    return {path: (False, f"创建远程目录失败: {mkdir_error.strip()}") for path in file_paths}
+            
+            # 文件列表以 / 为源根目录，--no-relative 使文件平铺到目标目录
+            with tempfile.NamedTemporaryFile('w', prefix='.rsync_files_', suffix='.txt', delete=False) as f:
+                list_file = f.name
+                for path in existing:
+                    f.write(os.path.abspath(path).lstrip('/') + '\n')
+            
+            with self.bandwidth_limiter.rsync_stream() as bwlimit_args:
+                rsync_cmd = ['rsync', '-a', *self.compression_policy.rsync_args(existing), *bwlimit_args,
+                             '--no-relative', f'--files-from={list_file}',
+                             '-ii', '--out-format=%i %n',
+                             '-e', self.ssh_pool.rsync_rsh()]
+                if self.rsync_mkpath:
+                    rsync_cmd.append('--mkpath')
+                rsync_cmd += ['/', f"{self.nas_ssh_alias}:{remote_dir}/"]
                 
-                # 4. 根据传输结果更新状态
-                if success:
-                    success_count += 1
-                    transfer_speed = file_size / transfer_duration if transfer_duration > 0 else 0
-                    self.db.update_transfer_status(file_path, DBFileStatus.COMPLETED)
-                    self.logger.info(f"文件传输成功: {filename}, 耗时: {transfer_duration:.2f}秒, 速度: {transfer_speed/1024/1024:.2f} MB/s")
-                else:
-                    failed_count += 1
-                    self.db.update_transfer_status(file_path, DBFileStatus.FAILED, "传输失败")
-                    self.logger.error(f"文件传输失败: {filename}, 耗时: {transfer_duration:.2f}秒")
-                    
-            except Exception as e:
-                failed_count += 1
-                error_msg = str(e)
-                from media_status_db import FileStatus as DBFileStatus
-                self.db.update_transfer_status(file_path, DBFileStatus.FAILED, error_msg)
-                self.logger.error(f"文件处理异常: {filename}, 错误: {error_msg}")
+                timeout = self._transfer_timeout(sum(os.path.getsize(path) for path in existing)) + len(existing)
+                rsync_result = subprocess.run(rsync_cmd, capture_output=True, text=True, timeout=timeout)
+            synced_names = self._parse_rsync_itemized_output(rsync_result.stdout)
+            
+            for path in existing:
+                if os.path.basename(path) in synced_names:
+                    if self._verify_transferred_chunks(path, f"{remote_dir}/{os.path.basename(path)}"):
+                        results[path] = (True, "")
+                    else:
+                        results[path] = (False, "远端分块校验不一致")
+                elif rsync_result.returncode != 0:
+                    results[path] = (False, f"rsync返回码 {rsync_result.returncode}: {rsync_result.stderr.strip()[-500:]}")
+            
+            if rsync_result.returncode != 0:
+                # 目录可能已在远端被删除，下次重新确认
+                self.remote_dir_cache.invalidate(self.ssh_pool.target, remote_dir)
+                self.logger.error(f"批量传输部分失败 (返回码 {rsync_result.returncode}): {rsync_result.stderr.strip()}")
+            else:
+                self.remote_dir_cache.add(self.ssh_pool.target, remote_dir)
+            
+        except subprocess.TimeoutExpired:
+            self.logger.error(f"批量传输超时: {remote_dir}")
+            for path in existing:
+                results[path] = (False, "批量传输超时")
+        except Exception as e:
+            self.logger.error(f"批量传输异常: {e}")
+            for path in existing:
+                results[path] = (False, str(e))
+        finally:
+            if list_file and os.path.exists(list_file):
+                os.remove(list_file)
         
-        total_duration = time.time() - start_time
-        self.logger.info(f"待传输文件处理完成 - 成功: {success_count}, 失败: {failed_count}, 总耗时: {total_duration:.2f}秒")
+        return results
+    
+    def _transfer_claimed_file(self, file_info) -> bool:
+        """传输一个已领取（状态为 DOWNLOADING）的文件并更新最终状态
+        
+        Args:
+            file_info: 已领取的文件信息
+            
+        Returns:
+            bool: 传输是否成功
+        """
+        from media_status_db import FileStatus as DBFileStatus
+        
+        filename = file_info.file_name
+        file_path = file_info.file_path
+        file_size = file_info.file_size
+        
+        try:
+            self.logger.info(f"开始处理文件: {filename} (大小: {file_size} bytes)")
+            
+            # 执行文件传输
+            remote_path = f"{self._get_remote_dir()}/{os.path.basename(file_path)}"
+            transfer_start_time = time.time()
+            success = self._transfer_file_to_nas(file_path)
+            transfer_duration = time.time() - transfer_start_time
+            
+            # 根据传输结果更新状态
+            if success:
+                transfer_speed = file_size / transfer_duration if transfer_duration > 0 else 0
+                self.db.update_transfer_status(file_path, DBFileStatus.COMPLETED)
+                self._schedule_local_delete(file_path, remote_path)
+                self.logger.info(f"文件传输成功: {filename}, 耗时: {transfer_duration:.2f}秒, 速度: {transfer_speed/1024/1024:.2f} MB/s")
+            else:
+                self.db.update_transfer_status(file_path, DBFileStatus.FAILED, "传输失败")
+                self.logger.error(f"文件传输失败: {filename}, 耗时: {transfer_duration:.2f}秒")
+            return success
+                
+        except Exception as e:
+            error_msg = str(e)
+            self.db.update_transfer_status(file_path, DBFileStatus.FAILED, error_msg)
+            self.logger.error(f"文件处理异常: {filename}, 错误: {error_msg}")
+            return False
     
     def _transfer_file_to_nas(self, file_path: str) -> bool:
         """传输文件到NAS
@@ -412,37 +998,51 @@ class MediaFindingDaemon:
                 self.logger.error(f"源文件不存在: {file_path}")
                 return False
             
-            # 构建目标路径 - 按日期组织
-            from datetime import datetime
-            now = datetime.now()
-            date_path = f"{now.year:04d}/{now.month:02d}/{now.day:02d}"
-            
             # 使用实例属性中的NAS配置
             nas_host = self.nas_host
             nas_user = self.nas_username
             nas_ssh_alias = self.nas_ssh_alias  # 使用配置中的SSH别名
-            nas_base_path = self.nas_destination
             
-            remote_dir = f"{nas_base_path}/{date_path}"
+            # 构建目标路径 - 按日期组织
+            remote_dir = self._get_remote_dir()
             remote_path = f"{remote_dir}/{filename}"
             
             self.logger.info(f"开始传输文件到NAS: {filename} -> {nas_user}@{nas_host}:{remote_path} (via {nas_ssh_alias})")
             
-            # 创建远程目录 - 使用配置中的SSH别名
-            mkdir_cmd = f"ssh {nas_ssh_alias} 'mkdir -p {remote_dir}'"
-            mkdir_result = subprocess.run(mkdir_cmd, shell=True, capture_output=True, text=True, timeout=30)
-            if mkdir_result.returncode != 0:
-                self.logger.error(f"创建远程目录失败: {mkdir_result.stderr}")
+            file_size = os.path.getsize(file_path)
+            if self.chunked_upload and file_size >= self.chunked_upload_min_bytes:
+                return self._transfer_file_chunked(file_path, remote_path)
+            
+            if self.transfer_backend == 'tar_stream':
+                success, error_message = self.stream_uploader.upload(remote_dir, [(file_path, filename)])[file_path]
+                if success:
+                    self.logger.info(f"文件传输成功: {filename}")
+                else:
+                    self.logger.error(f"文件传输失败: {error_message}")
+                return success
+            
+            # 创建远程目录 - 已确认存在的目录直接跳过，否则复用SSH主连接执行 mkdir -p
+            dir_ready, mkdir_error = self.remote_dir_cache.ensure(self.ssh_pool, remote_dir)
+            if not dir_ready:
+                self.logger.error(f"创建远程目录失败: {mkdir_error}")
                 return False
             
-            # 使用rsync传输文件 - 使用配置中的SSH别名
-            rsync_cmd = f"rsync -avz '{file_path}' {nas_ssh_alias}:'{remote_path}'"
-            rsync_result = subprocess.run(rsync_cmd, shell=True, capture_output=True, text=True, timeout=300)
+            # 使用rsync传输文件 - 通过 -e 复用SSH主连接
+            with self.bandwidth_limiter.rsync_stream() as bwlimit_args:
+                rsync_cmd = ['rsync', '-av', *self.compression_policy.rsync_args([file_path]), *bwlimit_args,
+                             '-e', self.ssh_pool.rsync_rsh(), file_path, f"{nas_ssh_alias}:{remote_path}"]
+                timeout = self._transfer_timeout(file_size)
+                self._renew_current_lease(file_path, timeout + 60)
+                rsync_result = subprocess.run(rsync_cmd, capture_output=True, text=True, timeout=timeout)
             
             if rsync_result.returncode == 0:
+                if not self._verify_transferred_chunks(file_path, remote_path):
+                    return False
                 self.logger.info(f"文件传输成功: {filename}")
                 return True
             else:
+                # 目录可能已在远端被删除，下次重新确认
+                self.remote_dir_cache.invalidate(self.ssh_pool.target, remote_dir)
                 self.logger.error(f"文件传输失败: {rsync_result.stderr}")
                 return False
                 
@@ -457,6 +1057,101 @@ class MediaFindingDaemon:
             self.logger.error(f"传输文件异常: {str(e)}")
             return False
     
+    def _transfer_file_chunked(self, file_path: str, remote_path: str) -> bool:
+        """分块上传大文件，每完成一批分块为当前工作线程持有的文件续约
+        
+        Args:
+            file_path: 本地文件路径
+            remote_path: 远程目标路径
+            
+        Returns:
+            bool: 传输是否成功（失败时已完成的分块保留，下次续传）
+        """
+        worker_id = self.db.default_worker_id()
+        last_renewal = [time.monotonic()]
+        
+        def on_progress(done_bytes: int, total_bytes: int):
+            # 分块在调用线程中回调，租约过去三分之一时续约
+            if time.monotonic() - last_renewal[0] >= self.claim_lease_seconds / 3:
+                self.db.renew_lease(worker_id, [file_path], self.claim_lease_seconds)
+                last_renewal[0] = time.monotonic()
+        
+        # 组装后逐块校验，不一致时只重传涉及的分块（上传任务保留到校验通过）
+        success, error_message = self.chunked_uploader.upload(
+            file_path, remote_path, on_progress=on_progress,
+            verify=lambda: self._mismatched_chunk_ranges(file_path, remote_path))
+        if not success:
+            self.logger.error(f"分块上传失败: {os.path.basename(file_path)}, 错误: {error_message}")
+            return False
+        self.logger.info(f"文件传输成功: {os.path.basename(file_path)}")
+        return True
+    
+    def _mismatched_chunk_ranges(self, file_path: str, remote_path: str) -> Optional[List[tuple]]:
+        """按登记时保存的分块哈希逐块校验远端文件（仅对有分块指纹的大文件，且启用了校验）
+        
+        Returns:
+            远端不一致的字节范围 [(offset, length)]，一致或无需校验为空列表，校验失败为 None
+        """
+        if not self.verify_chunks_after_transfer:
+            return []
+        stored = self.db.get_chunk_hashes(file_path)
+        if stored is None:
+            return []
+        
+        chunk_size, _, chunk_hashes = stored
+        manifest = ChunkManifest(chunk_size, os.path.getsize(file_path), chunk_hashes)
+        mismatched = verify_remote_chunks(self.ssh_pool, remote_path, manifest, logger=self.logger)
+        if mismatched is None:
+            self.logger.error(f"远端分块校验失败: {remote_path}")
+        elif mismatched:
+            mismatched_bytes = sum(length for _, length in mismatched)
+            self.logger.error(f"远端分块校验不一致: {remote_path}, {len(mismatched)} 个范围, 共 {mismatched_bytes} 字节")
+        else:
+            self.logger.debug(f"远端分块校验通过: {remote_path} ({manifest.chunk_count} 块)")
+        return mismatched
+    
+    def _verify_transferred_chunks(self, file_path: str, remote_path: str) -> bool:
+        """rsync 传输后逐块校验远端文件
+        
+        不一致时返回 False，文件重新排队；重传时由 rsync 的增量算法只发送不一致的块，
+        因此这里不单独重传范围（分块上传的范围重传见 ChunkedUploader 的 verify 参数）。
+        
+        Returns:
+            bool: 校验通过（或无需校验）返回True
+        """
+        return self._mismatched_chunk_ranges(file_path, remote_path) == []
+    
+    def _schedule_local_delete(self, file_path: str, remote_path: str):
+        """传输成功后安排延迟删除本地文件（未启用同步后删除时不做任何事）"""
+        if self.delete_manager is None:
+            return
+        self.delete_manager.schedule_delete(file_path, remote_path)
+    
+    def _process_due_deletes(self):
+        """处理已到期的延迟删除任务"""
+        if self.delete_manager is not None and self.delete_manager.next_due_in() == 0:
+            self.delete_manager.process_pending_deletes()
+    
+    def _next_delete_due(self) -> Optional[float]:
+        """下一个延迟删除任务的到期时间戳，没有任务返回None"""
+        if self.delete_manager is None:
+            return None
+        delay = self.delete_manager.next_due_in()
+        return None if delay is None else time.time() + delay
+    
+    def _wait_processing_deletes(self, duration: float):
+        """等待 duration 秒，期间在删除任务到期时立即处理（不轮询）"""
+        deadline = time.time() + duration
+        while self.running:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            if self.delete_manager is None:
+                time.sleep(remaining)
+                return
+            if self.delete_manager.wait_for_due(remaining):
+                self.delete_manager.process_pending_deletes()
+    
     def run_cycle(self):
         """执行一次完整的处理周期"""
         cycle_start = time.time()
@@ -475,18 +1170,93 @@ class MediaFindingDaemon:
         cycle_duration = time.time() - cycle_start
         self.logger.info(f"处理周期完成，耗时: {cycle_duration:.2f}秒")
     
+    def _handle_file_events(self, file_paths: List[str]):
+        """处理 inotify 上报的写入完成文件：过滤、注册并立即触发传输"""
+        candidates = [path for path in file_paths if self._should_process_file(os.path.basename(path))]
+        if not candidates:
+            return
+        
+        self.logger.info(f"inotify事件: {len(candidates)} 个文件写入完成")
+        if self._register_files(candidates) > 0:
+            self.process_pending_files()
+    
+    def _start_watcher(self) -> bool:
+        """启动 inotify 监听，失败时保持轮询模式"""
+        if not os.path.isdir(self.media_directory):
+            self.logger.warning(f"媒体目录不存在，无法启用inotify: {self.media_directory}")
+            return False
+        
+        watcher = InotifyWatcher(self.media_directory, self.logger,
+                                 directory_filter=self.file_filter.should_descend)
+        if not watcher.start():
+            self.logger.warning("inotify不可用，回退到轮询模式")
+            return False
+        
+        self.watcher = watcher
+        return True
+    
+    def _stop_watcher(self):
+        """关闭 inotify 监听"""
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+    
+    def _run_event_driven(self):
+        """事件驱动主循环
+        
+        新文件写入完成后立即注册和传输；全量扫描降级为每 reconcile_interval 秒一次的对账，
+        空闲时每 scan_interval 秒处理一次待传输（含重试）文件。
+        监听数量耗尽时关闭监听并返回，由调用方回退到轮询模式。
+        """
+        next_reconcile = 0.0
+        next_process = time.time() + self.scan_interval
+        
+        while self.running and self.watcher is not None:
+            self._process_due_deletes()
+            now = time.time()
+            if now >= next_reconcile or self.watcher.needs_rescan:
+                self.watcher.needs_rescan = False
+                self.logger.info("执行全量对账扫描")
+                self.run_cycle()
+                next_reconcile = time.time() + self.reconcile_interval
+                next_process = time.time() + self.scan_interval
+            elif now >= next_process:
+                self.process_pending_files()
+                next_process = time.time() + self.scan_interval
+            
+            next_wakeup = min(next_reconcile, next_process)
+            next_delete = self._next_delete_due()
+            if next_delete is not None:
+                next_wakeup = min(next_wakeup, next_delete)
+            timeout = max(0.0, next_wakeup - time.time())
+            file_paths = self.watcher.read_events(timeout)
+            if file_paths:
+                self._handle_file_events(file_paths)
+            
+            if self.watcher.exhausted:
+                self.logger.warning("inotify监听数量耗尽，回退到轮询模式")
+                self._stop_watcher()
+    
+    def _run_polling(self):
+        """轮询主循环：每 scan_interval 秒执行一次完整处理周期"""
+        while self.running:
+            self.run_cycle()
+            
+            # 等待下一个扫描周期（期间按时处理到期的延迟删除）
+            self.logger.info(f"等待 {self.scan_interval} 秒后进行下一次扫描")
+            self._wait_processing_deletes(self.scan_interval)
+    
     def start(self):
         """启动守护进程"""
         self.logger.info("MediaFindingDaemon 启动")
         self.running = True
         
         try:
-            while self.running:
-                self.run_cycle()
-                
-                # 等待下一个扫描周期
-                self.logger.info(f"等待 {self.scan_interval} 秒后进行下一次扫描")
-                time.sleep(self.scan_interval)
+            if self.discovery_mode == 'inotify' and self._start_watcher():
+                self.logger.info(f"使用inotify事件驱动发现模式，对账间隔: {self.reconcile_interval} 秒")
+                self._run_event_driven()
+            
+            self._run_polling()
                 
         except KeyboardInterrupt:
             self.logger.info("收到中断信号，正在停止...")
@@ -499,6 +1269,10 @@ class MediaFindingDaemon:
         """停止守护进程"""
         self.logger.info("MediaFindingDaemon 停止")
         self.running = False
+        self._stop_watcher()
+        if self.delete_manager is not None:
+            self.delete_manager.close()
+        close_all_pools()
         
         # 关闭数据库连接
         if hasattr(self, 'db'):
@@ -11,16 +11,30 @@
 2. 查询待传输的媒体文件
 3. 更新文件传输状态
 4. 支持统计和维护功能
+5. 基于租约的领取队列：多个工作线程/进程原子领取文件，崩溃遗留的文件在租约过期后自动回收
+6. 批量插入和批量状态更新（单个事务），避免逐条提交的 fsync 开销
+7. 保存文件的全部摘要（sha256/md5 等），后续阶段直接复用而不再重新读取文件
+8. 保存大文件的分块哈希和 Merkle 根，供校验和续传逐块比较
+9. 查询走只读连接池（WAL 下 mode=ro + query_only），统计、全量列表等报表查询不占用写连接的锁
+10. 键集分页的记录迭代器（iter_files / iter_ready_to_transfer_files / iter_failed_files），
+    报表和全量处理占用固定内存
+11. 大文件分块上传的任务和逐块状态（upload_tasks / upload_chunks），支持崩溃或超时后续传
 """
 
 import os
+import json
+import itertools
+import time
+import socket
 import sqlite3
 import threading
 import logging
+from contextlib import contextmanager
+from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Tuple
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 class FileStatus(Enum):
@@ -50,23 +64,67 @@ class MediaFileInfo:
     last_error_message: str
     created_at: str
     updated_at: str
+    file_md5: str = ""
+    file_digests: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class UploadChunk:
+    """分块上传的单个分块状态"""
+    index: int
+    offset: int
+    size: int
+    status: str = 'pending'
+    chunk_hash: str = ""
+    retry_count: int = 0
 
 
 class MediaStatusDB:
     """媒体文件传输状态数据库操作类"""
     
-    def __init__(self, db_path: str = "/data/temp/dji/media_status.db"):
+    # MediaFileInfo 对应的查询列
+    FILE_INFO_COLUMNS = """id, file_path, file_name, file_size, file_hash,
+                           download_status, download_start_time, download_end_time, download_retry_count,
+                           transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
+                           last_error_message, created_at, updated_at, file_md5, file_digests"""
+    
+    # claim_batch 支持的领取顺序
+    CLAIM_ORDERS = {
+        'smallest_first': 'file_size ASC, created_at ASC',
+        'oldest_first': 'created_at ASC, id ASC',
+        'largest_first': 'file_size DESC, created_at ASC',
+    }
+    
+    # 默认租约时长（秒），需大于单次传输的最长耗时
+    DEFAULT_LEASE_SECONDS = 1800
+    
+    # 批量 IN 查询每次的参数个数（低于 SQLite 默认上限 999）
+    SQL_PARAM_CHUNK = 500
+    
+    # 默认只读连接数（同时进行的查询数上限）
+    DEFAULT_READ_POOL_SIZE = 4
+    
+    def __init__(self, db_path: str = "/data/temp/dji/media_status.db",
+                 read_pool_size: int = DEFAULT_READ_POOL_SIZE):
         """
         初始化数据库连接
         
         Args:
             db_path: 数据库文件路径
+            read_pool_size: 只读连接池大小，<=0 表示查询也使用写连接
         """
         self.db_path = db_path
         self.connection = None
         self.lock = threading.Lock()
         self.logger = logging.getLogger(__name__)
         
+        # 只读连接池：写连接只用于修改，查询从池中借用只读连接，不与写入争用 self.lock
+        self.read_pool_size = read_pool_size
+        self._read_slots = threading.BoundedSemaphore(max(1, read_pool_size))
+        self._idle_readers: List[sqlite3.Connection] = []
+        self._all_readers: List[sqlite3.Connection] = []
+        self._reader_lock = threading.Lock()
+        
     def __enter__(self):
         """上下文管理器入口"""
         self.connect()
@@ -154,7 +212,68 @@ class MediaStatusDB:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON media_transfer_status(created_at)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_updated_at ON media_transfer_status(updated_at)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_status_combo ON media_transfer_status(download_status, transfer_status)")
-            
+
+            # 领取队列和文件摘要字段（旧数据库自动迁移）
+            self._ensure_columns(cursor, 'media_transfer_status', {
+                'claimed_by': "TEXT DEFAULT ''",
+                'lease_expires_at': 'REAL',
+                'file_md5': "TEXT DEFAULT ''",
+                'file_digests': "TEXT DEFAULT ''",
+                'merkle_root': "TEXT DEFAULT ''",
+                'chunk_size': 'INTEGER DEFAULT 0',
+            })
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_transfer_lease ON media_transfer_status(transfer_status, lease_expires_at)")
+
+            # 创建文件指纹缓存表：以 (路径, inode, 大小, mtime_ns) 判断文件是否变化，
+            # 未变化的文件在发现阶段无需重新计算哈希和查询数据库
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS file_fingerprints (
+                    file_path TEXT PRIMARY KEY,
+                    inode INTEGER NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    file_hash TEXT DEFAULT '',
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 创建分块哈希表：大文件按固定块大小的逐块摘要（Merkle 树的叶子）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS file_chunk_hashes (
+                    file_path TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    PRIMARY KEY (file_path, chunk_index)
+                ) WITHOUT ROWID
+            """)
+
+            # 创建分块上传表：Edge->NAS 大文件分块上传的任务和逐块状态，用于崩溃或超时后续传
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS upload_tasks (
+                    file_path TEXT PRIMARY KEY,
+                    remote_path TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    total_chunks INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS upload_chunks (
+                    file_path TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    chunk_offset INTEGER NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    chunk_hash TEXT DEFAULT '',
+                    retry_count INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (file_path, chunk_index)
+                ) WITHOUT ROWID
+            """)
+
             # 创建触发器自动更新updated_at字段
             cursor.execute("""
                 CREATE TRIGGER IF NOT EXISTS update_media_transfer_status_updated_at
@@ -175,70 +294,408 @@ class MediaStatusDB:
             self.logger.error(f"初始化数据库表失败: {e}")
             raise
             
+    @staticmethod
+    def _ensure_columns(cursor: sqlite3.Cursor, table: str, columns: Dict[str, str]):
+        """为已有表补充缺失的列（ALTER TABLE ADD COLUMN）
+        
+        Args:
+            cursor: 数据库游标
+            table: 表名
+            columns: 列名 -> 列定义
+        """
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row['name'] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    
+    @staticmethod
+    def default_worker_id() -> str:
+        """当前进程/线程的默认工作者标识"""
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+    
     def close(self):
         """关闭数据库连接"""
+        with self._reader_lock:
+            for reader in self._all_readers:
+                reader.close()
+            self._all_readers.clear()
+            self._idle_readers.clear()
         with self.lock:
             if self.connection:
                 self.connection.close()
                 self.connection = None
                 self.logger.info("数据库连接已关闭")
+    
+    def _open_reader(self) -> Optional[sqlite3.Connection]:
+        """打开一个只读连接，内存数据库或只读打开失败时返回None"""
+        if self.read_pool_size <= 0 or self.db_path == ':memory:' or self.db_path.startswith('file:'):
+            return None
+        try:
+            uri = f"{Path(os.path.abspath(self.db_path)).as_uri()}?mode=ro"
+            reader = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30.0)
+            reader.row_factory = sqlite3.Row
+            reader.execute("PRAGMA query_only = ON")
+            return reader
+        except sqlite3.Error as e:
+            self.logger.warning(f"打开只读连接失败，查询改用写连接: {e}")
+            return None
+    
+    @contextmanager
+    def _read_connection(self):
+        """
+        借用一个只读连接执行查询
+        
+        WAL 模式下读连接读取已提交的快照，不阻塞写入也不被写入阻塞；
+        无法使用只读连接时退回在 self.lock 下使用写连接。数据库未连接时得到None。
+        """
+        if self.connection is None:
+            yield None
+            return
+        
+        self._read_slots.acquire()
+        try:
+            with self._reader_lock:
+                reader = self._idle_readers.pop() if self._idle_readers else None
+            if reader is None:
+                reader = self._open_reader()
+                if reader is None:
+                    with self.lock:
+                        yield self.connection
+                    return
+                with self._reader_lock:
+                    self._all_readers.append(reader)
+            try:
+                yield reader
+            finally:
+                # 结束可能残留的读事务，释放快照，避免阻止 WAL 检查点
+                if reader.in_transaction:
+                    reader.rollback()
+                with self._reader_lock:
+                    if reader in self._all_readers:
+                        self._idle_readers.append(reader)
+        finally:
+            self._read_slots.release()
                 
-    def get_ready_to_transfer_files(self) -> List[MediaFileInfo]:
+    @staticmethod
+    def _row_to_file_info(row: sqlite3.Row) -> MediaFileInfo:
+        """将查询结果行转换为 MediaFileInfo"""
+        return MediaFileInfo(
+            id=row['id'],
+            file_path=row['file_path'],
+            file_name=row['file_name'],
+            file_size=row['file_size'],
+            file_hash=row['file_hash'] or "",
+            download_status=FileStatus(row['download_status']),
+            download_start_time=row['download_start_time'] or "",
+            download_end_time=row['download_end_time'] or "",
+            download_retry_count=row['download_retry_count'],
+            transfer_status=FileStatus(row['transfer_status']),
+            transfer_start_time=row['transfer_start_time'] or "",
+            transfer_end_time=row['transfer_end_time'] or "",
+            transfer_retry_count=row['transfer_retry_count'],
+            last_error_message=row['last_error_message'] or "",
+            created_at=row['created_at'],
+            updated_at=row['updated_at'],
+            file_md5=(row['file_md5'] or "") if 'file_md5' in row.keys() else "",
+            file_digests=MediaStatusDB._decode_digests(row['file_digests']) if 'file_digests' in row.keys() else {}
+        )
+    
+    @staticmethod
+    def _encode_digests(digests: Optional[Dict[str, str]]) -> str:
+        """摘要字典序列化为 JSON 文本"""
+        return json.dumps(digests, sort_keys=True) if digests else ''
+    
+    @staticmethod
+    def _decode_digests(text: Optional[str]) -> Dict[str, str]:
+        """JSON 文本解析为摘要字典"""
+        if not text:
+            return {}
+        try:
+            return json.loads(text)
+        except ValueError:
+            return {}
+    
+    def get_ready_to_transfer_files(self, limit: int = None) -> List[MediaFileInfo]:
         """
         获取准备传输的文件列表（下载完成但未传输的文件）
         
+        仅用于查询；需要传输时应使用 claim_batch 原子领取。结果较多时应使用
+        iter_ready_to_transfer_files 逐条处理。
+        
+        Args:
+            limit: 最多返回的文件数，None 表示不限制
+        
         Returns:
             List[MediaFileInfo]: 待传输文件列表
         """
+        files = list(itertools.islice(self.iter_ready_to_transfer_files(), limit))
+        self.logger.info(f"查询到 {len(files)} 个待传输文件")
+        return files
+    
+    def iter_ready_to_transfer_files(self, page: int = 1000) -> Iterator[MediaFileInfo]:
+        """
+        按创建时间分页逐条返回准备传输的文件（下载完成但未传输）
+        
+        Args:
+            page: 每页行数
+            
+        Yields:
+            MediaFileInfo: 按 (created_at, id) 升序的文件记录
+        """
+        return self._iter_pages(["download_status = 'completed'", "transfer_status = 'pending'"], (),
+                                order_column='created_at', page=page)
+        
+    def claim_ready_files(self, limit: int = 1) -> List[MediaFileInfo]:
+        """
+        原子地领取待传输文件（小文件优先），并将其状态置为传输中
+        
+        以当前线程的默认工作者标识调用 claim_batch。
+        
+        Args:
+            limit: 最多领取的文件数
+            
+        Returns:
+            List[MediaFileInfo]: 领取到的文件列表（状态为 downloading）
+        """
+        return self.claim_batch(self.default_worker_id(), limit)
+    
+    def claim_batch(self, worker_id: str, limit: int = 1, order: str = 'smallest_first',
+                    lease_seconds: float = None, max_file_size: int = None) -> List[MediaFileInfo]:
+        """
+        原子地领取一批待传输文件，置为传输中并设置租约
+        
+        领取在 BEGIN IMMEDIATE 事务中完成，多个线程或进程并发领取时不会拿到同一文件。
+        工作者在租约到期前应完成传输或调用 renew_lease 续约，
+        否则文件会被 reclaim_expired 回收重新排队。
+        
+        Args:
+            worker_id: 工作者标识
+            limit: 最多领取的文件数
+            order: 领取顺序（smallest_first / oldest_first / largest_first）
+            lease_seconds: 租约时长（秒），默认 DEFAULT_LEASE_SECONDS
+            max_file_size: 只领取不超过该大小（字节）的文件，None 表示不限制
+            
+        Returns:
+            List[MediaFileInfo]: 领取到的文件列表（状态为 downloading）
+        """
         files = []
+        if order not in self.CLAIM_ORDERS:
+            raise ValueError(f"不支持的领取顺序: {order}")
+        order_by = self.CLAIM_ORDERS[order]
+        lease_expires_at = time.time() + (lease_seconds or self.DEFAULT_LEASE_SECONDS)
         
         try:
             with self.lock:
                 if not self.connection:
                     self.logger.error("数据库未连接")
                     return files
+                
+                if self.connection.in_transaction:
+                    self.connection.commit()
+                
+                cursor = self.connection.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    size_filter = "AND file_size <= ?" if max_file_size is not None else ""
+                    size_params = (max_file_size,) if max_file_size is not None else ()
+                    cursor.execute(f"""
+                        SELECT id FROM media_transfer_status
+                        WHERE download_status = 'completed' AND transfer_status = 'pending' {size_filter}
+                        ORDER BY {order_by}
+                        LIMIT ?
+                    """, size_params + (limit,))
+                    ids = [row['id'] for row in cursor.fetchall()]
+                    
+                    if ids:
+                        placeholders = ','.join('?' * len(ids))
+                        cursor.execute(f"""
+                            UPDATE media_transfer_status
+                            SET transfer_status = 'downloading', transfer_start_time = CURRENT_TIMESTAMP,
+                                last_error_message = '', claimed_by = ?, lease_expires_at = ?
+                            WHERE id IN ({placeholders})
+                        """, [worker_id, lease_expires_at] + ids)
+                        cursor.execute(f"""
+                            SELECT {self.FILE_INFO_COLUMNS}
+                            FROM media_transfer_status WHERE id IN ({placeholders})
+                            ORDER BY {order_by}
+                        """, ids)
+                        files = [self._row_to_file_info(row) for row in cursor.fetchall()]
                     
+                    self.connection.commit()
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"领取待传输文件失败: {e}")
+            
+        return files
+    
+    def renew_lease(self, worker_id: str, file_paths: List[str], lease_seconds: float = None) -> int:
+        """
+        为工作者仍持有的文件续约
+        
+        Args:
+            worker_id: 工作者标识
+            file_paths: 文件路径列表
+            lease_seconds: 新租约时长（秒，从现在起算），默认 DEFAULT_LEASE_SECONDS
+            
+        Returns:
+            int: 成功续约的文件数（已被回收或不属于该工作者的文件不计入）
+        """
+        if not file_paths:
+            return 0
+        lease_expires_at = time.time() + (lease_seconds or self.DEFAULT_LEASE_SECONDS)
+        
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return 0
+                
                 cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT id, file_path, file_name, file_size, file_hash,
-                           download_status, download_start_time, download_end_time, download_retry_count,
-                           transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
-                           last_error_message, created_at, updated_at
-                    FROM media_transfer_status 
-                    WHERE download_status = 'completed' AND transfer_status = 'pending'
-                    ORDER BY created_at ASC
-                """)
+                cursor.executemany("""
+                    UPDATE media_transfer_status SET lease_expires_at = ?
+                    WHERE file_path = ? AND claimed_by = ? AND transfer_status = 'downloading'
+                """, [(lease_expires_at, path, worker_id) for path in file_paths])
+                renewed = cursor.rowcount
+                self.connection.commit()
+                cursor.close()
+                return renewed
                 
-                rows = cursor.fetchall()
-                for row in rows:
-                    file_info = MediaFileInfo(
-                        id=row['id'],
-                        file_path=row['file_path'],
-                        file_name=row['file_name'],
-                        file_size=row['file_size'],
-                        file_hash=row['file_hash'] or "",
-                        download_status=FileStatus(row['download_status']),
-                        download_start_time=row['download_start_time'] or "",
-                        download_end_time=row['download_end_time'] or "",
-                        download_retry_count=row['download_retry_count'],
-                        transfer_status=FileStatus(row['transfer_status']),
-                        transfer_start_time=row['transfer_start_time'] or "",
-                        transfer_end_time=row['transfer_end_time'] or "",
-                        transfer_retry_count=row['transfer_retry_count'],
-                        last_error_message=row['last_error_message'] or "",
-                        created_at=row['created_at'],
-                        updated_at=row['updated_at']
-                    )
-                    files.append(file_info)
-                    
+        except sqlite3.Error as e:
+            self.logger.error(f"续约失败: {e}")
+            return 0
+    
+    def reclaim_expired(self, legacy_timeout_seconds: float = None) -> int:
+        """
+        回收租约已过期的传输中文件，重新置为待传输
+        
+        没有租约信息的传输中文件（旧版本遗留）在传输开始时间超过
+        legacy_timeout_seconds 后同样回收。
+        
+        Args:
+            legacy_timeout_seconds: 无租约文件的超时时间（秒），默认 DEFAULT_LEASE_SECONDS
+            
+        Returns:
+            int: 回收的文件数
+        """
+        legacy_timeout = int(legacy_timeout_seconds or self.DEFAULT_LEASE_SECONDS)
+        
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return 0
+                
+                cursor = self.connection.cursor()
+                cursor.execute("""
+                    UPDATE media_transfer_status
+                    SET transfer_status = 'pending', claimed_by = '', lease_expires_at = NULL,
+                        last_error_message = '租约过期，重新排队'
+                    WHERE transfer_status = 'downloading'
+                      AND ((lease_expires_at IS NOT NULL AND lease_expires_at < ?)
+                           OR (lease_expires_at IS NULL
+                               AND (transfer_start_time IS NULL OR transfer_start_time < datetime('now', ?))))
+                """, (time.time(), f'-{legacy_timeout} seconds'))
+                reclaimed = cursor.rowcount
+                self.connection.commit()
                 cursor.close()
-                self.logger.info(f"查询到 {len(files)} 个待传输文件")
+                
+                if reclaimed:
+                    self.logger.warning(f"回收了 {reclaimed} 个租约过期的传输中文件")
+                return reclaimed
                 
         except sqlite3.Error as e:
-            self.logger.error(f"查询待传输文件失败: {e}")
+            self.logger.error(f"回收过期租约失败: {e}")
+            return 0
+        
+    @staticmethod
+    def _transfer_status_sql(status: FileStatus) -> str:
+        """构建更新传输状态的SQL，参数为 (状态, 错误信息, 文件路径)"""
+        sql = "UPDATE media_transfer_status SET transfer_status = ?, "
+        
+        if status == FileStatus.DOWNLOADING:  # 传输开始
+            sql += "transfer_start_time = CURRENT_TIMESTAMP, "
+        elif status == FileStatus.COMPLETED:  # 传输完成
+            sql += "transfer_end_time = CURRENT_TIMESTAMP, "
+        elif status == FileStatus.FAILED:  # 传输失败
+            sql += "transfer_retry_count = transfer_retry_count + 1, "
+        
+        if status != FileStatus.DOWNLOADING:  # 释放领取租约
+            sql += "claimed_by = '', lease_expires_at = NULL, "
+        
+        return sql + "last_error_message = ? WHERE file_path = ?"
+    
+    def _existing_paths(self, cursor: sqlite3.Cursor, file_paths: List[str]) -> set:
+        """查询已存在记录的文件路径（分块 IN 查询，避免超出SQL参数上限）"""
+        existing = set()
+        unique_paths = list(dict.fromkeys(file_paths))
+        for i in range(0, len(unique_paths), self.SQL_PARAM_CHUNK):
+            chunk = unique_paths[i:i + self.SQL_PARAM_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"SELECT file_path FROM media_transfer_status WHERE file_path IN ({placeholders})", chunk)
+            existing.update(row['file_path'] for row in cursor.fetchall())
+        return existing
+    
+    def update_transfer_statuses_bulk(self, updates: Iterable[Tuple[str, FileStatus, str]]) -> List[bool]:
+        """
+        批量更新文件传输状态（单个事务，executemany）
+        
+        Args:
+            updates: (文件路径, 新状态, 错误信息) 列表，按顺序应用
             
-        return files
+        Returns:
+            List[bool]: 与输入顺序对应的结果，记录存在并已更新为True；整体失败时全部为False
+        """
+        updates = [(path, status, error or "") for path, status, error in updates]
+        if not updates:
+            return []
         
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return [False] * len(updates)
+                
+                cursor = self.connection.cursor()
+                try:
+                    existing = self._existing_paths(cursor, [path for path, _, _ in updates])
+                    
+                    # 相同状态的连续更新合并为一次 executemany，保持输入顺序
+                    start = 0
+                    while start < len(updates):
+                        status = updates[start][1]
+                        end = start
+                        while end < len(updates) and updates[end][1] == status:
+                            end += 1
+                        cursor.executemany(
+                            self._transfer_status_sql(status),
+                            [(status.value, error, path) for path, _, error in updates[start:end] if path in existing]
+                        )
+                        start = end
+                    
+                    self.connection.commit()
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                
+                results = [path in existing for path, _, _ in updates]
+                self.logger.info(f"批量更新传输状态: {sum(results)}/{len(updates)} 条")
+                missing = len(updates) - sum(results)
+                if missing:
+                    self.logger.warning(f"批量更新传输状态时 {missing} 条记录不存在")
+                return results
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"批量更新传输状态失败: {e}")
+            return [False] * len(updates)
+    
     def update_transfer_status(self, file_path: str, status: FileStatus, error_message: str = "") -> bool:
         """
         更新文件传输状态
@@ -259,21 +716,7 @@ class MediaStatusDB:
                     
                 cursor = self.connection.cursor()
                 
-                # 构建SQL语句
-                sql = "UPDATE media_transfer_status SET transfer_status = ?, "
-                params = [status.value]
-                
-                if status == FileStatus.DOWNLOADING:  # 传输开始
-                    sql += "transfer_start_time = CURRENT_TIMESTAMP, "
-                elif status == FileStatus.COMPLETED:  # 传输完成
-                    sql += "transfer_end_time = CURRENT_TIMESTAMP, "
-                elif status == FileStatus.FAILED:  # 传输失败
-                    sql += "transfer_retry_count = transfer_retry_count + 1, "
-                    
-                sql += "last_error_message = ? WHERE file_path = ?"
-                params.extend([error_message, file_path])
-                
-                cursor.execute(sql, params)
+                cursor.execute(self._transfer_status_sql(status), (status.value, error_message, file_path))
                 self.connection.commit()
                 
                 if cursor.rowcount > 0:
@@ -300,17 +743,17 @@ class MediaStatusDB:
             Optional[MediaFileInfo]: 文件信息，未找到返回None
         """
         try:
-            with self.lock:
-                if not self.connection:
+            with self._read_connection() as conn:
+                if conn is None:
                     self.logger.error("数据库未连接")
                     return None
                     
-                cursor = self.connection.cursor()
+                cursor = conn.cursor()
                 cursor.execute("""
                     SELECT id, file_path, file_name, file_size, file_hash,
                            download_status, download_start_time, download_end_time, download_retry_count,
                            transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
-                           last_error_message, created_at, updated_at
+                           last_error_message, created_at, updated_at, file_md5, file_digests
                     FROM media_transfer_status WHERE file_path = ?
                 """, (file_path,))
                 
@@ -318,24 +761,7 @@ class MediaStatusDB:
                 cursor.close()
                 
                 if row:
-                    return MediaFileInfo(
-                        id=row['id'],
-                        file_path=row['file_path'],
-                        file_name=row['file_name'],
-                        file_size=row['file_size'],
-                        file_hash=row['file_hash'] or "",
-                        download_status=FileStatus(row['download_status']),
-                        download_start_time=row['download_start_time'] or "",
-                        download_end_time=row['download_end_time'] or "",
-                        download_retry_count=row['download_retry_count'],
-                        transfer_status=FileStatus(row['transfer_status']),
-                        transfer_start_time=row['transfer_start_time'] or "",
-                        transfer_end_time=row['transfer_end_time'] or "",
-                        transfer_retry_count=row['transfer_retry_count'],
-                        last_error_message=row['last_error_message'] or "",
-                        created_at=row['created_at'],
-                        updated_at=row['updated_at']
-                    )
+                    return self._row_to_file_info(row)
                 else:
                     return None
                     
@@ -345,7 +771,7 @@ class MediaStatusDB:
             
     def insert_file_record(self, file_path: str, file_name: str, file_size: int, 
                           file_hash: str = "", download_status: str = "pending", 
-                          transfer_status: str = "pending") -> bool:
+                          transfer_status: str = "pending", file_digests: Dict[str, str] = None) -> bool:
         """
         插入新的文件记录到数据库
         
@@ -356,6 +782,7 @@ class MediaStatusDB:
             file_hash: 文件哈希值（可选）
             download_status: 下载状态（默认pending）
             transfer_status: 传输状态（默认pending）
+            file_digests: 完整文件摘要（算法 -> 十六进制摘要，可选）
             
         Returns:
             bool: 插入成功返回True
@@ -382,7 +809,7 @@ class MediaStatusDB:
                         file_path, file_name, file_size, file_hash,
                         download_status, download_start_time, download_end_time, download_retry_count,
                         transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
-                        last_error_message
+                        last_error_message, file_md5, file_digests
                     ) VALUES (
                         ?, ?, ?, ?,
                         ?, 
@@ -390,12 +817,13 @@ class MediaStatusDB:
                         CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP ELSE NULL END,
                         0,
                         ?, NULL, NULL, 0,
-                        ''
+                        '', ?, ?
                     )
                 """, (
                     file_path, file_name, file_size, file_hash,
                     download_status, download_status, download_status,
-                    transfer_status
+                    transfer_status,
+                    (file_digests or {}).get('md5', ''), self._encode_digests(file_digests)
                 ))
                 
                 self.connection.commit()
@@ -408,6 +836,377 @@ class MediaStatusDB:
             self.logger.error(f"插入文件记录失败: {e}")
             return False
             
+    def insert_file_records_bulk(self, records: Iterable[Tuple]) -> List[bool]:
+        """
+        批量插入新的文件记录（单个事务，executemany）
+        
+        Args:
+            records: 与 insert_file_record 参数顺序相同的元组列表：
+                (文件路径, 文件名, 文件大小[, 文件哈希[, 下载状态[, 传输状态[, 文件摘要字典]]]])
+            
+        Returns:
+            List[bool]: 与输入顺序对应的结果，新插入为True；
+                已存在（或在本批中重复）的记录为False；整体失败时全部为False
+        """
+        defaults = ("", "pending", "pending", None)
+        rows = []
+        for record in records:
+            record = tuple(record)
+            rows.append(record + defaults[len(record) - 3:])
+        if not rows:
+            return []
+        
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return [False] * len(rows)
+                
+                cursor = self.connection.cursor()
+                try:
+                    existing = self._existing_paths(cursor, [row[0] for row in rows])
+                    
+                    results = []
+                    to_insert = []
+                    for row in rows:
+                        inserted = row[0] not in existing
+                        if inserted:
+                            existing.add(row[0])
+                            to_insert.append(row)
+                        results.append(inserted)
+                    
+                    cursor.executemany("""
+                        INSERT INTO media_transfer_status (
+                            file_path, file_name, file_size, file_hash,
+                            download_status, download_start_time, download_end_time, download_retry_count,
+                            transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
+                            last_error_message, file_md5, file_digests
+                        ) VALUES (
+                            ?, ?, ?, ?,
+                            ?,
+                            CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP ELSE NULL END,
+                            CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP ELSE NULL END,
+                            0,
+                            ?, NULL, NULL, 0,
+                            '', ?, ?
+                        )
+                    """, [
+                        (path, name, size, file_hash, download_status, download_status, download_status, transfer_status,
+                         (digests or {}).get('md5', ''), self._encode_digests(digests))
+                        for path, name, size, file_hash, download_status, transfer_status, digests in to_insert
+                    ])
+                    
+                    self.connection.commit()
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                
+                self.logger.info(f"批量插入文件记录: 新增 {len(to_insert)} 条, 已存在 {len(rows) - len(to_insert)} 条")
+                return results
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"批量插入文件记录失败: {e}")
+            return [False] * len(rows)
+    
+    def get_file_digests(self, file_path: str) -> Dict[str, str]:
+        """
+        获取已保存的完整文件摘要
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            Dict[str, str]: 算法 -> 十六进制摘要，未保存时为空字典
+        """
+        try:
+            with self._read_connection() as conn:
+                if conn is None:
+                    return {}
+                
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT file_md5, file_digests FROM media_transfer_status WHERE file_path = ?",
+                    (file_path,)
+                )
+                row = cursor.fetchone()
+                cursor.close()
+                if row is None:
+                    return {}
+                
+                digests = self._decode_digests(row['file_digests'])
+                if row['file_md5'] and 'md5' not in digests:
+                    digests['md5'] = row['file_md5']
+                return digests
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"查询文件摘要失败: {e}")
+            return {}
+    
+    def update_file_digests(self, file_path: str, digests: Dict[str, str]) -> bool:
+        """
+        合并保存完整文件摘要（已有算法的值被覆盖）
+        
+        Args:
+            file_path: 文件路径
+            digests: 算法 -> 十六进制摘要
+            
+        Returns:
+            bool: 记录存在并已更新返回True
+        """
+        if not digests:
+            return False
+        
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return False
+                
+                cursor = self.connection.cursor()
+                cursor.execute("SELECT file_digests FROM media_transfer_status WHERE file_path = ?", (file_path,))
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.close()
+                    return False
+                
+                merged = self._decode_digests(row['file_digests'])
+                merged.update(digests)
+                cursor.execute("""
+                    UPDATE media_transfer_status
+                    SET file_digests = ?, file_md5 = COALESCE(NULLIF(?, ''), file_md5)
+                    WHERE file_path = ?
+                """, (self._encode_digests(merged), digests.get('md5', ''), file_path))
+                self.connection.commit()
+                cursor.close()
+                return True
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"保存文件摘要失败: {e}")
+            return False
+    
+    def save_chunk_hashes(self, file_path: str, chunk_size: int, chunk_hashes: List[str],
+                          merkle_root: str) -> bool:
+        """
+        保存文件的分块哈希和 Merkle 根（替换已有的分块哈希，单个事务）
+        
+        Args:
+            file_path: 文件路径（须已登记）
+            chunk_size: 块大小（字节）
+            chunk_hashes: 按顺序排列的块哈希
+            merkle_root: Merkle 根
+            
+        Returns:
+            bool: 记录存在并已保存返回True
+        """
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return False
+                
+                cursor = self.connection.cursor()
+                try:
+                    cursor.execute(
+                        "UPDATE media_transfer_status SET merkle_root = ?, chunk_size = ? WHERE file_path = ?",
+                        (merkle_root, chunk_size, file_path)
+                    )
+                    if cursor.rowcount == 0:
+                        self.connection.rollback()
+                        return False
+                    cursor.execute("DELETE FROM file_chunk_hashes WHERE file_path = ?", (file_path,))
+                    cursor.executemany(
+                        "INSERT INTO file_chunk_hashes (file_path, chunk_index, chunk_hash) VALUES (?, ?, ?)",
+                        [(file_path, index, chunk_hash) for index, chunk_hash in enumerate(chunk_hashes)]
+                    )
+                    self.connection.commit()
+                    return True
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"保存分块哈希失败: {e}")
+            return False
+    
+    def start_upload_task(self, file_path: str, remote_path: str, file_size: int, mtime_ns: int,
+                          chunk_size: int) -> List[UploadChunk]:
+        """
+        开始或续传分块上传任务
+        
+        已有任务的目标路径、文件大小、mtime 和块大小都一致时保留逐块状态（续传），
+        否则（文件已变化或首次上传）重建任务，全部分块置为 pending。
+        
+        Args:
+            file_path: 本地文件路径
+            remote_path: 远程目标路径
+            file_size: 文件大小（字节）
+            mtime_ns: 文件修改时间（纳秒）
+            chunk_size: 块大小（字节）
+            
+        Returns:
+            List[UploadChunk]: 按序号排列的全部分块，失败返回空列表
+        """
+        total_chunks = max(1, -(-file_size // chunk_size))
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return []
+                
+                cursor = self.connection.cursor()
+                try:
+                    cursor.execute(
+                        "SELECT remote_path, file_size, mtime_ns, chunk_size FROM upload_tasks WHERE file_path = ?",
+                        (file_path,)
+                    )
+                    row = cursor.fetchone()
+                    if row is None or tuple(row) != (remote_path, file_size, mtime_ns, chunk_size):
+                        cursor.execute("DELETE FROM upload_chunks WHERE file_path = ?", (file_path,))
+                        cursor.execute("""
+                            INSERT OR REPLACE INTO upload_tasks
+                                (file_path, remote_path, file_size, mtime_ns, chunk_size, total_chunks)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, (file_path, remote_path, file_size, mtime_ns, chunk_size, total_chunks))
+                        cursor.executemany("""
+                            INSERT INTO upload_chunks (file_path, chunk_index, chunk_offset, chunk_size)
+                            VALUES (?, ?, ?, ?)
+                        """, [(file_path, index, index * chunk_size,
+                               min(chunk_size, file_size - index * chunk_size))
+                              for index in range(total_chunks)])
+                    
+                    cursor.execute("""
+                        SELECT chunk_index, chunk_offset, chunk_size, status, chunk_hash, retry_count
+                        FROM upload_chunks WHERE file_path = ? ORDER BY chunk_index
+                    """, (file_path,))
+                    chunks = [UploadChunk(*r) for r in cursor.fetchall()]
+                    self.connection.commit()
+                    return chunks
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"创建分块上传任务失败: {e}")
+            return []
+    
+    def update_upload_chunk(self, file_path: str, chunk_index: int, status: str, chunk_hash: str = "") -> bool:
+        """
+        更新分块上传状态
+        
+        Args:
+            file_path: 本地文件路径
+            chunk_index: 块序号
+            status: completed / failed / pending（failed 时重试次数加一）
+            chunk_hash: 已确认的块摘要
+            
+        Returns:
+            bool: 更新成功返回True
+        """
+        try:
+            with self.lock:
+                if not self.connection:
+                    return False
+                
+                self.connection.execute("""
+                    UPDATE upload_chunks
+                    SET status = ?, chunk_hash = ?, updated_at = CURRENT_TIMESTAMP,
+                        retry_count = retry_count + (CASE WHEN ? = 'failed' THEN 1 ELSE 0 END)
+                    WHERE file_path = ? AND chunk_index = ?
+                """, (status, chunk_hash, status, file_path, chunk_index))
+                self.connection.execute(
+                    "UPDATE upload_tasks SET updated_at = CURRENT_TIMESTAMP WHERE file_path = ?", (file_path,))
+                self.connection.commit()
+                return True
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"更新分块上传状态失败: {e}")
+            return False
+    
+    def get_upload_chunks(self, file_path: str) -> List[UploadChunk]:
+        """
+        获取分块上传的逐块状态
+        
+        Returns:
+            List[UploadChunk]: 按序号排列的分块，没有任务时为空列表
+        """
+        try:
+            with self._read_connection() as conn:
+                if conn is None:
+                    return []
+                
+                return [UploadChunk(*row) for row in conn.execute("""
+                    SELECT chunk_index, chunk_offset, chunk_size, status, chunk_hash, retry_count
+                    FROM upload_chunks WHERE file_path = ? ORDER BY chunk_index
+                """, (file_path,))]
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"查询分块上传状态失败: {e}")
+            return []
+    
+    def finish_upload_task(self, file_path: str) -> bool:
+        """
+        删除已完成（远端已组装）的分块上传任务及其逐块状态
+        
+        Returns:
+            bool: 删除成功返回True
+        """
+        try:
+            with self.lock:
+                if not self.connection:
+                    return False
+                
+                self.connection.execute("DELETE FROM upload_chunks WHERE file_path = ?", (file_path,))
+                self.connection.execute("DELETE FROM upload_tasks WHERE file_path = ?", (file_path,))
+                self.connection.commit()
+                return True
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"删除分块上传任务失败: {e}")
+            return False
+    
+    def get_chunk_hashes(self, file_path: str) -> Optional[Tuple[int, str, List[str]]]:
+        """
+        获取文件的分块哈希
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            (块大小, Merkle 根, 块哈希列表)，没有分块哈希时返回None
+        """
+        try:
+            with self._read_connection() as conn:
+                if conn is None:
+                    return None
+                
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT merkle_root, chunk_size FROM media_transfer_status WHERE file_path = ?",
+                    (file_path,)
+                )
+                row = cursor.fetchone()
+                if row is None or not row['merkle_root']:
+                    cursor.close()
+                    return None
+                
+                cursor.execute(
+                    "SELECT chunk_hash FROM file_chunk_hashes WHERE file_path = ? ORDER BY chunk_index",
+                    (file_path,)
+                )
+                chunk_hashes = [r[0] for r in cursor.fetchall()]
+                cursor.close()
+                return row['chunk_size'], row['merkle_root'], chunk_hashes
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"查询分块哈希失败: {e}")
+            return None
+    
     def file_exists(self, file_path: str) -> bool:
         """
         检查文件是否存在于数据库中
@@ -419,11 +1218,11 @@ class MediaStatusDB:
             bool: 存在返回True
         """
         try:
-            with self.lock:
-                if not self.connection:
+            with self._read_connection() as conn:
+                if conn is None:
                     return False
                     
-                cursor = self.connection.cursor()
+                cursor = conn.cursor()
                 cursor.execute(
                     "SELECT COUNT(*) FROM media_transfer_status WHERE file_path = ?", 
                     (file_path,)
@@ -436,7 +1235,127 @@ class MediaStatusDB:
         except sqlite3.Error as e:
             self.logger.error(f"检查文件存在性失败: {e}")
             return False
+
+    def get_known_file_paths(self) -> Set[str]:
+        """
+        一次流式查询加载全部已登记的文件路径（用于发现阶段与扫描结果做集合差）
+        
+        Returns:
+            Set[str]: 已登记的文件路径集合
+        """
+        paths = set()
+        
+        try:
+            with self._read_connection() as conn:
+                if conn is None:
+                    self.logger.error("数据库未连接")
+                    return paths
+                
+                cursor = conn.cursor()
+                cursor.execute("SELECT file_path FROM media_transfer_status")
+                for row in cursor:
+                    paths.add(row[0])
+                cursor.close()
+                
+        except sqlite3.Error as e:
+            self.logger.error(f"加载已登记文件路径失败: {e}")
             
+        return paths
+
+    def load_fingerprints(self) -> Dict[str, Tuple[int, int, int]]:
+        """
+        一次性加载全部文件指纹
+
+        Returns:
+            Dict[str, Tuple[int, int, int]]: 文件路径 -> (inode, 文件大小, mtime_ns)
+        """
+        fingerprints = {}
+
+        try:
+            with self._read_connection() as conn:
+                if conn is None:
+                    self.logger.error("数据库未连接")
+                    return fingerprints
+
+                cursor = conn.cursor()
+                cursor.execute("SELECT file_path, inode, file_size, mtime_ns FROM file_fingerprints")
+                for row in cursor:
+                    fingerprints[row[0]] = (row[1], row[2], row[3])
+                cursor.close()
+
+        except sqlite3.Error as e:
+            self.logger.error(f"加载文件指纹失败: {e}")
+
+        return fingerprints
+
+    def upsert_fingerprints(self, records: List[Tuple[str, int, int, int, str]]) -> bool:
+        """
+        批量写入或更新文件指纹（单个事务）
+
+        Args:
+            records: (文件路径, inode, 文件大小, mtime_ns, 文件哈希) 列表
+
+        Returns:
+            bool: 写入成功返回True
+        """
+        if not records:
+            return True
+
+        try:
+            with self.lock:
+                if not self.connection:
+                    self.logger.error("数据库未连接")
+                    return False
+
+                self.connection.executemany("""
+                    INSERT INTO file_fingerprints (file_path, inode, file_size, mtime_ns, file_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(file_path) DO UPDATE SET
+                        inode = excluded.inode,
+                        file_size = excluded.file_size,
+                        mtime_ns = excluded.mtime_ns,
+                        file_hash = excluded.file_hash,
+                        updated_at = CURRENT_TIMESTAMP
+                """, records)
+                self.connection.commit()
+                return True
+
+        except sqlite3.Error as e:
+            self.logger.error(f"写入文件指纹失败: {e}")
+            return False
+
+    def delete_fingerprints(self, file_paths: List[str]) -> int:
+        """
+        删除已不存在文件的指纹
+
+        Args:
+            file_paths: 文件路径列表
+
+        Returns:
+            int: 删除的记录数，失败返回-1
+        """
+        if not file_paths:
+            return 0
+
+        try:
+            with self.lock:
+                if not self.connection:
+                    return -1
+
+                cursor = self.connection.cursor()
+                cursor.executemany(
+                    "DELETE FROM file_fingerprints WHERE file_path = ?",
+                    [(path,) for path in file_paths]
+                )
+                deleted_count = cursor.rowcount
+                self.connection.commit()
+                cursor.close()
+                return deleted_count
+
+        except sqlite3.Error as e:
+            self.logger.error(f"删除文件指纹失败: {e}")
+            return -1
+
     def get_statistics(self) -> Dict[str, int]:
         """
         获取数据库统计信息
@@ -452,11 +1371,11 @@ class MediaStatusDB:
         }
         
         try:
-            with self.lock:
-                if not self.connection:
+            with self._read_connection() as conn:
+                if conn is None:
                     return stats
                     
-                cursor = self.connection.cursor()
+                cursor = conn.cursor()
                 cursor.execute("""
                     SELECT 
                         COUNT(*) as total,
@@ -504,6 +1423,15 @@ class MediaStatusDB:
                 """, (days_old,))
                 
                 deleted_count = cursor.rowcount
+                cursor.execute("""
+                    DELETE FROM file_chunk_hashes
+                    WHERE file_path NOT IN (SELECT file_path FROM media_transfer_status)
+                """)
+                for table in ('upload_chunks', 'upload_tasks'):
+                    cursor.execute(f"""
+                        DELETE FROM {table}
+                        WHERE file_path NOT IN (SELECT file_path FROM media_transfer_status)
+                    """)
                 self.connection.commit()
                 cursor.close()
                 
@@ -518,163 +1446,162 @@ class MediaStatusDB:
         """
         获取传输失败的文件列表（重试次数未超过限制）
         
+        结果较多时应使用 iter_failed_files 逐条处理。
+        
         Args:
             max_retry_count: 最大重试次数
             
         Returns:
             List[MediaFileInfo]: 失败文件列表
         """
-        files = []
-        
-        try:
-            with self.lock:
-                if not self.connection:
-                    return files
-                    
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT id, file_path, file_name, file_size, file_hash,
-                           download_status, download_start_time, download_end_time, download_retry_count,
-                           transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
-                           last_error_message, created_at, updated_at
-                    FROM media_transfer_status 
-                    WHERE transfer_status = 'failed' AND transfer_retry_count < ?
-                    ORDER BY updated_at ASC
-                """, (max_retry_count,))
-                
-                rows = cursor.fetchall()
-                for row in rows:
-                    file_info = MediaFileInfo(
-                        id=row['id'],
-                        file_path=row['file_path'],
-                        file_name=row['file_name'],
-                        file_size=row['file_size'],
-                        file_hash=row['file_hash'] or "",
-                        download_status=FileStatus(row['download_status']),
-                        download_start_time=row['download_start_time'] or "",
-                        download_end_time=row['download_end_time'] or "",
-                        download_retry_count=row['download_retry_count'],
-                        transfer_status=FileStatus(row['transfer_status']),
-                        transfer_start_time=row['transfer_start_time'] or "",
-                        transfer_end_time=row['transfer_end_time'] or "",
-                        transfer_retry_count=row['transfer_retry_count'],
-                        last_error_message=row['last_error_message'] or "",
-                        created_at=row['created_at'],
-                        updated_at=row['updated_at']
-                    )
-                    files.append(file_info)
-                    
-                cursor.close()
-                
-        except sqlite3.Error as e:
-            self.logger.error(f"查询失败文件失败: {e}")
-            
-        return files
+        return list(self.iter_failed_files(max_retry_count))
     
-    def get_files_by_status(self, status: str) -> List[Dict[str, any]]:
-        """获取指定状态的文件列表
+    def iter_failed_files(self, max_retry_count: int = 3, page: int = 1000) -> Iterator[MediaFileInfo]:
+        """
+        按更新时间分页逐条返回传输失败的文件（重试次数未超过限制）
         
         Args:
-            status: 文件状态
+            max_retry_count: 最大重试次数
+            page: 每页行数
             
-        Returns:
-            List[Dict]: 文件信息列表
+        Yields:
+            MediaFileInfo: 按 (updated_at, id) 升序的文件记录
         """
-        files = []
-        
-        # 规范化状态入参，支持大小写与别名映射
+        return self._iter_pages(["transfer_status = 'failed'", "transfer_retry_count < ?"], (max_retry_count,),
+                                order_column='updated_at', page=page)
+    
+    @staticmethod
+    def _normalize_status(status) -> str:
+        """规范化状态入参，支持枚举、大小写与别名映射"""
         normalized = (status.value if hasattr(status, 'value') else status or "").strip().lower()
         alias_map = {
             'transferred': 'completed',   # 测试中使用的状态名 -> 数据库状态
             'transferring': 'downloading', # 测试中使用的状态名 -> 数据库状态
             'pending': 'pending'          # 确保 PENDING -> pending 的映射
         }
-        target_status = alias_map.get(normalized, normalized)
+        return alias_map.get(normalized, normalized)
+    
+    @staticmethod
+    def _file_info_to_dict(info: MediaFileInfo) -> Dict[str, any]:
+        """报表使用的文件信息字典"""
+        return {
+            'id': info.id,
+            'file_path': info.file_path,
+            'filename': info.file_name,
+            'file_size': info.file_size,
+            'file_hash': info.file_hash,
+            'download_status': info.download_status.value,
+            'transfer_status': info.transfer_status.value,
+            'created_at': info.created_at,
+            'updated_at': info.updated_at
+        }
+    
+    def iter_files(self, status=None, after_id: int = 0, page: int = 1000,
+                   download_status=None) -> Iterator[MediaFileInfo]:
+        """
+        按 id 键集分页逐条返回文件记录（内存占用与总行数无关）
         
-        try:
-            with self.lock:
-                if not self.connection:
-                    return files
-                    
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT id, file_path, file_name, file_size, file_hash,
-                           download_status, download_start_time, download_end_time, download_retry_count,
-                           transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
-                           last_error_message, created_at, updated_at
-                    FROM media_transfer_status 
-                    WHERE transfer_status = ?
-                    ORDER BY created_at ASC
-                """, (target_status,))
-                
-                rows = cursor.fetchall()
-                for row in rows:
-                    file_dict = {
-                        'id': row['id'],
-                        'file_path': row['file_path'],
-                        'filename': row['file_name'],
-                        'file_size': row['file_size'],
-                        'file_hash': row['file_hash'] or "",
-                        'download_status': row['download_status'],
-                        'transfer_status': row['transfer_status'],
-                        'created_at': row['created_at'],
-                        'updated_at': row['updated_at']
-                    }
-                    files.append(file_dict)
-                    
-                cursor.close()
-                
-        except sqlite3.Error as e:
-            self.logger.error(f"查询状态文件失败: {e}")
+        每页查询 "id > 上一页最后的 id ORDER BY id LIMIT page"，走主键索引；
+        只在取页时借用只读连接，调用方处理记录期间不占用任何连接。
+        
+        Args:
+            status: 传输状态过滤，None 表示全部
+            after_id: 从该 id 之后开始（用于断点续读）
+            page: 每页行数
+            download_status: 下载状态过滤，None 表示全部
             
-        return files
+        Yields:
+            MediaFileInfo: 按 id 升序的文件记录
+        """
+        conditions = []
+        filters = []
+        if status is not None:
+            conditions.append("transfer_status = ?")
+            filters.append(self._normalize_status(status))
+        if download_status is not None:
+            conditions.append("download_status = ?")
+            filters.append(self._normalize_status(download_status))
+        return self._iter_pages(conditions, filters, after_id=after_id, page=page)
+    
+    def _iter_pages(self, conditions: List[str], filters: Iterable, order_column: str = 'id',
+                    after_id: int = 0, page: int = 1000) -> Iterator[MediaFileInfo]:
+        """
+        键集分页查询：每页从上一页最后一行的 (order_column, id) 之后开始，走索引且内存固定
+        
+        各页分别读取，整个迭代不是同一个快照：迭代期间被修改的记录可能被跳过或在新位置再次出现。
+        
+        Args:
+            conditions: WHERE 条件（AND 连接）
+            filters: 条件参数
+            order_column: 排序列，与 id 组成分页键
+            after_id: 从该 id 之后开始（仅 order_column 为 id 时使用）
+            page: 每页行数
+        """
+        conditions = ["file_path != '__INIT_MARKER__'", *conditions]
+        filters = tuple(filters)
+        page = max(1, int(page))
+        if order_column == 'id':
+            key_condition, order_by = "id > ?", "id"
+            last_key: tuple = (after_id,)
+        else:
+            key_condition, order_by = f"({order_column}, id) > (?, ?)", f"{order_column}, id"
+            last_key = None
+        
+        while True:
+            where = conditions if last_key is None else [*conditions, key_condition]
+            sql = f"""
+                SELECT {self.FILE_INFO_COLUMNS}
+                FROM media_transfer_status
+                WHERE {' AND '.join(where)}
+                ORDER BY {order_by}
+                LIMIT ?
+            """
+            try:
+                with self._read_connection() as conn:
+                    if conn is None:
+                        return
+                    rows = conn.execute(sql, (*filters, *(last_key or ()), page)).fetchall()
+            except sqlite3.Error as e:
+                self.logger.error(f"分页查询文件失败: {e}")
+                return
+            
+            for row in rows:
+                yield self._row_to_file_info(row)
+            if len(rows) < page:
+                return
+            last = rows[-1]
+            last_key = (last['id'],) if order_column == 'id' else (last[order_column], last['id'])
+    
+    def iter_file_dicts(self, status=None, after_id: int = 0, page: int = 1000) -> Iterator[Dict[str, any]]:
+        """
+        iter_files 的字典形式（与 get_all_files / get_files_by_status 的字段一致）
+        """
+        for info in self.iter_files(status=status, after_id=after_id, page=page):
+            yield self._file_info_to_dict(info)
+    
+    def get_files_by_status(self, status: str) -> List[Dict[str, any]]:
+        """获取指定状态的文件列表
+        
+        结果较多时应使用 iter_file_dicts(status=...) 逐条处理。
+        
+        Args:
+            status: 文件状态
+            
+        Returns:
+            List[Dict]: 文件信息列表
+        """
+        return list(self.iter_file_dicts(status=status))
     
     def get_all_files(self) -> List[Dict[str, any]]:
         """获取所有文件列表
         
+        按页读取后合并，不是同一时刻的快照：读取期间其他线程写入的记录可能部分可见。
+        结果较多时应使用 iter_file_dicts() 逐条处理。
+        
         Returns:
             List[Dict]: 文件信息列表
         """
-        files = []
-        
-        try:
-            with self.lock:
-                if not self.connection:
-                    return files
-                    
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT id, file_path, file_name, file_size, file_hash,
-                           download_status, download_start_time, download_end_time, download_retry_count,
-                           transfer_status, transfer_start_time, transfer_end_time, transfer_retry_count,
-                           last_error_message, created_at, updated_at
-                    FROM media_transfer_status 
-                    WHERE file_path != '__INIT_MARKER__'
-                    ORDER BY created_at ASC
-                """)
-                
-                rows = cursor.fetchall()
-                for row in rows:
-                    file_dict = {
-                        'id': row['id'],
-                        'file_path': row['file_path'],
-                        'filename': row['file_name'],
-                        'file_size': row['file_size'],
-                        'file_hash': row['file_hash'] or "",
-                        'download_status': row['download_status'],
-                        'transfer_status': row['transfer_status'],
-                        'created_at': row['created_at'],
-                        'updated_at': row['updated_at']
-                    }
-                    files.append(file_dict)
-                    
-                cursor.close()
-                
-        except sqlite3.Error as e:
-            self.logger.error(f"查询所有文件失败: {e}")
-            
-        return files
-
+        return list(self.iter_file_dicts())
 
 def main():
     """测试函数"""
@@ -687,11 +1614,9 @@ def main():
             stats = db.get_statistics()
             print(f"数据库统计: {stats}")
             
-            # 获取待传输文件
-            files = db.get_ready_to_transfer_files()
-            print(f"待传输文件数量: {len(files)}")
-            
-            for file_info in files[:5]:  # 只显示前5个
+            # 获取待传输文件（逐页读取，只显示前5个）
+            files = db.iter_files(status='pending', download_status='completed', page=100)
+            for file_info in itertools.islice(files, 5):
                 print(f"  - {file_info.file_name} ({file_info.file_size} bytes)")
 
 
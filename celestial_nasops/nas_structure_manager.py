@@ -27,12 +27,169 @@ NAS端目录结构管理器
 import os
 import sys
 import json
+import time
 import logging
+import threading
 import subprocess
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
+from ssh_connection_pool import get_ssh_pool, SSHConnectionPool
+from remote_inventory import RemoteInventory, scan_remote_inventory
+
+class RemoteDirectoryCache:
+    """进程内远程目录存在性缓存
+    
+    记录已确认存在的远程目录（带 TTL），使每个日期目录每天只确认一次，
+    而不是每个文件都执行 test -d / mkdir -p。
+    批量预取（find -maxdepth N -type d）得到的是完整快照，在快照有效期内
+    也可以确认某目录"不存在"。
+    """
+    
+    def __init__(self, ttl_seconds: int = 86400):
+        """初始化缓存
+        
+        Args:
+            ttl_seconds: 目录存在记录的有效期（秒）
+        """
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], float] = {}
+        self._snapshots: Dict[Tuple[str, str], Tuple[int, float]] = {}
+    
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return os.path.normpath(path)
+    
+    def contains(self, target: str, path: str) -> bool:
+        """目录是否已确认存在（且未过期）"""
+        key = (target, self._normalize(path))
+        with self._lock:
+            confirmed_at = self._entries.get(key)
+            if confirmed_at is None:
+                return False
+            if time.time() - confirmed_at > self.ttl_seconds:
+                del self._entries[key]
+                return False
+            return True
+    
+    def add(self, target: str, path: str):
+        """记录目录（及其所有上级目录）存在"""
+        self.add_many(target, [path])
+    
+    def add_many(self, target: str, paths: List[str]):
+        """批量记录目录存在"""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                path = self._normalize(path)
+                while path and path != os.path.dirname(path):
+                    self._entries[(target, path)] = now
+                    path = os.path.dirname(path)
+    
+    def invalidate(self, target: str, path: str = None):
+        """使缓存失效（传输失败时调用，目录可能已被删除）
+        
+        Args:
+            target: SSH 目标
+            path: 目录路径，None 表示清空该目标的全部记录
+        """
+        with self._lock:
+            if path is None:
+                self._entries = {key: value for key, value in self._entries.items() if key[0] != target}
+                self._snapshots = {key: value for key, value in self._snapshots.items() if key[0] != target}
+            else:
+                self._entries.pop((target, self._normalize(path)), None)
+                self._snapshots.clear()
+    
+    def known_absent(self, target: str, path: str) -> bool:
+        """根据有效的预取快照判断目录确定不存在"""
+        path = self._normalize(path)
+        now = time.time()
+        with self._lock:
+            for (snapshot_target, base), (max_depth, taken_at) in self._snapshots.items():
+                if snapshot_target != target or now - taken_at > self.ttl_seconds:
+                    continue
+                relative = os.path.relpath(path, base)
+                if relative.startswith('..'):
+                    continue
+                depth = 0 if relative == '.' else relative.count(os.sep) + 1
+                if depth <= max_depth:
+                    return (target, path) not in self._entries
+        return False
+    
+    def ensure(self, pool: SSHConnectionPool, path: str, timeout: int = 30) -> Tuple[bool, str]:
+        """确保远程目录存在：缓存命中时不发起远程调用，否则执行一次 mkdir -p
+        
+        Args:
+            pool: SSH 连接池
+            path: 远程目录
+            timeout: 超时时间（秒）
+            
+        Returns:
+            (是否可用, 错误信息)
+        """
+        if self.contains(pool.target, path):
+            return True, ''
+        
+        result = pool.run(f"mkdir -p '{path}'", timeout=timeout)
+        if result.returncode != 0:
+            return False, result.stderr
+        
+        self.add(pool.target, path)
+        return True, ''
+    
+    def prefetch(self, pool: SSHConnectionPool, base_path: str, max_depth: int = 3, timeout: int = 60) -> int:
+        """一次远程 find 预取 base_path 下的全部目录
+        
+        Args:
+            pool: SSH 连接池
+            base_path: 远程基础路径
+            max_depth: 最大深度（年/月/日 为 3）
+            timeout: 超时时间（秒）
+            
+        Returns:
+            int: 预取到的目录数量，失败返回-1
+        """
+        result = pool.run(f"find '{base_path}' -maxdepth {max_depth} -type d 2>/dev/null", timeout=timeout)
+        if result.returncode != 0 and not result.stdout:
+            return -1
+        
+        directories = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        self.record_snapshot(pool.target, base_path, directories, max_depth)
+        return len(directories)
+    
+    def record_snapshot(self, target: str, base_path: str, directories: List[str], max_depth: int):
+        """记录 base_path 下 max_depth 深度内的完整目录快照
+        
+        Args:
+            target: SSH 目标
+            base_path: 远程基础路径
+            directories: 快照中的全部目录（绝对路径）
+            max_depth: 快照覆盖的深度
+        """
+        base = self._normalize(base_path)
+        with self._lock:
+            # 新快照替换旧记录，避免已删除的目录残留
+            self._entries = {
+                key: value for key, value in self._entries.items()
+                if key[0] != target or os.path.relpath(key[1], base).startswith('..')
+            }
+        self.add_many(target, directories)
+        with self._lock:
+            self._snapshots[(target, base)] = (max_depth, time.time())
+
+
+# 进程内共享的远程目录缓存
+_remote_dir_cache = RemoteDirectoryCache()
+
+
+def get_remote_dir_cache() -> RemoteDirectoryCache:
+    """获取进程内共享的远程目录缓存"""
+    return _remote_dir_cache
+
+
 class NASStructureManager:
     """NAS目录结构管理器"""
     
@@ -52,6 +209,16 @@ class NASStructureManager:
         # 新增：SSH 别名，来自 unified_config.json 的 nas_settings.ssh_alias
         self.nas_alias = (self.config.get('nas_settings', {}) or {}).get('ssh_alias', 'nas-edge')
         
+        # 远程目录存在性缓存（进程内共享）
+        self.dir_cache = get_remote_dir_cache()
+        cache_ttl = (self.config.get('nas_settings', {}) or {}).get('dir_cache_ttl_seconds')
+        if cache_ttl:
+            self.dir_cache.ttl_seconds = cache_ttl
+        
+        # 远程目录清单（一次 find 建立的按日期索引），在有效期内复用
+        self.inventory_max_age = (self.config.get('nas_settings', {}) or {}).get('inventory_max_age_seconds', 300)
+        self._inventory: Optional[RemoteInventory] = None
+        
         # 日期格式配置
         # 兼容旧字段 file_organization 与新字段 file_organization/enable_date_structure
         if 'file_organization' in self.config:
@@ -140,6 +307,11 @@ class NASStructureManager:
         
         return logging.getLogger('NASStructureManager')
     
+    def _ssh_pool(self) -> SSHConnectionPool:
+        """获取共享的 SSH 复用连接（优先使用别名）"""
+        ssh_target = self.nas_alias if getattr(self, 'nas_alias', None) else f'{self.nas_username}@{self.nas_host}'
+        return get_ssh_pool(ssh_target)
+    
     def _execute_remote_command(self, command: str) -> Tuple[bool, str, str]:
         """在NAS上执行远程命令
         
@@ -149,20 +321,8 @@ class NASStructureManager:
         Returns:
             (成功标志, 标准输出, 错误输出)
         """
-        ssh_target = self.nas_alias if getattr(self, 'nas_alias', None) else f'{self.nas_username}@{self.nas_host}'
-        ssh_command = [
-            'ssh',
-            ssh_target,
-            command
-        ]
-        
         try:
-            result = subprocess.run(
-                ssh_command,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            result = self._ssh_pool().run(command, timeout=30)
             
             success = result.returncode == 0
             return success, result.stdout, result.stderr
@@ -222,6 +382,7 @@ class NASStructureManager:
         success, stdout, stderr = self._execute_remote_command(command)
         
         if success:
+            self.dir_cache.add(self._ssh_pool().target, remote_path)
             self.logger.info(f"成功创建目录: {remote_path}")
         else:
             self.logger.error(f"创建目录失败: {remote_path}, 错误: {stderr}")
@@ -238,13 +399,20 @@ class NASStructureManager:
             目录存在标志
         """
         remote_path = self.get_full_remote_path(file_date)
+        target = self._ssh_pool().target
+        
+        if self.dir_cache.contains(target, remote_path):
+            return True
+        if self.dir_cache.known_absent(target, remote_path):
+            return False
         
         # 检查目录是否存在
         command = f"test -d '{remote_path}' && echo 'exists' || echo 'not_exists'"
         
         success, stdout, stderr = self._execute_remote_command(command)
         
-        if success and 'exists' in stdout:
+        if success and stdout.strip() == 'exists':
+            self.dir_cache.add(target, remote_path)
             return True
         else:
             return False
@@ -258,10 +426,59 @@ class NASStructureManager:
         Returns:
             目录可用标志
         """
-        if self.verify_directory_exists(file_date):
-            return True
+        remote_path = self.get_full_remote_path(file_date)
+        
+        # 缓存命中时无需远程调用；否则一次幂等的 mkdir -p 代替 test -d + mkdir -p
+        try:
+            success, stderr = self.dir_cache.ensure(self._ssh_pool(), remote_path)
+        except subprocess.TimeoutExpired:
+            success, stderr = False, '命令执行超时'
+        
+        if not success:
+            self.logger.error(f"创建目录失败: {remote_path}, 错误: {stderr}")
+        return success
+    
+    def prefetch_directories(self, max_depth: int = 3) -> int:
+        """一次远程 find 预取基础路径下的全部年/月/日目录到缓存
+        
+        Args:
+            max_depth: 最大深度
+            
+        Returns:
+            int: 预取到的目录数量，失败返回-1
+        """
+        try:
+            count = self.dir_cache.prefetch(self._ssh_pool(), self.nas_base_path, max_depth)
+        except subprocess.TimeoutExpired:
+            count = -1
+        
+        if count < 0:
+            self.logger.warning(f"预取远程目录失败: {self.nas_base_path}")
         else:
-            return self.create_date_directory(file_date)
+            self.logger.info(f"已预取 {count} 个远程目录: {self.nas_base_path}")
+        return count
+    
+    def get_inventory(self, refresh: bool = False) -> Optional[RemoteInventory]:
+        """获取远程目录清单（一次 find 建立的按日期索引）
+        
+        Args:
+            refresh: 忽略有效期，强制重新扫描
+            
+        Returns:
+            RemoteInventory: 清单，扫描失败返回None
+        """
+        if not refresh and self._inventory is not None and self._inventory.age() < self.inventory_max_age:
+            return self._inventory
+        
+        pool = self._ssh_pool()
+        inventory = scan_remote_inventory(pool, self.nas_base_path, logger=self.logger)
+        if inventory is not None:
+            self._inventory = inventory
+            if inventory.complete:
+                # 完整清单同时作为目录存在性快照
+                self.dir_cache.record_snapshot(pool.target, self.nas_base_path,
+                                               inventory.absolute_directories(), max_depth=2 ** 31)
+        return inventory
     
     def list_directory_structure(self, start_date: datetime = None, end_date: datetime = None) -> List[Dict]:
         """列出目录结构
@@ -280,12 +497,26 @@ class NASStructureManager:
         
         directories = []
         
+        # 一次远程 find 建立清单，之后按日期直接查索引
+        inventory = self.get_inventory()
+        if inventory is None:
+            # 清单不可用时回退为按日期查询：先一次预取目录，再逐个统计文件数
+            self.prefetch_directories()
+        
         # 遍历日期范围
         current_date = start_date
         while current_date <= end_date:
             remote_path = self.get_full_remote_path(current_date)
             
-            if self.verify_directory_exists(current_date):
+            if inventory is not None:
+                stats = inventory.directory_stats(self.get_date_path(current_date))
+                directories.append({
+                    'date': current_date.strftime('%Y-%m-%d'),
+                    'path': remote_path,
+                    'exists': stats is not None,
+                    'file_count': stats.entry_count if stats else 0
+                })
+            elif self.verify_directory_exists(current_date):
                 # 获取目录信息
                 command = f"ls -la '{remote_path}' 2>/dev/null | wc -l"
                 success, stdout, stderr = self._execute_remote_command(command)
@@ -321,6 +552,13 @@ class NASStructureManager:
         Returns:
             目录大小（字节），失败返回None
         """
+        inventory = self.get_inventory()
+        if inventory is not None:
+            date_path = self.get_date_path(file_date)
+            if not inventory.has_directory(date_path):
+                return None
+            return inventory.subtree_stats(date_path).total_bytes
+        
         remote_path = self.get_full_remote_path(file_date)
         
         # 获取目录大小
@@ -385,11 +623,13 @@ class NASStructureManager:
         }
         
         try:
-            # 检查基础路径是否存在
-            command = f"test -d '{self.nas_base_path}' && echo 'exists' || echo 'not_exists'"
-            success, stdout, stderr = self._execute_remote_command(command)
+            # 一次远程 find 刷新清单，存在性、大小和数量均由清单得出
+            inventory = self.get_inventory(refresh=True)
+            if inventory is None:
+                validation_result['errors'].append(f"获取远程目录清单失败: {self.nas_base_path}")
+                return validation_result
             
-            if success and 'exists' in stdout:
+            if inventory.base_exists:
                 validation_result['base_path_exists'] = True
             else:
                 validation_result['errors'].append(f"基础路径不存在: {self.nas_base_path}")
@@ -405,21 +645,12 @@ class NASStructureManager:
             else:
                 validation_result['errors'].append(f"基础路径不可写: {self.nas_base_path}")
             
-            # 获取总大小
-            size = self.get_directory_size()
-            if size is not None:
-                validation_result['total_size'] = size
-            
-            # 统计目录和文件数量
-            command = f"find '{self.nas_base_path}' -type d 2>/dev/null | wc -l"
-            success, stdout, stderr = self._execute_remote_command(command)
-            if success and stdout.strip().isdigit():
-                validation_result['directory_count'] = int(stdout.strip())
-            
-            command = f"find '{self.nas_base_path}' -type f 2>/dev/null | wc -l"
-            success, stdout, stderr = self._execute_remote_command(command)
-            if success and stdout.strip().isdigit():
-                validation_result['file_count'] = int(stdout.strip())
+            # 总大小、目录和文件数量
+            validation_result['total_size'] = inventory.total_bytes
+            validation_result['directory_count'] = inventory.directory_count
+            validation_result['file_count'] = inventory.file_count
+            if not inventory.complete:
+                validation_result['errors'].append("部分目录无法读取，统计结果可能不完整")
             
         except Exception as e:
             validation_result['errors'].append(f"验证过程异常: {str(e)}")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传带宽限制 - 全局令牌桶 + 分时段限速
+
+功能说明：
+1. 进程内所有并发传输共享一个带宽上限（dock_transfer_config.performance.bandwidth_limit_mbps），
+   避免批量上传占满机场同时用于实时遥测的上行链路
+2. 分时段限速：按一天中的时间窗口使用不同上限（如夜间不限速、作业时段限速），跨零点的窗口同样支持
+3. rsync 传输在开始时从上限中预留一份带宽（上限 / 并发传输数），通过 --bwlimit 传给该进程，
+   各进程的限速之和不会超过上限
+4. Python 流式发送使用令牌桶（consume），可用速率为上限减去 rsync 已预留的部分，随时段变化实时调整
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+
+def mbps_to_bytes(mbps: float) -> float:
+    """Mbit/s 转换为 字节/秒"""
+    return mbps * 1000 * 1000 / 8
+
+
+def _parse_minutes(text: str) -> int:
+    """解析 HH:MM 为一天中的分钟数
+
+    Raises:
+        ValueError: 格式错误
+    """
+    hours, minutes = text.strip().split(':')
+    value = int(hours) * 60 + int(minutes)
+    if not 0 <= value <= 24 * 60:
+        raise ValueError(f"无效的时间: {text}")
+    return value
+
+
+class BandwidthSchedule:
+    """分时段带宽上限"""
+
+    def __init__(self, default_mbps: float = 0, windows: Iterable[Dict] = ()):
+        """初始化分时段上限
+
+        Args:
+            default_mbps: 不在任何时间窗口内时的上限（Mbit/s），0 表示不限速
+            windows: 时间窗口列表，如 [{"start": "08:00", "end": "18:00", "limit_mbps": 20}]，
+                     end 早于 start 表示跨零点；多个窗口重叠时使用先列出的窗口
+
+        Raises:
+            ValueError: 时间窗口配置错误
+        """
+        self.default_mbps = float(default_mbps or 0)
+        self.windows: List[Tuple[int, int, float]] = []
+        for window in windows:
+            try:
+                self.windows.append((_parse_minutes(window['start']), _parse_minutes(window['end']),
+                                     float(window.get('limit_mbps', 0) or 0)))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"无效的限速时间窗口 {window}: {e}") from e
+
+    def limit_mbps(self, now: datetime = None) -> float:
+        """指定时刻的上限（Mbit/s），0 表示不限速"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, limit in self.windows:
+            if start <= end:
+                inside = start <= minute < end
+            else:
+                inside = minute >= start or minute < end
+            if inside:
+                return limit
+        return self.default_mbps
+
+
+class BandwidthLimiter:
+    """进程内共享的上传带宽限制器"""
+
+    def __init__(self,
+                 schedule: BandwidthSchedule = None,
+                 streams: int = 1,
+                 clock=time.monotonic,
+                 now=datetime.now,
+                 sleep=time.sleep):
+        """初始化限制器
+
+        Args:
+            schedule: 分时段上限，None 表示不限速
+            streams: 并发传输数，每个 rsync 进程预留 上限/streams 的带宽
+            clock: 单调时钟（测试可替换）
+            now: 当前时间（用于分时段，测试可替换）
+            sleep: 休眠函数（测试可替换）
+        """
+        self.schedule = schedule or BandwidthSchedule()
+        self.streams = max(1, int(streams))
+        self._clock = clock
+        self._now = now
+        self._sleep = sleep
+        self.logger = logging.getLogger('BandwidthLimiter')
+
+        self._lock = threading.Lock()
+        self._reserved = 0.0           # rsync 进程已预留的带宽（字节/秒）
+        self._tokens = 0.0
+        self._last_refill = clock()
+
+    def limit_bytes(self) -> float:
+        """当前上限（字节/秒），0 表示不限速"""
+        return mbps_to_bytes(self.schedule.limit_mbps(self._now()))
+
+    def _stream_share(self, limit: float) -> float:
+        return limit / self.streams
+
+    @contextmanager
+    def rsync_stream(self):
+        """为一次 rsync 调用预留带宽
+
+        Yields:
+            List[str]: rsync 参数（不限速时为空列表）
+        """
+        limit = self.limit_bytes()
+        if limit <= 0:
+            yield []
+            return
+
+        share = self._stream_share(limit)
+        with self._lock:
+            self._reserved += share
+        self.logger.debug(f"rsync 限速 {share * 8 / 1000 / 1000:.2f} Mbit/s（上限 {limit * 8 / 1000 / 1000:.2f} Mbit/s）")
+        try:
+            # rsync --bwlimit 的单位为 KiB/s
+            yield [f"--bwlimit={max(1, int(share / 1024))}"]
+        finally:
+            with self._lock:
+                self._reserved = max(0.0, self._reserved - share)
+
+    def consume(self, nbytes: int):
+        """从令牌桶取出 nbytes 字节的发送额度，额度不足时阻塞到补足为止
+
+        令牌按 上限 - rsync 已预留带宽 的速率补充，桶容量为 1 秒的可用带宽。
+        额度先扣除（允许为负），再按欠额休眠，多个发送者按调用顺序排队。
+
+        Args:
+            nbytes: 即将发送的字节数
+        """
+        limit = self.limit_bytes()
+        if limit <= 0:
+            return
+        with self._lock:
+            rate = max(limit - self._reserved, self._stream_share(limit))
+            now = self._clock()
+            self._tokens = min(rate, self._tokens + (now - self._last_refill) * rate)
+            self._last_refill = now
+            self._tokens -= nbytes
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+远程目录清单 - 一次远程 find 建立 NAS 目录的内存索引
+
+功能说明：
+1. 通过复用的 SSH 连接执行一次 find -printf '%y %s %T@ %p\n'，
+   逐行流式读取输出（不在远端或本地整体缓冲）
+2. 按目录（相对基础路径，如 2026/10/16）统计文件数、字节数和直接子项数，
+   即按日期的索引
+3. 保留文件列表（路径、大小、修改时间），供存储清理按规则在内存中筛选
+4. 目录结构报告、结构验证和存储管理共用同一份清单，
+   统计一年的数据只需一次 SSH 会话
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import time
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from ssh_connection_pool import SSHConnectionPool
+
+FIND_PRINTF_FORMAT = r"%y %s %T@ %p\n"
+
+
+@dataclass
+class DirectoryStats:
+    """目录统计信息"""
+    file_count: int = 0      # 直接包含的文件数
+    total_bytes: int = 0     # 直接包含的文件字节数
+    entry_count: int = 0     # 直接子项数（文件和子目录）
+    latest_mtime: float = 0.0
+
+
+@dataclass
+class RemoteFileEntry:
+    """远程文件条目"""
+    path: str
+    size: int
+    mtime: float
+
+
+class RemoteInventory:
+    """远程目录清单（内存索引）"""
+
+    def __init__(self, base_path: str):
+        """初始化清单
+
+        Args:
+            base_path: 远程基础路径
+        """
+        self.base_path = os.path.normpath(base_path)
+        self.base_exists = False
+        self.complete = False
+        self.scanned_at = time.time()
+        # 相对基础路径的目录 -> 统计信息（基础路径自身为 ''）
+        self.directories: Dict[str, DirectoryStats] = {}
+        self.files: List[RemoteFileEntry] = []
+
+    def _relative(self, path: str) -> Optional[str]:
+        """远程绝对路径转为相对基础路径，不在基础路径下返回None"""
+        if path == self.base_path:
+            return ''
+        prefix = self.base_path.rstrip('/') + '/'
+        if path.startswith(prefix):
+            return path[len(prefix):]
+        return None
+
+    def add_line(self, line: str):
+        """解析一行 find -printf 输出并加入索引
+
+        Args:
+            line: 形如 "f 1024 1760000000.0000000000 /path/to/file" 的输出行
+        """
+        parts = line.rstrip('\n').split(' ', 3)
+        if len(parts) != 4:
+            return
+
+        type_char, size_text, mtime_text, path = parts
+        relative = self._relative(path)
+        if relative is None:
+            return
+
+        try:
+            size = int(size_text)
+            mtime = float(mtime_text)
+        except ValueError:
+            return
+
+        if type_char == 'd':
+            self.directories.setdefault(relative, DirectoryStats())
+            if relative == '':
+                self.base_exists = True
+                return
+        elif type_char != 'f':
+            return
+
+        parent = os.path.dirname(relative)
+        stats = self.directories.setdefault(parent, DirectoryStats())
+        stats.entry_count += 1
+
+        if type_char == 'f':
+            stats.file_count += 1
+            stats.total_bytes += size
+            stats.latest_mtime = max(stats.latest_mtime, mtime)
+            self.files.append(RemoteFileEntry(path, size, mtime))
+
+    def age(self) -> float:
+        """清单距扫描时的秒数"""
+        return time.time() - self.scanned_at
+
+    def has_directory(self, relative_path: str) -> bool:
+        """目录是否存在"""
+        return relative_path.strip('/') in self.directories
+
+    def directory_stats(self, relative_path: str) -> Optional[DirectoryStats]:
+        """目录自身（不含子目录）的统计信息，不存在返回None"""
+        return self.directories.get(relative_path.strip('/'))
+
+    def subtree_stats(self, relative_path: str = '') -> DirectoryStats:
+        """目录及其全部子目录的汇总统计信息
+
+        Args:
+            relative_path: 相对基础路径的目录，'' 表示整个基础路径
+
+        Returns:
+            DirectoryStats: 汇总统计
+        """
+        relative_path = relative_path.strip('/')
+        prefix = relative_path + '/' if relative_path else ''
+        total = DirectoryStats()
+        for directory, stats in self.directories.items():
+            if directory == relative_path or directory.startswith(prefix):
+                total.file_count += stats.file_count
+                total.total_bytes += stats.total_bytes
+                total.entry_count += stats.entry_count
+                total.latest_mtime = max(total.latest_mtime, stats.latest_mtime)
+        return total
+
+    @property
+    def directory_count(self) -> int:
+        """目录总数（含基础路径）"""
+        return len(self.directories)
+
+    @property
+    def file_count(self) -> int:
+        """文件总数"""
+        return len(self.files)
+
+    @property
+    def total_bytes(self) -> int:
+        """文件总字节数"""
+        return sum(entry.size for entry in self.files)
+
+    def absolute_directories(self) -> List[str]:
+        """全部目录的远程绝对路径"""
+        return [os.path.join(self.base_path, directory) if directory else self.base_path
+                for directory in self.directories]
+
+    def iter_files(self) -> Iterator[RemoteFileEntry]:
+        """遍历全部文件条目"""
+        return iter(self.files)
+
+    def remove_files(self, paths: List[str]):
+        """从清单中移除已删除的文件（同步更新目录统计）
+
+        Args:
+            paths: 远程文件路径列表
+        """
+        removed = set(paths)
+        if not removed:
+            return
+
+        remaining = []
+        for entry in self.files:
+            if entry.path not in removed:
+                remaining.append(entry)
+                continue
+            relative = self._relative(entry.path)
+            stats = self.directories.get(os.path.dirname(relative)) if relative is not None else None
+            if stats:
+                stats.file_count -= 1
+                stats.total_bytes -= entry.size
+                stats.entry_count -= 1
+        self.files = remaining
+
+
+def scan_remote_inventory(pool: SSHConnectionPool,
+                          base_path: str,
+                          timeout: float = 600,
+                          logger: logging.Logger = None) -> Optional[RemoteInventory]:
+    """执行一次远程 find，流式建立目录清单
+
+    Args:
+        pool: SSH 连接池
+        base_path: 远程基础路径
+        timeout: 整体超时时间（秒），超时终止远程命令
+        logger: 日志记录器
+
+    Returns:
+        RemoteInventory: 清单，连接失败或超时返回None
+    """
+    logger = logger or logging.getLogger('RemoteInventory')
+    inventory = RemoteInventory(base_path)
+    command = f"find '{inventory.base_path}' -printf '{FIND_PRINTF_FORMAT}' 2>/dev/null"
+
+    try:
+        process = pool.popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            errors='replace'
+        )
+    except OSError as e:
+        logger.error(f"启动远程目录清单扫描失败: {e}")
+        return None
+
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.daemon = True
+    timer.start()
+    try:
+        for line in process.stdout:
+            inventory.add_line(line)
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        returncode = process.wait()
+
+    if timed_out.is_set():
+        logger.error(f"远程目录清单扫描超时: {base_path}")
+        return None
+    if returncode == 255 and not inventory.directories:
+        logger.error(f"远程目录清单扫描失败（SSH连接错误）: {base_path}")
+        return None
+
+    # find 遇到无权限目录时返回非零，但已输出的部分仍然有效
+    inventory.complete = returncode == 0
+    inventory.scanned_at = time.time()
+    logger.info(f"远程目录清单: {inventory.directory_count} 个目录, {inventory.file_count} 个文件")
+    return inventory
@@ -5,53 +5,32 @@
 
 功能说明：
 1. 替换立即删除为延迟删除，提高数据安全性
-2. 在删除前验证远程文件完整性
-3. 支持删除任务的持久化存储
+2. 在删除前验证远程文件完整性（到期任务在一次 SSH 会话中批量验证）
+3. 支持删除任务的持久化存储（SQLite 表，按计划时间索引，旧的 JSON 任务文件只导入一次）
 4. 提供删除任务的管理和监控功能
 5. 支持批量处理和错误恢复
+6. 内存最小堆按计划时间调度：只弹出到期任务，重试按指数退避重新入堆，
+   调用方可等待到下一个任务到期（next_due_in / wait_for_due），无需轮询；
+   队列中最早的任务早于堆顶时（如其他进程加入的任务）从数据库重建调度堆
 
 作者: Celestial
 日期: 2024-01-22
 """
 
 import os
-import json
 import time
-import hashlib
+import heapq
+import threading
 import subprocess
 import logging
 import logging.handlers
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
-from dataclasses import dataclass, asdict
 
-@dataclass
-class DeleteTask:
-    """删除任务数据类"""
-    local_file_path: str          # 本地文件路径
-    remote_file_path: str         # 远程文件路径
-    local_checksum: str           # 本地文件校验和
-    scheduled_time: float         # 计划删除时间（时间戳）
-    retry_count: int = 0          # 重试次数
-    max_retries: int = 3          # 最大重试次数
-    created_time: float = None    # 创建时间
-    
-    def __post_init__(self):
-        if self.created_time is None:
-            self.created_time = time.time()
-    
-    def is_ready_for_deletion(self) -> bool:
-        """检查是否可以执行删除"""
-        return time.time() >= self.scheduled_time
-    
-    def should_retry(self) -> bool:
-        """检查是否应该重试"""
-        return self.retry_count < self.max_retries
-    
-    def increment_retry(self):
-        """增加重试次数"""
-        self.retry_count += 1
+from ssh_connection_pool import get_ssh_pool
+from file_hasher import get_file_hasher
+from delete_queue import DeleteQueue, DeleteTask
 
 class SafeDeleteManager:
     """安全删除管理器
@@ -59,28 +38,51 @@ class SafeDeleteManager:
     实现延迟删除机制，确保文件在远程验证成功后才删除本地副本
     """
     
+    # 批量验证的远程状态
+    REMOTE_MISSING = 'missing'
+    REMOTE_EXISTS = 'exists'
+    REMOTE_ERROR = 'error'
+    
+    # 等待期间至少每隔多少秒检查一次队列（发现其他进程加入的更早任务）
+    HEAP_SYNC_INTERVAL = 60
+    
+    # 批量验证命令：标准输入为 NUL 分隔的 "标记+路径"（C 需要校验和，E 只检查存在）
+    REMOTE_VERIFY_COMMAND = (
+        "xargs -0 -r sh -c '"
+        "for a; do f=${a#?}; "
+        "if [ ! -f \"$f\" ]; then echo missing; continue; fi; "
+        "case $a in C*) h=$(md5sum < \"$f\" 2>/dev/null) && echo \"${h%% *}\" || echo error ;; "
+        "*) echo exists ;; esac; "
+        "done' sh"
+    )
+    
     def __init__(self, 
                  nas_host: str = "192.168.200.103",
                  nas_username: str = "edge_sync",
                  delay_minutes: int = 30,
                  pending_file: str = None,
                  enable_checksum: bool = True,
-                 nas_alias: str = "nas-edge"):
+                 nas_alias: str = "nas-edge",
+                 status_db=None,
+                 queue_db: str = None):
         """初始化安全删除管理器
         
         Args:
             nas_host: NAS主机地址
             nas_username: NAS用户名
             delay_minutes: 延迟删除时间（分钟）
-            pending_file: 待删除任务文件路径
+            pending_file: 旧的待删除任务 JSON 文件路径（存在时一次性导入队列）
             enable_checksum: 是否启用校验和验证
             nas_alias: SSH 别名（优先使用，来自 /home/celestial/.ssh/config 的 Host 配置）
+            status_db: MediaStatusDB 实例（可选），用于复用登记时保存的文件摘要
+            queue_db: 删除队列数据库路径，默认与 pending_file 同名的 .db 文件
         """
         self.nas_host = nas_host
         self.nas_username = nas_username
         self.delay_minutes = delay_minutes
         self.enable_checksum = enable_checksum
         self.nas_alias = nas_alias
+        self.status_db = status_db
         
         # 设置待删除任务文件路径
         if pending_file is None:
@@ -91,8 +93,18 @@ class SafeDeleteManager:
         # 设置日志
         self.logger = self._setup_logger()
         
-        # 加载待删除任务
-        self.pending_deletes: List[DeleteTask] = self._load_pending_deletes()
+        # 打开删除队列，并导入旧的 JSON 任务文件（已导入的文件由队列中的导入记录跳过）
+        self.queue_db = queue_db or os.path.splitext(self.pending_file)[0] + '.db'
+        self.queue = DeleteQueue(self.queue_db)
+        if self.queue.migrate_json(self.pending_file) < 0:
+            self.logger.error(f"旧的待删除任务文件导入失败，其中的任务暂未调度，下次启动时重试: {self.pending_file}")
+        
+        # 调度堆：(计划时间, 任务ID)，新的最早任务入堆时唤醒等待者
+        self._heap: List[Tuple[float, int]] = self.queue.schedule_entries()
+        heapq.heapify(self._heap)
+        self._heap_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
         
         self.logger.info(f"SafeDeleteManager初始化完成，延迟删除时间: {delay_minutes}分钟，SSH目标优先使用别名: {self.nas_alias}")
     
@@ -184,21 +196,16 @@ class SafeDeleteManager:
                 scheduled_time=scheduled_time
             )
             
-            # 添加到待删除列表
-            self.pending_deletes.append(delete_task)
-            
-            # 保存到文件
-            if self._save_pending_deletes():
+            # 追加到删除队列并加入调度堆
+            if self.queue.add(delete_task):
+                self._push(delete_task)
                 scheduled_datetime = datetime.fromtimestamp(scheduled_time)
                 self.logger.info(
                     f"已安排延迟删除: {os.path.basename(local_file_path)} "
                     f"(计划时间: {scheduled_datetime.strftime('%Y-%m-%d %H:%M:%S')})"
                 )
                 return True
-            else:
-                # 保存失败，从列表中移除
-                self.pending_deletes.remove(delete_task)
-                return False
+            return False
                 
         except Exception as e:
             self.logger.error(f"安排删除任务失败: {local_file_path}, 错误: {e}")
@@ -210,24 +217,28 @@ class SafeDeleteManager:
         Returns:
             (成功删除数量, 失败删除数量)
         """
-        if not self.pending_deletes:
-            self.logger.debug("没有待处理的删除任务")
+        # 从调度堆弹出到期任务，按ID读取（已被清理的任务自动忽略）
+        self._sync_heap()
+        ready_tasks = self.queue.get_by_ids(self._pop_due())
+        if not ready_tasks:
+            self.logger.debug("没有到期的删除任务")
             return 0, 0
         
         success_count = 0
         failed_count = 0
         completed_tasks = []
+        retried_tasks = []
+        
+        self.logger.info(f"开始处理 {len(ready_tasks)} 个到期的删除任务")
         
-        self.logger.info(f"开始处理 {len(self.pending_deletes)} 个待删除任务")
+        # 到期任务在一次 SSH 会话中批量验证远程文件
+        remote_status = self._verify_remote_batch(
+            [task for task in ready_tasks if os.path.exists(task.local_file_path)])
         
-        for task in self.pending_deletes[:]:
+        for task in ready_tasks:
             try:
-                # 检查是否到达删除时间
-                if not task.is_ready_for_deletion():
-                    continue
-                
-                # 执行删除验证和删除
-                if self._verify_and_delete(task):
+                # 按批量验证结果删除本地文件
+                if self._delete_verified(task, remote_status):
                     success_count += 1
                     completed_tasks.append(task)
                     self.logger.info(f"成功删除文件: {os.path.basename(task.local_file_path)}")
@@ -238,6 +249,7 @@ class SafeDeleteManager:
                         # 延长重试时间（指数退避）
                         retry_delay = min(60 * (2 ** task.retry_count), 3600)  # 最大1小时
                         task.scheduled_time = time.time() + retry_delay
+                        retried_tasks.append(task)
                         self.logger.warning(
                             f"删除失败，安排重试 ({task.retry_count}/{task.max_retries}): "
                             f"{os.path.basename(task.local_file_path)}"
@@ -255,26 +267,116 @@ class SafeDeleteManager:
                 failed_count += 1
                 completed_tasks.append(task)
         
-        # 移除已完成的任务
-        for task in completed_tasks:
-            if task in self.pending_deletes:
-                self.pending_deletes.remove(task)
-        
-        # 保存更新后的待删除列表
-        if completed_tasks:
-            self._save_pending_deletes()
+        # 移除已完成的任务并写回重试任务（一个事务），重试任务按新的计划时间重新入堆
+        if not self.queue.apply_results([task.task_id for task in completed_tasks], retried_tasks):
+            retried_tasks = [task for task in ready_tasks if task not in completed_tasks]
+        for task in retried_tasks:
+            self._push(task)
         
         if success_count > 0 or failed_count > 0:
             self.logger.info(f"删除任务处理完成 - 成功: {success_count}, 失败: {failed_count}")
         
         return success_count, failed_count
     
+    def _push(self, task: DeleteTask):
+        """任务加入调度堆，成为最早到期的任务时唤醒等待者"""
+        with self._heap_lock:
+            heapq.heappush(self._heap, (task.scheduled_time, task.task_id))
+            earliest = self._heap[0][1] == task.task_id
+        if earliest:
+            self._wakeup.set()
+    
+    def _sync_heap(self):
+        """队列中最早的计划时间早于堆顶时（其他进程加入了任务），按数据库重建调度堆"""
+        try:
+            head = self.queue.next_scheduled_time()
+        except Exception as e:
+            self.logger.error(f"查询最早删除任务失败: {e}")
+            return
+        if head is None:
+            return
+        with self._heap_lock:
+            if self._heap and self._heap[0][0] <= head:
+                return
+            self._heap = self.queue.schedule_entries()
+            heapq.heapify(self._heap)
+    
+    def _pop_due(self, now: float = None) -> List[int]:
+        """弹出全部到期任务的ID（去重）"""
+        now = time.time() if now is None else now
+        due = {}
+        with self._heap_lock:
+            while self._heap and self._heap[0][0] <= now:
+                due[heapq.heappop(self._heap)[1]] = None
+        return list(due)
+    
+    def next_due_in(self) -> Optional[float]:
+        """距下一个任务到期的秒数（已到期为0），没有任务返回None"""
+        self._sync_heap()
+        with self._heap_lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.time())
+    
+    def wait_for_due(self, timeout: float = None) -> bool:
+        """等待到下一个任务到期或超时；等待期间加入更早到期的任务时按新的到期时间等待
+        
+        其他进程加入的任务不会唤醒等待者，因此每次最多等待 HEAP_SYNC_INTERVAL 秒后重新检查队列。
+        
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+            
+        Returns:
+            返回时是否有到期任务（关闭后返回False）
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._closed:
+            self._wakeup.clear()
+            delay = self.next_due_in()
+            if delay == 0:
+                return True
+            
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            if delay is None or (remaining is not None and remaining < delay):
+                delay = remaining
+            if delay is None or delay > self.HEAP_SYNC_INTERVAL:
+                delay = self.HEAP_SYNC_INTERVAL
+            self._wakeup.wait(delay)
+        return False
+    
+    def wake(self):
+        """唤醒 wait_for_due 的等待者（如停止时）"""
+        self._wakeup.set()
+    
+    def close(self):
+        """唤醒等待者并关闭删除队列"""
+        self._closed = True
+        self.wake()
+        self.queue.close()
+    
     def _verify_and_delete(self, task: DeleteTask) -> bool:
-        """验证远程文件并删除本地文件
+        """验证远程文件并删除本地文件（单个任务）
         
         Args:
             task: 删除任务
             
+        Returns:
+            是否成功删除
+        """
+        remote_status = {}
+        if os.path.exists(task.local_file_path):
+            remote_status = self._verify_remote_batch([task])
+        return self._delete_verified(task, remote_status)
+    
+    def _delete_verified(self, task: DeleteTask, remote_status: Dict[int, str]) -> bool:
+        """根据批量验证结果删除本地文件
+        
+        Args:
+            task: 删除任务
+            remote_status: _verify_remote_batch 的结果
+            
         Returns:
             是否成功删除
         """
@@ -284,16 +386,20 @@ class SafeDeleteManager:
                 self.logger.info(f"本地文件已不存在: {task.local_file_path}")
                 return True
             
+            status = remote_status.get(id(task))
+            if status is None:
+                self.logger.error(f"远程文件验证失败，跳过删除: {task.remote_file_path}")
+                return False
+            
             # 验证远程文件存在性
-            if not self._verify_remote_file_exists(task.remote_file_path):
+            if status == self.REMOTE_MISSING:
                 self.logger.error(f"远程文件不存在，跳过删除: {task.remote_file_path}")
                 return False
             
             # 验证远程文件完整性（如果启用校验和）
-            if self.enable_checksum and task.local_checksum:
-                if not self._verify_remote_checksum(task.remote_file_path, task.local_checksum):
-                    self.logger.error(f"远程文件校验和不匹配，跳过删除: {task.remote_file_path}")
-                    return False
+            if self._needs_checksum(task) and status.lower() != task.local_checksum.lower():
+                self.logger.error(f"远程文件校验和不匹配，跳过删除: {task.remote_file_path}")
+                return False
             
             # 删除本地文件
             os.remove(task.local_file_path)
@@ -305,79 +411,64 @@ class SafeDeleteManager:
             self.logger.error(f"验证和删除失败: {task.local_file_path}, 错误: {e}")
             return False
     
-    def _verify_remote_file_exists(self, remote_file_path: str) -> bool:
-        """验证远程文件是否存在
-        
-        Args:
-            remote_file_path: 远程文件路径
-            
-        Returns:
-            远程文件是否存在
-        """
+    def _ssh_pool(self):
+        """获取共享的 SSH 复用连接（优先使用别名）"""
         ssh_target = self.nas_alias if self.nas_alias else f"{self.nas_username}@{self.nas_host}"
-        check_cmd = [
-            'ssh', ssh_target,
-            f'test -f {remote_file_path}'
-        ]
-        
-        try:
-            result = subprocess.run(
-                check_cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            return result.returncode == 0
-            
-        except subprocess.TimeoutExpired:
-            self.logger.error("验证远程文件存在性超时")
-            return False
-        except Exception as e:
-            self.logger.error(f"验证远程文件存在性异常: {e}")
-            return False
+        return get_ssh_pool(ssh_target)
     
-    def _verify_remote_checksum(self, remote_file_path: str, expected_checksum: str) -> bool:
-        """验证远程文件校验和
+    def _needs_checksum(self, task: DeleteTask) -> bool:
+        """任务是否需要校验远程文件的校验和"""
+        return bool(self.enable_checksum and task.local_checksum)
+    
+    def _verify_remote_batch(self, tasks: List[DeleteTask]) -> Dict[int, str]:
+        """在一次 SSH 会话中批量验证远程文件
+        
+        远程路径以 NUL 分隔经标准输入传入，由远端 xargs 分批交给 sh 逐个检查，
+        每个路径按输入顺序输出一行：missing / exists / MD5 校验和 / error。
         
         Args:
-            remote_file_path: 远程文件路径
-            expected_checksum: 期望的校验和
+            tasks: 删除任务列表
             
         Returns:
-            校验和是否匹配
+            Dict[int, str]: id(任务) -> 远程状态（REMOTE_MISSING、REMOTE_EXISTS、REMOTE_ERROR 或 MD5），
+            会话失败时返回空字典（全部任务视为验证失败）
         """
-        ssh_target = self.nas_alias if self.nas_alias else f"{self.nas_username}@{self.nas_host}"
-        checksum_cmd = [
-            'ssh', ssh_target,
-            f'md5sum {remote_file_path}'
-        ]
+        if not tasks:
+            return {}
+        
+        # 首字符标记该路径是否需要计算校验和
+        payload = ''.join(('C' if self._needs_checksum(task) else 'E') + task.remote_file_path + '\0'
+                          for task in tasks)
+        # 超时按需要计算校验和的数据量估算（约 50MB/s）
+        checksum_bytes = sum(os.path.getsize(task.local_file_path) for task in tasks
+                             if self._needs_checksum(task) and os.path.exists(task.local_file_path))
+        timeout = 60 + len(tasks) * 0.05 + checksum_bytes / (50 * 1024 * 1024)
         
         try:
-            result = subprocess.run(
-                checksum_cmd,
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-            
-            if result.returncode == 0:
-                # 解析md5sum输出
-                remote_checksum = result.stdout.strip().split()[0]
-                return remote_checksum.lower() == expected_checksum.lower()
-            else:
-                self.logger.error(f"计算远程文件校验和失败: {result.stderr}")
-                return False
-                
+            result = self._ssh_pool().run(self.REMOTE_VERIFY_COMMAND, input=payload, timeout=timeout)
         except subprocess.TimeoutExpired:
-            self.logger.error("计算远程文件校验和超时")
-            return False
+            self.logger.error(f"批量验证远程文件超时: {len(tasks)} 个文件")
+            return {}
         except Exception as e:
-            self.logger.error(f"计算远程文件校验和异常: {e}")
-            return False
+            self.logger.error(f"批量验证远程文件异常: {e}")
+            return {}
+        
+        lines = result.stdout.splitlines()
+        if result.returncode != 0 or len(lines) != len(tasks):
+            self.logger.error(
+                f"批量验证远程文件失败 (返回码 {result.returncode}, "
+                f"输出 {len(lines)}/{len(tasks)} 行): {result.stderr.strip()}"
+            )
+            return {}
+        
+        self.logger.debug(f"批量验证远程文件完成: {len(tasks)} 个文件")
+        return {id(task): line.strip() for task, line in zip(tasks, lines)}
     
     def _calculate_file_checksum(self, file_path: str) -> Optional[str]:
-        """计算文件MD5校验和
+        """获取文件MD5校验和
+        
+        优先使用数据库中登记时保存的摘要；没有时一次读取计算 sha256 和 md5，
+        并写回数据库供后续阶段复用。
         
         Args:
             file_path: 文件路径
@@ -385,100 +476,27 @@ class SafeDeleteManager:
         Returns:
             文件的MD5校验和，失败时返回None
         """
+        if self.status_db is not None:
+            stored = self.status_db.get_file_digests(file_path)
+            if stored.get('md5'):
+                return stored['md5']
+        
         try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
+            digests = get_file_hasher().hash_file(file_path, ('sha256', 'md5'))
+            if self.status_db is not None:
+                self.status_db.update_file_digests(file_path, digests)
+            return digests['md5']
         except Exception as e:
             self.logger.error(f"计算文件校验和失败: {file_path}, 错误: {e}")
             return None
     
-    def _load_pending_deletes(self) -> List[DeleteTask]:
-        """从文件加载待删除任务列表
+    @property
+    def pending_deletes(self) -> Tuple[DeleteTask, ...]:
+        """全部待删除任务的只读快照（按计划时间排序）
         
-        Returns:
-            待删除任务列表
+        任务保存在删除队列数据库中，返回元组而非列表；添加任务请使用 schedule_delete。
         """
-        try:
-            if os.path.exists(self.pending_file):
-                with open(self.pending_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                tasks = []
-                for item in data:
-                    task = DeleteTask(**item)
-                    tasks.append(task)
-                
-                self.logger.info(f"加载了 {len(tasks)} 个待删除任务")
-                return tasks
-            else:
-                self.logger.info("待删除任务文件不存在，创建新的任务列表")
-                return []
-                
-        except Exception as e:
-            self.logger.error(f"加载待删除任务失败: {e}")
-            return []
-    
-    def _save_pending_deletes(self) -> bool:
-        """保存待删除任务列表到文件
-        
-        Returns:
-            是否保存成功
-        """
-        max_retries = 3
-        retry_delay = 1  # 秒
-        
-        for attempt in range(max_retries):
-            try:
-                # 确保目录存在
-                os.makedirs(os.path.dirname(self.pending_file), exist_ok=True)
-                
-                # 转换为字典列表
-                data = [asdict(task) for task in self.pending_deletes]
-                
-                # 使用临时文件进行原子写入
-                temp_file = self.pending_file + '.tmp'
-                
-                # 保存到临时文件
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-                
-                # 原子性重命名
-                os.rename(temp_file, self.pending_file)
-                
-                self.logger.debug(f"保存了 {len(self.pending_deletes)} 个待删除任务")
-                return True
-                
-            except OSError as e:
-                if e.errno == 30:  # Read-only file system
-                    self.logger.warning(f"文件系统只读错误，尝试 {attempt + 1}/{max_retries}: {e}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # 指数退避
-                        continue
-                else:
-                    self.logger.error(f"文件系统错误: {e}")
-                    break
-            except Exception as e:
-                self.logger.error(f"保存待删除任务失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                    continue
-                break
-            finally:
-                # 清理临时文件
-                temp_file = self.pending_file + '.tmp'
-                if os.path.exists(temp_file):
-                    try:
-                        os.remove(temp_file)
-                    except Exception:
-                        pass  # 忽略清理错误
-        
-        self.logger.error(f"保存待删除任务失败，已重试 {max_retries} 次")
-        return False
+        return tuple(self.queue.all_tasks())
     
     def get_pending_count(self) -> int:
         """获取待删除任务数量
@@ -486,7 +504,7 @@ class SafeDeleteManager:
         Returns:
             待删除任务数量
         """
-        return len(self.pending_deletes)
+        return self.queue.count()
     
     def get_ready_count(self) -> int:
         """获取可执行删除的任务数量
@@ -494,7 +512,7 @@ class SafeDeleteManager:
         Returns:
             可执行删除的任务数量
         """
-        return sum(1 for task in self.pending_deletes if task.is_ready_for_deletion())
+        return self.queue.count_ready()
     
     def clear_completed_tasks(self) -> int:
         """清理已完成的任务（本地文件已不存在）
@@ -502,21 +520,15 @@ class SafeDeleteManager:
         Returns:
             清理的任务数量
         """
-        initial_count = len(self.pending_deletes)
-        
-        # 过滤出本地文件仍存在的任务
-        self.pending_deletes = [
-            task for task in self.pending_deletes 
-            if os.path.exists(task.local_file_path)
-        ]
-        
-        cleared_count = initial_count - len(self.pending_deletes)
+        # 过滤出本地文件已不存在的任务
+        cleared = [task.task_id for task in self.queue.all_tasks()
+                   if not os.path.exists(task.local_file_path)]
         
-        if cleared_count > 0:
-            self._save_pending_deletes()
-            self.logger.info(f"清理了 {cleared_count} 个已完成的删除任务")
+        if cleared and self.queue.remove(cleared):
+            self.logger.info(f"清理了 {len(cleared)} 个已完成的删除任务")
+            return len(cleared)
         
-        return cleared_count
+        return 0
     
     def get_status_summary(self) -> Dict:
         """获取删除管理器状态摘要
@@ -525,7 +537,7 @@ class SafeDeleteManager:
             状态摘要字典
         """
         ready_count = self.get_ready_count()
-        pending_count = len(self.pending_deletes)
+        pending_count = self.get_pending_count()
         
         return {
             'total_pending': pending_count,
@@ -533,7 +545,8 @@ class SafeDeleteManager:
             'waiting': pending_count - ready_count,
             'delay_minutes': self.delay_minutes,
             'enable_checksum': self.enable_checksum,
-            'pending_file': self.pending_file
+            'pending_file': self.pending_file,
+            'queue_db': self.queue_db
         }
 
 def main():
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSH 连接池 - 基于 OpenSSH ControlMaster 的连接复用
+
+功能说明：
+1. 每个 SSH 目标（别名或 user@host）维护一个多路复用主连接
+   （ControlMaster/ControlPath/ControlPersist），后续命令复用该连接，
+   省去每次 TCP 建连和密钥握手的开销
+2. 定期健康检查（ssh -O check），主连接失效时自动重建
+3. 命令返回 255 且确认是连接错误（主连接已失效或 stderr 为 ssh 传输错误）时重建主连接并重试一次，
+   远程命令自身返回 255 时不重试
+4. 提供 rsync 使用的 -e 参数，使 rsync 传输同样复用主连接
+5. 进程内按目标共享连接池实例，供守护进程、目录管理、安全删除、存储管理共同使用；
+   后续调用传入与已有实例不同的参数时记录警告
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import re
+import shlex
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+# ssh 连接级错误的返回码
+SSH_CONNECTION_ERROR = 255
+
+# ssh 自身（而非远程命令）输出的传输错误
+SSH_TRANSPORT_ERROR = re.compile(
+    r'^(ssh: |mux_client|muxclient|Control socket|ControlSocket|kex_exchange_identification|'
+    r'Connection (closed|reset|refused|timed out)|client_loop: |packet_write_wait|Broken pipe|'
+    r'Timeout, server .* not responding|ssh_exchange_identification|Host key verification failed)',
+    re.MULTILINE)
+
+DEFAULT_CONTROL_DIR = os.path.join(tempfile.gettempdir(), 'celestial_ssh')
+DEFAULT_CONTROL_PERSIST = 600
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_HEALTH_CHECK_INTERVAL = 60
+
+
+class SSHConnectionPool:
+    """单个 SSH 目标的复用连接"""
+
+    def __init__(self,
+                 target: str,
+                 control_dir: str = None,
+                 control_persist: int = DEFAULT_CONTROL_PERSIST,
+                 connect_timeout: int = DEFAULT_CONNECT_TIMEOUT,
+                 health_check_interval: int = DEFAULT_HEALTH_CHECK_INTERVAL,
+                 ssh_binary: str = 'ssh'):
+        """初始化连接池
+
+        Args:
+            target: SSH 目标（~/.ssh/config 中的别名或 user@host）
+            control_dir: 控制套接字目录
+            control_persist: 主连接空闲保持时间（秒）
+            connect_timeout: 建连超时（秒）
+            health_check_interval: 健康检查间隔（秒）
+            ssh_binary: ssh 可执行文件
+        """
+        self.target = target
+        self.control_dir = control_dir or DEFAULT_CONTROL_DIR
+        self.control_persist = control_persist
+        self.connect_timeout = connect_timeout
+        self.health_check_interval = health_check_interval
+        self.ssh_binary = ssh_binary
+        self.logger = logging.getLogger('SSHConnectionPool')
+
+        # 控制套接字路径有长度限制（约 104 字节），使用目标名的摘要命名
+        digest = hashlib.sha1(target.encode('utf-8')).hexdigest()[:16]
+        self.control_path = os.path.join(self.control_dir, f'cm-{digest}.sock')
+
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+
+    def base_args(self) -> List[str]:
+        """复用主连接的 ssh 基础参数（不含目标和命令）"""
+        return [
+            self.ssh_binary,
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={self.control_path}',
+            '-o', f'ControlPersist={self.control_persist}',
+            '-o', 'BatchMode=yes',
+            '-o', f'ConnectTimeout={self.connect_timeout}',
+        ]
+
+    def command_args(self, command: str) -> List[str]:
+        """在远程执行命令的完整参数列表"""
+        return self.base_args() + [self.target, command]
+
+    def rsync_rsh(self) -> str:
+        """供 rsync -e 使用的远程 shell 命令"""
+        return ' '.join(shlex.quote(arg) for arg in self.base_args())
+
+    def _control_command(self, operation: str) -> subprocess.CompletedProcess:
+        """执行 ssh -O 控制命令（check/exit）"""
+        return subprocess.run(
+            [self.ssh_binary, '-o', f'ControlPath={self.control_path}', '-O', operation, self.target],
+            capture_output=True,
+            text=True,
+            timeout=self.connect_timeout
+        )
+
+    def is_alive(self) -> bool:
+        """检查主连接是否存活"""
+        if not os.path.exists(self.control_path):
+            return False
+        try:
+            return self._control_command('check').returncode == 0
+        except (subprocess.TimeoutExpired, OSError):
+            return False
+
+    def ensure_master(self, force_check: bool = False) -> bool:
+        """确保主连接可用，必要时重建
+
+        Args:
+            force_check: 忽略健康检查间隔，立即检查
+
+        Returns:
+            bool: 主连接可用返回True
+        """
+        with self._lock:
+            now = time.time()
+            if not force_check and now - self._last_check < self.health_check_interval:
+                return True
+
+            if self.is_alive():
+                self._last_check = now
+                return True
+
+            os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+            self._remove_stale_socket()
+
+            try:
+                # ControlMaster=auto + ControlPersist：首个命令建立并后台保持主连接
+                result = subprocess.run(
+                    self.command_args('true'),
+                    capture_output=True,
+                    text=True,
+                    timeout=self.connect_timeout + 5
+                )
+            except (subprocess.TimeoutExpired, OSError) as e:
+                self.logger.error(f"建立SSH主连接失败: {self.target}, 错误: {e}")
+                return False
+
+            if result.returncode != 0:
+                self.logger.error(f"建立SSH主连接失败: {self.target}, 错误: {result.stderr.strip()}")
+                return False
+
+            self._last_check = time.time()
+            self.logger.info(f"SSH主连接已建立: {self.target}")
+            return True
+
+    def _remove_stale_socket(self):
+        """删除失效的控制套接字"""
+        if os.path.exists(self.control_path):
+            try:
+                os.remove(self.control_path)
+            except OSError:
+                pass
+
+    def reconnect(self) -> bool:
+        """关闭并重建主连接"""
+        self.close()
+        return self.ensure_master(force_check=True)
+
+    def run(self,
+            command: str,
+            input: Optional[str] = None,
+            timeout: Optional[float] = 30,
+            text: bool = True) -> subprocess.CompletedProcess:
+        """通过复用连接执行远程命令
+
+        返回码 255 且确认为连接错误（见 _is_connection_error）时重建主连接并重试一次；
+        远程命令自身返回 255 时原样返回，不会重复执行。
+        超时等异常与 subprocess.run 一致，由调用方处理。
+
+        Args:
+            command: 远程 shell 命令
+            input: 标准输入内容
+            timeout: 超时时间（秒）
+            text: 是否以文本模式处理输入输出
+
+        Returns:
+            subprocess.CompletedProcess: 执行结果
+        """
+        self.ensure_master()
+        result = subprocess.run(
+            self.command_args(command),
+            input=input,
+            capture_output=True,
+            text=text,
+            timeout=timeout
+        )
+
+        if result.returncode == SSH_CONNECTION_ERROR and self._is_connection_error(result):
+            self.logger.warning(f"SSH连接异常，重建主连接后重试: {self.target}")
+            if self.reconnect():
+                result = subprocess.run(
+                    self.command_args(command),
+                    input=input,
+                    capture_output=True,
+                    text=text,
+                    timeout=timeout
+                )
+
+        return result
+
+    def _is_connection_error(self, result: subprocess.CompletedProcess) -> bool:
+        """返回码 255 是否为连接错误：stderr 为 ssh 传输错误，或 ssh -O check 确认主连接已失效"""
+        stderr = result.stderr
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode('utf-8', 'replace')
+        if stderr and SSH_TRANSPORT_ERROR.search(stderr):
+            return True
+        return not self.is_alive()
+
+    def popen(self, command: str, **kwargs) -> subprocess.Popen:
+        """通过复用连接启动远程命令并返回进程对象（用于流式读写）
+
+        Args:
+            command: 远程 shell 命令
+            **kwargs: 透传给 subprocess.Popen 的参数
+
+        Returns:
+            subprocess.Popen: 进程对象
+        """
+        self.ensure_master()
+        return subprocess.Popen(self.command_args(command), **kwargs)
+
+    def close(self):
+        """关闭主连接"""
+        with self._lock:
+            if os.path.exists(self.control_path):
+                try:
+                    self._control_command('exit')
+                except (subprocess.TimeoutExpired, OSError):
+                    pass
+                self._remove_stale_socket()
+            self._last_check = 0.0
+
+
+_pools: Dict[str, SSHConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_ssh_pool(target: str, **kwargs) -> SSHConnectionPool:
+    """获取进程内共享的 SSH 连接池
+
+    同一目标只创建一个实例，首次创建时使用传入的参数；之后传入不同的参数时
+    记录警告并继续使用已有实例。
+
+    Args:
+        target: SSH 目标（别名或 user@host）
+        **kwargs: SSHConnectionPool 的构造参数
+
+    Returns:
+        SSHConnectionPool: 连接池实例
+    """
+    with _pools_lock:
+        pool = _pools.get(target)
+        if pool is None:
+            pool = SSHConnectionPool(target, **kwargs)
+            _pools[target] = pool
+            return pool
+
+    conflicts = {key: value for key, value in kwargs.items()
+                 if value is not None and getattr(pool, key, value) != value}
+    if conflicts:
+        pool.logger.warning(
+            f"SSH连接池 {target} 已存在，忽略不同的参数: "
+            + ', '.join(f"{key}={value!r}（当前 {getattr(pool, key)!r}）" for key, value in conflicts.items()))
+    return pool
+
+
+def close_all_pools():
+    """关闭所有主连接（进程退出前调用）"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -17,6 +17,7 @@ import os
 import sys
 import json
 import time
+import fnmatch
 import logging
 import subprocess
 from datetime import datetime, timedelta
@@ -24,6 +25,9 @@ from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 
+from ssh_connection_pool import get_ssh_pool
+from remote_inventory import RemoteInventory, scan_remote_inventory
+
 @dataclass
 class StorageInfo:
     """存储空间信息"""
@@ -70,6 +74,7 @@ class StorageManager:
         # 使用 unified_config.json 中的 ssh_alias；若未配置则回退为 username@host
         self.nas_alias = nas_settings.get('ssh_alias') or f"{self.nas_user}@{self.nas_host}"
         self.nas_base_path = nas_settings.get('base_path', '/volume1/drone_media')
+        self.ssh_pool = get_ssh_pool(self.nas_alias)
         
         # 存储管理配置
         storage_config = self.config.get('storage_management', {})
@@ -194,16 +199,8 @@ class StorageManager:
             存储空间信息，失败时返回None
         """
         try:
-            # 使用SSH执行df命令获取存储空间信息
-            cmd = f"ssh {self.nas_alias} 'df -B1 {self.nas_base_path}'"
-            
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            # 使用SSH执行df命令获取存储空间信息（复用主连接）
+            result = self.ssh_pool.run(f"df -B1 {self.nas_base_path}", timeout=30)
             
             if result.returncode != 0:
                 self.logger.error(f"获取存储信息失败: {result.stderr}")
@@ -319,52 +316,52 @@ class StorageManager:
         except Exception as e:
             self.logger.error(f"保存状态文件失败: {e}")
     
-    def find_files_to_cleanup(self, rule: CleanupRule) -> List[str]:
+    def get_inventory(self) -> Optional[RemoteInventory]:
+        """一次远程 find 获取NAS基础路径下的文件清单
+        
+        Returns:
+            远程目录清单，失败时返回None
+        """
+        return scan_remote_inventory(self.ssh_pool, self.nas_base_path, logger=self.logger)
+    
+    def find_files_to_cleanup(self, rule: CleanupRule, inventory: RemoteInventory = None) -> List[str]:
         """根据规则查找需要清理的文件
         
         Args:
             rule: 清理规则
+            inventory: 远程目录清单，None 时重新扫描
             
         Returns:
             需要清理的文件路径列表
         """
         try:
+            if inventory is None:
+                inventory = self.get_inventory()
+                if inventory is None:
+                    self.logger.error(f"查找文件失败: 无法获取远程目录清单")
+                    return []
+            
             # 计算截止日期
             cutoff_date = datetime.now() - timedelta(days=rule.max_age_days)
             cutoff_timestamp = int(cutoff_date.timestamp())
             
-            # 构建查找命令
+            # 与 find <search_path> 相同的匹配范围：路径本身或其下的所有文件
             search_path = os.path.join(self.nas_base_path, rule.path_pattern.lstrip('*/'))
-            
-            if rule.file_extension == "*":
-                find_cmd = f"find {search_path} -type f -not -newermt @{cutoff_timestamp}"
-            else:
-                find_cmd = f"find {search_path} -type f -name '*{rule.file_extension}' -not -newermt @{cutoff_timestamp}"
-            
-            # 通过SSH执行查找命令
-            cmd = f"ssh {self.nas_alias} '{find_cmd}'"
-            
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-            
-            if result.returncode != 0:
-                self.logger.error(f"查找文件失败: {result.stderr}")
-                return []
-            
-            # 解析结果
-            files = [line.strip() for line in result.stdout.strip().split('\n') if line.strip()]
+            subtree_pattern = search_path.rstrip('/') + '/*'
+            name_pattern = f"*{rule.file_extension}" if rule.file_extension != "*" else None
+            
+            files = []
+            for entry in inventory.iter_files():
+                if entry.mtime > cutoff_timestamp:
+                    continue
+                if name_pattern and not fnmatch.fnmatchcase(os.path.basename(entry.path), name_pattern):
+                    continue
+                if fnmatch.fnmatchcase(entry.path, search_path) or fnmatch.fnmatchcase(entry.path, subtree_pattern):
+                    files.append(entry.path)
             
             self.logger.info(f"规则 '{rule.path_pattern}' 找到 {len(files)} 个待清理文件")
             return files
             
-        except subprocess.TimeoutExpired:
-            self.logger.error(f"查找文件超时: {rule.path_pattern}")
-            return []
         except Exception as e:
             self.logger.error(f"查找文件异常: {e}")
             return []
@@ -389,17 +386,8 @@ class StorageManager:
             # 将文件路径写入临时文件
             files_list = '\n'.join(file_paths)
             
-            # 使用SSH执行批量删除
-            cmd = f"ssh {self.nas_alias} 'xargs rm -f'"
-            
-            result = subprocess.run(
-                cmd,
-                input=files_list,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
+            # 使用SSH执行批量删除（复用主连接）
+            result = self.ssh_pool.run('xargs rm -f', input=files_list, timeout=300)
             
             if result.returncode == 0:
                 success_count = len(file_paths)
@@ -448,11 +436,19 @@ class StorageManager:
                 }
             }
         
-        # 执行清理
+        # 执行清理 - 所有规则共用一次远程 find 得到的清单
         cleanup_results = []
         total_deleted = 0
         total_failed = 0
         
+        inventory = self.get_inventory()
+        if inventory is None:
+            return {
+                "success": False,
+                "message": "无法获取远程目录清单",
+                "details": status
+            }
+        
         for rule in self.cleanup_rules:
             if not rule.enabled:
                 continue
@@ -460,11 +456,12 @@ class StorageManager:
             self.logger.info(f"执行清理规则: {rule.path_pattern} ({rule.file_extension})")
             
             # 查找需要清理的文件
-            files_to_cleanup = self.find_files_to_cleanup(rule)
+            files_to_cleanup = self.find_files_to_cleanup(rule, inventory)
             
             if files_to_cleanup:
                 # 执行清理
                 success_count, failed_count = self.cleanup_files(files_to_cleanup)
+                inventory.remove_files(files_to_cleanup)
                 
                 cleanup_results.append({
                     "rule": asdict(rule),
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tar 流上传 - 通过一个 SSH 会话连续发送多个文件
+
+功能说明：
+1. 一组文件打包为 tar 流，经 SSH 复用连接写入远端 tar -x，
+   省去每个文件启动 rsync 进程、远端 rsync 和文件列表交换的开销（小文件场景占主导）
+2. 读取文件写入 tar 流的同时计算摘要，不额外读取文件
+3. 远端先解包到目标根目录下的临时目录，在同一会话中对解出的成员计算摘要并返回，
+   逐个文件与本地摘要比对；只有校验一致的成员才在第二个会话中移动到最终路径，
+   中断或超时不会在最终路径留下不完整的文件
+4. 成员名可以包含子目录（如 YYYY/MM/DD/文件名），远端自动创建
+5. 发送速率受上传带宽限制器（令牌桶）约束
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import shlex
+import posixpath
+import logging
+import tarfile
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from chunk_manifest import REMOTE_DIGEST_COMMANDS
+from file_hasher import new_digest
+from rate_limiter import BandwidthLimiter
+from ssh_connection_pool import SSHConnectionPool
+
+DEFAULT_COPY_BUFFER = 1024 * 1024
+MIN_THROUGHPUT_BYTES = 1024 * 1024   # 估算超时使用的最低吞吐量（字节/秒）
+
+# 远端：解包到目标根目录下的临时目录（第一行输出临时目录路径），
+# tar -v 列出的成员解包完成后逐个计算摘要
+REMOTE_EXTRACT_COMMAND = (
+    "mkdir -p {base} && t=$(mktemp -d {template}) && echo \"$t\" && cd \"$t\" && l=$(mktemp) && "
+    "{{ tar -xvf - >\"$l\"; rc=$?; tr '\\n' '\\0' <\"$l\" | xargs -0 -r {digest} --; "
+    "rm -f \"$l\"; exit $rc; }}"
+)
+
+# 远端：把标准输入中逐行列出的已校验成员从临时目录移动到最终路径（输出移动成功的成员），
+# 然后删除临时目录
+REMOTE_COMMIT_COMMAND = (
+    "cd {tmp} && {{ {mkdirs}while IFS= read -r m; do mv -f -- \"$m\" {base}/\"$m\" && echo \"$m\"; done; }}; "
+    "cd / && rm -rf {tmp}"
+)
+
+
+class _HashingReader:
+    """读取时同时更新摘要并按带宽限制放行的文件包装"""
+
+    def __init__(self, f, digest, limiter: Optional[BandwidthLimiter]):
+        self._f = f
+        self._digest = digest
+        self._limiter = limiter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        if data:
+            self._digest.update(data)
+            if self._limiter is not None:
+                self._limiter.consume(len(data))
+        return data
+
+
+def _valid_member_name(name: str) -> bool:
+    """成员名必须是不含 .. 和换行的相对路径"""
+    return bool(name) and not name.startswith('/') and '..' not in name.split('/') and '\n' not in name
+
+
+class TarStreamUploader:
+    """通过 SSH 复用连接以 tar 流上传文件"""
+
+    def __init__(self,
+                 pool: SSHConnectionPool,
+                 limiter: BandwidthLimiter = None,
+                 algorithm: str = 'sha256',
+                 copy_buffer: int = DEFAULT_COPY_BUFFER,
+                 temp_prefix: str = '.tmp_',
+                 logger: logging.Logger = None):
+        """初始化上传器
+
+        Args:
+            pool: SSH 连接池
+            limiter: 上传带宽限制器，None 表示不限速
+            algorithm: 校验摘要算法（远端需有对应的 *sum 命令）
+            copy_buffer: 每次读取写入的字节数
+            temp_prefix: 远端解包临时目录的名称前缀
+            logger: 日志记录器
+
+        Raises:
+            ValueError: 远端不支持的摘要算法
+        """
+        if algorithm not in REMOTE_DIGEST_COMMANDS:
+            raise ValueError(f"远端不支持的摘要算法: {algorithm}")
+        self.pool = pool
+        self.limiter = limiter
+        self.algorithm = algorithm
+        self.copy_buffer = copy_buffer
+        self.temp_prefix = temp_prefix
+        self.logger = logger or logging.getLogger('TarStreamUploader')
+
+    @staticmethod
+    def _parse_digest_output(output: str) -> Dict[str, str]:
+        """解析 *sum 输出，返回 成员名 -> 摘要"""
+        digests = {}
+        for line in output.splitlines():
+            digest, sep, name = line.partition('  ')
+            if sep and name:
+                digests[name] = digest.lstrip('\\')
+        return digests
+
+    def upload(self,
+               remote_base: str,
+               members: Sequence[Tuple[str, str]],
+               timeout: float = None) -> Dict[str, Tuple[bool, str]]:
+        """在一个 SSH 会话中上传一组文件，校验一致的成员再在一个会话中移动到最终路径
+
+        Args:
+            remote_base: 远端目标根目录
+            members: (本地文件路径, 远端相对路径) 列表，远端相对路径在组内唯一
+            timeout: 超时时间（秒），None 时按总大小估算（60 秒 + 总大小 / 1MB/s）
+
+        Returns:
+            Dict[str, tuple]: 本地文件路径 -> (是否成功, 错误信息)
+        """
+        results: Dict[str, Tuple[bool, str]] = {}
+        pending: List[Tuple[str, str, int]] = []
+        for local_path, member in members:
+            if not _valid_member_name(member):
+                results[local_path] = (False, f"无效的远端路径: {member}")
+                continue
+            try:
+                pending.append((local_path, member, os.path.getsize(local_path)))
+            except OSError:
+                results[local_path] = (False, "源文件不存在")
+        if not pending:
+            return results
+
+        total_bytes = sum(size for _, _, size in pending)
+        if timeout is None:
+            timeout = 60 + total_bytes / MIN_THROUGHPUT_BYTES
+        template = posixpath.join(remote_base, f"{self.temp_prefix}XXXXXX")
+        command = REMOTE_EXTRACT_COMMAND.format(base=shlex.quote(remote_base), template=shlex.quote(template),
+                                                digest=REMOTE_DIGEST_COMMANDS[self.algorithm])
+        self.logger.info(f"开始 tar 流上传 {len(pending)} 个文件 ({total_bytes} bytes) 到 {remote_base}")
+
+        local_digests: Dict[str, str] = {}
+        with tempfile.TemporaryFile() as stderr_file:
+            process = self.pool.popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=stderr_file)
+            # 远端无响应时写入会一直阻塞，超时后结束进程
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                process.kill()
+
+            watchdog = threading.Timer(timeout, on_timeout)
+            watchdog.start()
+            try:
+                stream_error = self._write_stream(process, pending, local_digests)
+                stdout, _ = process.communicate()
+            finally:
+                watchdog.cancel()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+
+        temp_dir, _, digest_output = stdout.decode('utf-8', errors='replace').partition('\n')
+        remote_digests = self._parse_digest_output(digest_output)
+
+        verified = {}
+        for local_path, member, _ in pending:
+            remote_digest = remote_digests.get(member)
+            if remote_digest is not None and remote_digest == local_digests.get(local_path):
+                verified[local_path] = member
+            elif remote_digest is not None:
+                results[local_path] = (False, "远端校验和不一致")
+            elif timed_out.is_set():
+                results[local_path] = (False, "tar 流上传超时")
+            elif stream_error:
+                results[local_path] = (False, stream_error)
+            else:
+                results[local_path] = (False, f"远端解包失败 (返回码 {process.returncode}): {stderr[-500:]}")
+
+        # 临时目录路径必须是本次 mktemp 的结果，才会在其中移动和删除
+        stem = template[:-len('XXXXXX')]
+        if temp_dir.startswith(stem) and temp_dir[len(stem):].isalnum():
+            moved = self._commit_members(remote_base, temp_dir, list(verified.values()))
+            for local_path, member in verified.items():
+                results[local_path] = (True, "") if member in moved else (False, "移动到目标路径失败")
+        else:
+            for local_path in verified:
+                results[local_path] = (False, f"远端解包失败: {stderr[-500:]}")
+
+        failed = sum(1 for ok, _ in results.values() if not ok)
+        if failed:
+            self.logger.error(f"tar 流上传部分失败: {remote_base}, 失败 {failed} 个, {stderr[-500:]}")
+        return results
+
+    def _commit_members(self, remote_base: str, temp_dir: str, members: List[str]) -> Set[str]:
+        """把已校验的成员从临时目录移动到最终路径，并删除临时目录
+
+        Args:
+            remote_base: 远端目标根目录
+            temp_dir: 本次解包的远端临时目录
+            members: 已校验的成员名
+
+        Returns:
+            Set[str]: 移动成功的成员名
+        """
+        parents = sorted({posixpath.dirname(member) for member in members} - {''})
+        mkdirs = ''
+        if parents:
+            mkdirs = 'mkdir -p -- ' + ' '.join(shlex.quote(posixpath.join(remote_base, parent))
+                                              for parent in parents) + ' && '
+        command = REMOTE_COMMIT_COMMAND.format(tmp=shlex.quote(temp_dir), base=shlex.quote(remote_base),
+                                               mkdirs=mkdirs)
+        try:
+            result = self.pool.run(command, input=''.join(member + '\n' for member in members),
+                                   timeout=60 + len(members) / 10)
+        except subprocess.TimeoutExpired:
+            self.logger.error(f"移动已校验成员超时: {remote_base}")
+            return set()
+        if result.returncode != 0:
+            self.logger.error(f"移动已校验成员失败: {remote_base}, {result.stderr.strip()[-500:]}")
+        return set(result.stdout.splitlines()) & set(members)
+
+    def _write_stream(self, process: subprocess.Popen, pending: List[Tuple[str, str, int]],
+                      local_digests: Dict[str, str]) -> str:
+        """把文件逐个写入 tar 流，同时计算摘要
+
+        Returns:
+            str: 写入中断时的错误信息，正常结束为空字符串
+        """
+        try:
+            with tarfile.open(fileobj=process.stdin, mode='w|', copybufsize=self.copy_buffer) as tar:
+                for local_path, member, _ in pending:
+                    with open(local_path, 'rb') as f:
+                        tarinfo = tar.gettarinfo(arcname=member, fileobj=f)
+                        digest = new_digest(self.algorithm)
+                        tar.addfile(tarinfo, _HashingReader(f, digest, self.limiter))
+                    local_digests[local_path] = digest.hexdigest()
+            return ""
+        except (OSError, tarfile.TarError) as e:
+            # 源文件读取失败或远端提前退出：关闭输入后远端 tar 报错退出，
+            # 此前完整写入的成员仍会被解包并返回摘要，以远端摘要为准
+            self.logger.error(f"tar 流写入中断: {e}")
+            return f"tar 流写入中断: {e}"
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块指纹测试脚本
+
+验证：
+1. 按块并行计算的分块哈希与同一次顺序读取得到的分块哈希、整文件摘要一致
+2. 使用伪造的 ssh 在一次远程会话中逐块校验大文件，得到需要重新发送的字节范围
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import hashlib
+import unittest
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ssh_connection_pool import get_ssh_pool
+from file_hasher import FileHasher
+from chunk_manifest import compute_chunk_manifest, merkle_root, verify_remote_chunks
+from test_ssh_connection_pool import FakeSSHTestCase
+
+
+class TestChunkManifest(FakeSSHTestCase):
+    """分块指纹计算测试"""
+
+    def test_digests_computed_in_manifest_read(self):
+        """测试需要整文件摘要时一次读取得到相同的分块哈希，并附带整文件摘要"""
+        chunk_size = 64 * 1024
+        data = os.urandom(5 * chunk_size + 123)
+        path = os.path.join(self.test_dir, 'large.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        hasher = FileHasher(max_workers=2, buffer_size=chunk_size)
+        self.addCleanup(hasher.close)
+        parallel = compute_chunk_manifest(path, chunk_size, hasher)
+        single_read = compute_chunk_manifest(path, chunk_size, hasher, digests=('sha256', 'md5'))
+
+        expected = [hashlib.sha256(data[i:i + chunk_size]).hexdigest() for i in range(0, len(data), chunk_size)]
+        self.assertEqual(parallel.chunk_hashes, expected)
+        self.assertEqual(single_read.chunk_hashes, expected)
+        self.assertEqual(single_read.root, merkle_root(expected))
+        self.assertEqual(parallel.digests, {})
+        self.assertEqual(single_read.digests, {'sha256': hashlib.sha256(data).hexdigest(),
+                                               'md5': hashlib.md5(data).hexdigest()})
+
+
+class TestRemoteChunkVerification(FakeSSHTestCase):
+    """远端分块校验测试"""
+
+    def test_mismatched_ranges(self):
+        """测试只有内容不一致的块被报告，缺失的远端文件需要整体重发"""
+        chunk_size = 1024 * 1024
+        data = os.urandom(2 * chunk_size + 1000)
+        local_path = os.path.join(self.test_dir, 'local.bin')
+        remote_path = os.path.join(self.test_dir, 'remote.bin')
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        with open(remote_path, 'wb') as f:
+            f.write(data[:chunk_size] + b'x' * 10 + data[chunk_size + 10:])
+
+        hasher = FileHasher(max_workers=3, buffer_size=chunk_size)
+        manifest = compute_chunk_manifest(local_path, chunk_size, hasher)
+        hasher.close()
+        pool = get_ssh_pool('nas-test', control_dir=self.control_dir)
+
+        self.assertEqual(manifest.chunk_count, 3)
+        self.assertEqual(verify_remote_chunks(pool, remote_path, manifest), [(chunk_size, chunk_size)])
+        self.assertEqual(verify_remote_chunks(pool, local_path, manifest), [])
+        self.assertEqual(verify_remote_chunks(pool, remote_path + '.missing', manifest), [(0, len(data))])
+        self.assertEqual(sum(1 for event in self.read_ssh_log() if event.startswith('exec ')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
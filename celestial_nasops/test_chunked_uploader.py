@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块上传测试脚本
+
+使用伪造的 ssh（在本机 sh 中执行远程命令）验证：
+1. 分块并发上传，失败的分块记录在数据库中
+2. 续传只重传失败的分块，组装出的文件与源文件一致并清理分块状态
+3. 组装后校验不一致时只重传涉及的分块，并在远端原位写回
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import unittest
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ssh_connection_pool import get_ssh_pool
+from chunked_uploader import ChunkedUploader
+from media_status_db import MediaStatusDB
+from test_ssh_connection_pool import FakeSSHTestCase
+
+
+class TestChunkedUpload(FakeSSHTestCase):
+    """分块上传测试"""
+
+    def test_failed_chunk_resumed_without_resending_others(self):
+        """测试一个分块失败后，续传只重传该分块，组装出的文件与源文件一致并清理分块状态"""
+        source = os.path.join(self.test_dir, 'DJI_0001.MP4')
+        data = os.urandom(5 * 64 * 1024 + 1000)
+        with open(source, 'wb') as f:
+            f.write(data)
+        remote_path = os.path.join(self.test_dir, 'nas', '2026', '10', '16', 'DJI_0001.MP4')
+
+        db = MediaStatusDB(os.path.join(self.test_dir, 'status.db'))
+        self.assertTrue(db.connect())
+        self.addCleanup(db.close)
+        pool = get_ssh_pool('nas-test', control_dir=self.control_dir)
+        uploader = ChunkedUploader(pool, db, chunk_size=64 * 1024, max_concurrent_chunks=3,
+                                   retry_attempts=0, retry_delay=0)
+
+        upload_chunk = uploader._upload_chunk
+
+        def fail_chunk_two(file_path, parts_dir, chunk):
+            if chunk.index == 2:
+                return False, "模拟网络中断"
+            return upload_chunk(file_path, parts_dir, chunk)
+
+        uploader._upload_chunk = fail_chunk_two
+        self.assertEqual(uploader.upload(source, remote_path), (False, "1/6 个分块上传失败"))
+        chunks = db.get_upload_chunks(source)
+        self.assertEqual([chunk.status for chunk in chunks],
+                         ['completed', 'completed', 'failed', 'completed', 'completed', 'completed'])
+        self.assertEqual(chunks[2].retry_count, 1)
+        self.assertFalse(os.path.exists(remote_path))
+
+        uploader._upload_chunk = upload_chunk
+        before = sum(1 for event in self.read_ssh_log() if event.startswith('exec mkdir'))
+        progress = []
+        self.assertEqual(uploader.upload(source, remote_path, on_progress=lambda done, total: progress.append(done)),
+                         (True, ""))
+        self.assertEqual(sum(1 for event in self.read_ssh_log() if event.startswith('exec mkdir')) - before, 1)
+        self.assertEqual(progress, [len(data)])
+        self.assertTrue(any('/.chunk_DJI_0001.MP4.assembling' in event for event in self.read_ssh_log()))
+        with open(remote_path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(os.path.dirname(remote_path)), ['DJI_0001.MP4'])
+        self.assertEqual(db.get_upload_chunks(source), [])
+
+    def test_verify_mismatch_resends_only_mismatched_chunks(self):
+        """测试组装后校验不一致时只重传涉及的分块，写回后文件一致并清理分块状态"""
+        chunk_size = 64 * 1024
+        source = os.path.join(self.test_dir, 'DJI_0002.MP4')
+        data = os.urandom(4 * chunk_size + 1000)
+        with open(source, 'wb') as f:
+            f.write(data)
+        remote_path = os.path.join(self.test_dir, 'nas', 'DJI_0002.MP4')
+
+        db = MediaStatusDB(os.path.join(self.test_dir, 'status.db'))
+        self.assertTrue(db.connect())
+        self.addCleanup(db.close)
+        pool = get_ssh_pool('nas-test', control_dir=self.control_dir)
+        uploader = ChunkedUploader(pool, db, chunk_size=chunk_size, max_concurrent_chunks=3,
+                                   retry_attempts=0, retry_delay=0)
+
+        assemble = uploader._assemble
+
+        def corrupt_chunk_three(*args):
+            result = assemble(*args)
+            with open(remote_path, 'r+b') as f:
+                f.seek(3 * chunk_size + 10)
+                f.write(b'\0' * 100)
+            return result
+
+        def verify():
+            with open(remote_path, 'rb') as f:
+                remote = f.read()
+            task_chunks.append(db.get_upload_chunks(source))
+            return [(offset, chunk_size) for offset in range(0, len(data), chunk_size)
+                    if remote[offset:offset + chunk_size] != data[offset:offset + chunk_size]]
+
+        task_chunks = []
+        uploader._assemble = corrupt_chunk_three
+        self.assertEqual(uploader.upload(source, remote_path, verify=verify), (True, ""))
+
+        self.assertEqual(sum(1 for event in self.read_ssh_log() if event.startswith('exec mkdir')), 6)
+        self.assertEqual(len(task_chunks), 2)
+        self.assertEqual([chunk.status for chunk in task_chunks[0]], ['completed'] * 5)
+        with open(remote_path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(os.path.dirname(remote_path)), ['DJI_0002.MP4'])
+        self.assertEqual(db.get_upload_chunks(source), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟删除队列测试脚本
+
+验证：
+1. 旧的 pending_deletes.json 一次性导入 SQLite 队列，源文件保持不变
+2. 按计划时间查询到期任务，一轮处理结果在一个事务中提交
+3. 调度堆只弹出到期任务，失败任务按退避时间重新入堆，等待者在更早的任务加入时被唤醒
+4. 其他进程加入的更早任务会被调度，pending_deletes 是只读快照
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from delete_queue import DeleteQueue, DeleteTask
+from safe_delete_manager import SafeDeleteManager
+
+
+class TestDeleteQueue(unittest.TestCase):
+    """延迟删除队列测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix='delete_queue_test_')
+        self.pending_file = os.path.join(self.test_dir, 'pending_deletes.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_json_migrated_once(self):
+        """测试旧 JSON 任务文件只导入一次，源文件保持不变"""
+        now = time.time()
+        with open(self.pending_file, 'w') as f:
+            json.dump([
+                {"local_file_path": "/data/a.mp4", "remote_file_path": "/nas/a.mp4",
+                 "local_checksum": "abc", "scheduled_time": now - 10, "retry_count": 1,
+                 "max_retries": 3, "created_time": now - 100},
+                {"local_file_path": "/data/b.mp4", "remote_file_path": "/nas/b.mp4",
+                 "local_checksum": "", "scheduled_time": now + 3600, "retry_count": 0,
+                 "max_retries": 3, "created_time": now - 50},
+            ], f)
+
+        manager = SafeDeleteManager(pending_file=self.pending_file)
+        self.assertEqual(manager.get_pending_count(), 2)
+        self.assertEqual(manager.get_ready_count(), 1)
+        self.assertTrue(os.path.exists(self.pending_file))
+        self.assertFalse(os.path.exists(self.pending_file + '.migrated'))
+        manager.queue.close()
+
+        reopened = SafeDeleteManager(pending_file=self.pending_file)
+        self.assertEqual([task.local_file_path for task in reopened.pending_deletes], ['/data/a.mp4', '/data/b.mp4'])
+        self.assertEqual(reopened.pending_deletes[0].retry_count, 1)
+        reopened.queue.close()
+
+    def test_failed_migration_not_recorded(self):
+        """测试导入事务失败时不留下导入记录，下次启动重新导入且不产生重复任务"""
+        with open(self.pending_file, 'w') as f:
+            json.dump([{"local_file_path": "/data/a.mp4", "remote_file_path": "/nas/a.mp4",
+                        "local_checksum": "", "scheduled_time": time.time()}], f)
+        queue = DeleteQueue(os.path.join(self.test_dir, 'queue.db'))
+        queue.connection.execute(
+            "CREATE TRIGGER fail_meta BEFORE INSERT ON queue_meta BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+
+        self.assertEqual(queue.migrate_json(self.pending_file), -1)
+        self.assertEqual(queue.count(), 0)
+
+        queue.connection.execute("DROP TRIGGER fail_meta")
+        self.assertEqual(queue.migrate_json(self.pending_file), 1)
+        self.assertEqual(queue.migrate_json(self.pending_file), 0)
+        self.assertEqual(queue.count(), 1)
+        queue.close()
+
+    def test_ready_query_and_results(self):
+        """测试只返回到期任务，完成和重试结果一起提交"""
+        queue = DeleteQueue(os.path.join(self.test_dir, 'queue.db'))
+        now = time.time()
+        tasks = [DeleteTask(f'/data/{i}.mp4', f'/nas/{i}.mp4', '', now + offset)
+                 for i, offset in enumerate([-30, -20, -10, 600])]
+        for task in tasks:
+            self.assertTrue(queue.add(task))
+
+        self.assertEqual(queue.count_ready(now), 3)
+        ready = queue.get_by_ids([task.task_id for task in reversed(tasks)])[:3]
+        self.assertEqual([task.local_file_path for task in ready], ['/data/0.mp4', '/data/1.mp4', '/data/2.mp4'])
+
+        ready[1].increment_retry()
+        ready[1].scheduled_time = now + 60
+        self.assertTrue(queue.apply_results([ready[0].task_id, ready[2].task_id], [ready[1]]))
+
+        self.assertEqual(queue.count(), 2)
+        self.assertEqual(queue.count_ready(now), 0)
+        self.assertEqual(queue.next_scheduled_time(), now + 60)
+        self.assertEqual(queue.all_tasks()[0].retry_count, 1)
+        queue.close()
+
+    def test_closed_queue_queries_return_defaults(self):
+        """测试队列关闭后查询返回默认值并记录错误，而不是抛出异常"""
+        queue = DeleteQueue(os.path.join(self.test_dir, 'queue.db'))
+        queue.close()
+        with self.assertLogs('DeleteQueue', level='ERROR'):
+            self.assertEqual(queue.count(), 0)
+            self.assertEqual(queue.count_ready(), 0)
+            self.assertIsNone(queue.next_scheduled_time())
+            self.assertFalse(queue.add(DeleteTask('/data/a.mp4', '/nas/a.mp4', '', time.time())))
+
+
+class TestDeleteScheduler(unittest.TestCase):
+    """延迟删除调度测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix='delete_scheduler_test_')
+        self.manager = SafeDeleteManager(delay_minutes=0,
+                                         pending_file=os.path.join(self.test_dir, 'pending_deletes.json'))
+
+    def tearDown(self):
+        self.manager.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _create_file(self, name: str) -> str:
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w') as f:
+            f.write(name)
+        return path
+
+    def test_failed_tasks_reinserted_with_backoff(self):
+        """测试只处理到期任务，验证失败的任务按退避时间重新入堆"""
+        self.manager.delay_minutes = 10
+        self.manager.schedule_delete(self._create_file('later.mp4'), '/nas/later.mp4', '')
+        self.assertGreater(self.manager.next_due_in(), 500)
+
+        self.manager.delay_minutes = 0
+        self.manager.schedule_delete(self._create_file('due.mp4'), '/nas/due.mp4', '')
+        self.assertEqual(self.manager.next_due_in(), 0)
+
+        with patch.object(self.manager, '_verify_remote_batch', return_value={}) as mock_verify:
+            self.assertEqual(self.manager.process_pending_deletes(), (0, 0))
+            self.assertEqual([task.local_file_path for task in mock_verify.call_args[0][0]],
+                             [os.path.join(self.test_dir, 'due.mp4')])
+
+        # 第一次重试退避 120 秒，仍早于 10 分钟后的任务
+        self.assertAlmostEqual(self.manager.next_due_in(), 120, delta=5)
+        retried = [task for task in self.manager.pending_deletes if task.local_file_path.endswith('due.mp4')][0]
+        self.assertEqual(retried.retry_count, 1)
+        self.assertEqual(self.manager.process_pending_deletes(), (0, 0))
+
+    def test_tasks_added_by_other_process_scheduled(self):
+        """测试其他进程写入队列的更早任务会重建调度堆并被处理"""
+        self.manager.delay_minutes = 10
+        self.manager.schedule_delete(self._create_file('later.mp4'), '/nas/later.mp4', '')
+        self.assertGreater(self.manager.next_due_in(), 500)
+
+        other = SafeDeleteManager(delay_minutes=0, pending_file=self.manager.pending_file,
+                                  queue_db=self.manager.queue_db)
+        other.schedule_delete(self._create_file('other.mp4'), '/nas/other.mp4', '')
+        other.close()
+
+        self.assertEqual(self.manager.next_due_in(), 0)
+        with patch.object(self.manager, '_verify_remote_batch', return_value={}) as mock_verify:
+            self.manager.process_pending_deletes()
+            self.assertEqual([task.local_file_path for task in mock_verify.call_args[0][0]],
+                             [os.path.join(self.test_dir, 'other.mp4')])
+
+    def test_pending_deletes_is_read_only(self):
+        """测试 pending_deletes 返回只读快照，追加会直接报错而不是静默丢失"""
+        self.manager.schedule_delete(self._create_file('a.mp4'), '/nas/a.mp4', '')
+        snapshot = self.manager.pending_deletes
+        self.assertEqual(len(snapshot), 1)
+        with self.assertRaises(AttributeError):
+            snapshot.append(DeleteTask('/data/b.mp4', '/nas/b.mp4', '', time.time()))
+
+    def test_waiter_woken_by_earlier_task(self):
+        """测试等待中加入更早到期的任务时立即唤醒"""
+        self.manager.delay_minutes = 10
+        self.manager.schedule_delete(self._create_file('later.mp4'), '/nas/later.mp4', '')
+        self.manager.delay_minutes = 0
+
+        timer = threading.Timer(0.2, self.manager.schedule_delete,
+                                args=(self._create_file('now.mp4'), '/nas/now.mp4', ''))
+        timer.start()
+        start = time.time()
+        self.assertTrue(self.manager.wait_for_due(timeout=5))
+        timer.join()
+        self.assertLess(time.time() - start, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,6 +21,7 @@ import tempfile
 import shutil
 import sqlite3
 import hashlib
+import threading
 import unittest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
@@ -30,7 +31,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from media_finding_daemon import MediaFindingDaemon, FileStatus
 from config_manager import ConfigManager
-from media_status_db import MediaStatusDB
+from media_status_db import MediaStatusDB, FileStatus as DBFileStatus
 
 class TestMediaFindingDaemon(unittest.TestCase):
     """Media Finding Daemon 测试类"""
@@ -187,6 +188,25 @@ class TestFileFiltering(TestMediaFindingDaemon):
         # 非自定义扩展名
         self.assertFalse(self.daemon._should_process_file('photo.jpg'))
         self.assertFalse(self.daemon._should_process_file('data.csv'))
+    
+    def test_excluded_directories_are_pruned(self):
+        """测试匹配目录排除模式的子树不会被扫描"""
+        for directory in ('.Trash-1000', '.tmp_upload', 'flight_01'):
+            os.makedirs(os.path.join(self.media_dir, directory, 'nested'))
+            self._create_test_file(os.path.join(directory, 'nested', 'video.mp4'))
+        
+        scanned_dirs = []
+        original_scandir = os.scandir
+        
+        def tracking_scandir(path):
+            scanned_dirs.append(os.path.relpath(path, self.media_dir))
+            return original_scandir(path)
+        
+        with patch('media_finding_daemon.os.scandir', side_effect=tracking_scandir):
+            files = self.daemon._scan_media_directory()
+        
+        self.assertEqual([os.path.relpath(f, self.media_dir) for f in files], ['flight_01/nested/video.mp4'])
+        self.assertFalse(any(d.startswith(('.Trash', '.tmp_')) for d in scanned_dirs))
 
 class TestFileDiscovery(TestMediaFindingDaemon):
     """文件发现测试"""
@@ -219,6 +239,68 @@ class TestFileDiscovery(TestMediaFindingDaemon):
         self.assertIn('photo.jpg', filenames)
         self.assertIn('document.txt', filenames)
         self.assertNotIn('.hidden.mp4', filenames)
+    
+    def test_streaming_scan_registers_in_batches(self):
+        """测试流式扫描按批注册，并复用扫描时的 stat 信息"""
+        from media_finding_daemon import ScannedFile
+        
+        os.makedirs(os.path.join(self.media_dir, 'flight_01'))
+        for i in range(5):
+            self._create_test_file(os.path.join('flight_01', f'stream_{i}.jpg'))
+        
+        self.daemon.scan_batch_size = 2
+        batches = []
+        original_register = self.daemon._register_files
+        
+        def record_batch(files, start_time=None):
+            batches.append(list(files))
+            return original_register(batches[-1], start_time)
+        
+        with patch.object(self.daemon, '_register_files', side_effect=record_batch):
+            self.daemon.discover_and_register_files()
+        
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertTrue(all(isinstance(item, ScannedFile) for batch in batches for item in batch))
+        self.assertEqual(len(self.daemon.db.get_all_files()), 5)
+
+class TestInotifyDiscovery(TestMediaFindingDaemon):
+    """inotify 事件驱动发现测试"""
+    
+    def setUp(self):
+        super().setUp()
+        if not self.daemon._start_watcher():
+            self.skipTest("当前环境不支持inotify")
+    
+    def tearDown(self):
+        self.daemon._stop_watcher()
+        super().tearDown()
+    
+    def test_close_write_registers_file(self):
+        """测试写入完成的文件立即被注册"""
+        self._create_test_file('event.mp4')
+        self._create_test_file('.hidden.mp4')
+        
+        file_paths = self.daemon.watcher.read_events(timeout=2)
+        self.assertIn(os.path.join(self.media_dir, 'event.mp4'), file_paths)
+        
+        with patch.object(self.daemon, '_transfer_file_to_nas', return_value=True):
+            self.daemon._handle_file_events(file_paths)
+        
+        all_files = [f['filename'] for f in self.daemon.db.get_all_files()]
+        self.assertEqual(all_files, ['event.mp4'])
+    
+    def test_new_subdirectory_is_watched(self):
+        """测试新建子目录自动加入监听"""
+        sub_dir = os.path.join(self.media_dir, 'mission_01')
+        os.makedirs(sub_dir)
+        self.daemon.watcher.read_events(timeout=2)
+        
+        file_path = os.path.join(sub_dir, 'photo.jpg')
+        with open(file_path, 'w') as f:
+            f.write('photo')
+        
+        file_paths = self.daemon.watcher.read_events(timeout=2)
+        self.assertIn(file_path, file_paths)
 
 class TestHashCalculation(TestMediaFindingDaemon):
     """哈希计算测试"""
@@ -263,6 +345,26 @@ class TestHashCalculation(TestMediaFindingDaemon):
         
         print(f"大文件哈希计算耗时: {duration:.2f}秒")
     
+    def test_large_file_merkle_hash(self):
+        """测试 merkle 策略下大文件哈希为 Merkle 根，同一次读取得到整文件摘要"""
+        from chunk_manifest import merkle_root
+        
+        chunk_size = 64 * 1024
+        data = os.urandom(2 * chunk_size + 5)
+        file_path = os.path.join(self.media_dir, 'merkle.bin')
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        self.daemon.full_hash_max_bytes = chunk_size
+        self.daemon.chunk_size = chunk_size
+        self.daemon.large_file_strategy = 'merkle'
+        
+        digests = {}
+        file_hash = self.daemon._calculate_file_hash(file_path, len(data), digests)
+        
+        expected = [hashlib.sha256(data[i:i + chunk_size]).hexdigest() for i in range(0, len(data), chunk_size)]
+        self.assertEqual(file_hash, merkle_root(expected))
+        self.assertEqual(digests['md5'], hashlib.md5(data).hexdigest())
+    
     def test_hash_consistency(self):
         """测试哈希一致性"""
         content = "consistent content"
@@ -277,6 +379,62 @@ class TestHashCalculation(TestMediaFindingDaemon):
         
         # 相同内容应该产生相同哈希
         self.assertEqual(hash1, hash2)
+    
+    def test_multi_digest_single_pass(self):
+        """测试一次读取同时计算多个摘要，mmap 与 readinto 两种路径结果一致"""
+        from file_hasher import FileHasher
+        
+        data = os.urandom(3 * 1024 * 1024 + 123)
+        file_path = os.path.join(self.media_dir, 'multi.bin')
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        expected = {'sha256': hashlib.sha256(data).hexdigest(), 'md5': hashlib.md5(data).hexdigest()}
+        
+        for mmap_max_bytes in (0, 64 * 1024 * 1024):
+            hasher = FileHasher(max_workers=2, buffer_size=1024 * 1024, mmap_max_bytes=mmap_max_bytes)
+            self.assertEqual(hasher.hash_file(file_path, ('sha256', 'md5')), expected)
+            hasher.close()
+    
+    def test_parallel_hash_files(self):
+        """测试并行计算多个文件，按输入顺序返回并报告失败文件"""
+        from file_hasher import FileHasher
+        
+        paths = [self._create_test_file(f'parallel_{i}.txt', f'content {i}') for i in range(6)]
+        paths.insert(3, os.path.join(self.media_dir, 'missing.txt'))
+        
+        hasher = FileHasher(max_workers=4)
+        results = list(hasher.hash_files(paths, ('md5',)))
+        hasher.close()
+        
+        self.assertEqual([r[0] for r in results], paths)
+        self.assertIsNone(results[3][1])
+        self.assertEqual(results[0][1]['md5'], hashlib.md5(b'content 0').hexdigest())
+    
+    def test_large_file_registers_chunk_manifest(self):
+        """测试大文件登记时保存分块哈希和整文件摘要，file_hash 为 Merkle 根"""
+        from chunk_manifest import merkle_root
+        
+        chunk_size = 64 * 1024
+        data = os.urandom(3 * chunk_size + 17)
+        file_path = os.path.join(self.media_dir, 'large.mp4')
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        self.daemon.full_hash_max_bytes = chunk_size
+        self.daemon.chunk_size = chunk_size
+        self.daemon.large_file_strategy = 'merkle'
+        
+        self.daemon.discover_and_register_files()
+        
+        expected = [hashlib.sha256(data[i:i + chunk_size]).hexdigest() for i in range(0, len(data), chunk_size)]
+        stored_chunk_size, root, chunk_hashes = self.daemon.db.get_chunk_hashes(file_path)
+        self.assertEqual(stored_chunk_size, chunk_size)
+        self.assertEqual(chunk_hashes, expected)
+        self.assertEqual(root, merkle_root(expected))
+        self.assertEqual(self.daemon.db.get_file_info(file_path).file_hash, root)
+        # 同一次读取得到的整文件摘要写入数据库，删除前校验无需再次读取
+        stored = self.daemon.db.get_file_digests(file_path)
+        self.assertEqual(stored.get('md5'), hashlib.md5(data).hexdigest())
+        self.assertEqual(stored.get('sha256'), hashlib.sha256(data).hexdigest())
 
 class TestDatabaseOperations(TestMediaFindingDaemon):
     """数据库操作测试"""
@@ -312,7 +470,51 @@ class TestDatabaseOperations(TestMediaFindingDaemon):
         all_files = self.daemon.db.get_all_files()
         duplicate_files = [f for f in all_files if f['filename'] == 'duplicate.mp4']
         self.assertEqual(len(duplicate_files), 1)
+
+    def test_unchanged_file_skips_hash_and_lookup(self):
+        """测试指纹未变化的文件不再计算哈希和查询数据库"""
+        file_path = self._create_test_file('fingerprint.mp4')
+        self.daemon.discover_and_register_files()
+
+        # 新实例从数据库加载持久化的指纹缓存
+        daemon = MediaFindingDaemon(self.config_path)
+        with patch.object(daemon, '_calculate_file_hash') as mock_hash, \
+             patch.object(daemon.db, 'file_exists') as mock_exists:
+            daemon.discover_and_register_files()
+            mock_hash.assert_not_called()
+            mock_exists.assert_not_called()
+
+        # 修改文件后指纹变化，需要重新检查；已登记的路径由集合差判断，不逐个查询数据库
+        stat = os.stat(file_path)
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        with patch.object(daemon, '_calculate_file_hash') as mock_hash, \
+             patch.object(daemon.db, 'file_exists') as mock_exists, \
+             patch.object(daemon.db, 'get_known_file_paths', wraps=daemon.db.get_known_file_paths) as mock_known:
+            daemon.discover_and_register_files()
+            mock_known.assert_called_once_with()
+            mock_exists.assert_not_called()
+            mock_hash.assert_not_called()
+        self.assertEqual(daemon._get_fingerprint_cache()[file_path][2], os.stat(file_path).st_mtime_ns)
+        daemon.db.close()
     
+    def test_set_difference_registers_only_new_paths(self):
+        """测试发现阶段只对未登记的路径计算哈希并注册"""
+        for i in range(3):
+            self._create_test_file(f'known_{i}.mp4')
+        self.daemon.discover_and_register_files()
+        
+        # 清空指纹缓存，迫使所有文件走已登记路径判断
+        self.daemon._fingerprints.clear()
+        new_path = self._create_test_file('fresh.mp4')
+        with patch.object(self.daemon.db, 'file_exists') as mock_exists, \
+             patch.object(self.daemon, '_calculate_file_hash', return_value='abc') as mock_hash:
+            self.daemon.discover_and_register_files()
+            mock_exists.assert_not_called()
+            self.assertEqual([c.args[0] for c in mock_hash.call_args_list], [new_path])
+        
+        self.assertIn(new_path, self.daemon._get_known_paths())
+        self.assertEqual(len(self.daemon.db.get_all_files()), 4)
+
     def test_transfer_status_update(self):
         """测试传输状态更新"""
         # 创建测试文件并注册
@@ -327,6 +529,465 @@ class TestDatabaseOperations(TestMediaFindingDaemon):
         self.assertEqual(len(transferred_files), 1)
         self.assertEqual(transferred_files[0]['filename'], 'status_test.mp4')
 
+    def test_transfer_schedules_delayed_delete(self):
+        """测试启用同步后删除时，传输成功的文件加入延迟删除调度"""
+        with open(self.config_path) as f:
+            config = json.load(f)
+        config['sync_settings'] = {'delete_after_sync': True, 'safe_delete_delay_minutes': 30,
+                                   'pending_deletes_file': os.path.join(self.test_dir, 'pending.json')}
+        with open(self.config_path, 'w') as f:
+            json.dump(config, f)
+        daemon = MediaFindingDaemon(self.config_path)
+        file_path = self._create_test_file('delete_me.mp4')
+
+        with patch.object(daemon, '_transfer_file_to_nas', return_value=True):
+            daemon.discover_and_register_files()
+            daemon.process_pending_files()
+
+        tasks = daemon.delete_manager.pending_deletes
+        self.assertEqual([task.local_file_path for task in tasks], [file_path])
+        self.assertTrue(tasks[0].remote_file_path.endswith('/delete_me.mp4'))
+        self.assertAlmostEqual(daemon.delete_manager.next_due_in(), 1800, delta=5)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'pending_deletes.db')))
+        daemon.stop()
+
+class TestParallelTransfer(TestMediaFindingDaemon):
+    """并发传输引擎测试"""
+    
+    def test_concurrent_transfer_claims_each_file_once(self):
+        """测试并发传输时每个文件只被领取一次，且并发数不超过上限"""
+        import threading
+        
+        for i in range(5):
+            self._create_test_file(f'parallel_{i}.jpg', 'x' * (i + 1))
+        self.daemon.discover_and_register_files()
+        
+        self.daemon.transfer_engine.max_workers = 3
+        state_lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+        transferred = []
+        
+        def fake_transfer(file_path):
+            with state_lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.1)
+            with state_lock:
+                state['active'] -= 1
+                transferred.append(os.path.basename(file_path))
+            return True
+        
+        with patch.object(self.daemon, '_transfer_file_to_nas', side_effect=fake_transfer):
+            self.daemon.process_pending_files()
+        
+        self.assertEqual(sorted(transferred), [f'parallel_{i}.jpg' for i in range(5)])
+        self.assertGreater(state['peak'], 1)
+        self.assertLessEqual(state['peak'], 3)
+        self.assertEqual(len(self.daemon.db.get_files_by_status(FileStatus.TRANSFERRED.value)), 5)
+    
+    def test_inflight_bytes_limiter(self):
+        """测试在途字节上限：超限时等待，超大单文件在空闲时放行"""
+        from transfer_engine import InflightBytesLimiter
+        import threading
+        
+        limiter = InflightBytesLimiter(100)
+        limiter.acquire(150)
+        self.assertEqual(limiter.inflight, 150)
+        
+        acquired = threading.Event()
+        waiter = threading.Thread(target=lambda: (limiter.acquire(10), acquired.set()))
+        waiter.start()
+        self.assertFalse(acquired.wait(0.1))
+        
+        limiter.release(150)
+        self.assertTrue(acquired.wait(1))
+        waiter.join()
+        self.assertEqual(limiter.inflight, 10)
+
+class TestBulkOperations(TestMediaFindingDaemon):
+    """批量插入和批量状态更新测试"""
+    
+    def test_bulk_insert_reports_per_row_outcome(self):
+        """测试批量插入返回逐行结果：已存在和本批重复的记录为False"""
+        db = self.daemon.db
+        db.insert_file_record('/media/existing.mp4', 'existing.mp4', 10)
+        
+        records = [('/media/bulk_{}.jpg'.format(i), 'bulk_{}.jpg'.format(i), i, 'h{}'.format(i), 'completed')
+                   for i in range(1200)]
+        records += [('/media/existing.mp4', 'existing.mp4', 10), ('/media/bulk_0.jpg', 'bulk_0.jpg', 0)]
+        
+        results = db.insert_file_records_bulk(records)
+        
+        self.assertEqual(results, [True] * 1200 + [False, False])
+        info = db.get_file_info('/media/bulk_5.jpg')
+        self.assertEqual(info.file_hash, 'h5')
+        self.assertEqual(info.download_status.value, 'completed')
+        self.assertEqual(info.transfer_status.value, 'pending')
+    
+    def test_bulk_status_update(self):
+        """测试批量状态更新按顺序应用并返回逐行结果"""
+        db = self.daemon.db
+        db.insert_file_records_bulk([('/media/a.jpg', 'a.jpg', 1), ('/media/b.jpg', 'b.jpg', 2)])
+        
+        results = db.update_transfer_statuses_bulk([
+            ('/media/a.jpg', DBFileStatus.COMPLETED, ''),
+            ('/media/b.jpg', DBFileStatus.FAILED, 'timeout'),
+            ('/media/missing.jpg', DBFileStatus.FAILED, 'gone'),
+        ])
+        
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(db.get_file_info('/media/a.jpg').transfer_status, DBFileStatus.COMPLETED)
+        failed = db.get_file_info('/media/b.jpg')
+        self.assertEqual(failed.transfer_status, DBFileStatus.FAILED)
+        self.assertEqual(failed.transfer_retry_count, 1)
+        self.assertEqual(failed.last_error_message, 'timeout')
+
+class TestDigestReuse(TestMediaFindingDaemon):
+    """文件摘要复用测试"""
+    
+    def test_registration_stores_digests_for_reuse(self):
+        """测试登记时一次读取保存 sha256 和 md5，安全删除直接复用而不再读取文件"""
+        from safe_delete_manager import SafeDeleteManager
+
+        file_path = self._create_test_file('digest.jpg', 'digest content')
+        self.daemon.discover_and_register_files()
+
+        info = self.daemon.db.get_file_info(file_path)
+        expected_md5 = hashlib.md5(b'digest content').hexdigest()
+        self.assertEqual(info.file_hash, hashlib.sha256(b'digest content').hexdigest())
+        self.assertEqual(info.file_md5, expected_md5)
+        self.assertEqual(info.file_digests['sha256'], info.file_hash)
+
+        manager = SafeDeleteManager(pending_file=os.path.join(self.test_dir, 'pending.json'),
+                                    status_db=self.daemon.db)
+        with patch('safe_delete_manager.get_file_hasher') as mock_hasher:
+            self.assertEqual(manager._calculate_file_checksum(file_path), expected_md5)
+            mock_hasher.assert_not_called()
+
+class TestReadPool(TestMediaFindingDaemon):
+    """只读连接池测试"""
+    
+    def test_reads_do_not_wait_for_writer_lock(self):
+        """测试查询使用只读连接：持有写连接锁时统计和列表查询仍可完成，且只读连接拒绝写入"""
+        db = self.daemon.db
+        db.insert_file_records_bulk([('/media/r{}.jpg'.format(i), 'r{}.jpg'.format(i), i) for i in range(5)])
+
+        results = {}
+        def report():
+            results['stats'] = db.get_statistics()
+            results['files'] = db.get_all_files()
+
+        with db.lock:
+            reader = threading.Thread(target=report)
+            reader.start()
+            reader.join(timeout=5)
+            self.assertFalse(reader.is_alive())
+
+        self.assertEqual(results['stats']['total_files'], 5)
+        self.assertEqual(len(results['files']), 5)
+        with db._read_connection() as conn:
+            self.assertIsNot(conn, db.connection)
+            with self.assertRaises(sqlite3.Error):
+                conn.execute("DELETE FROM media_transfer_status")
+
+class TestPagedQueries(TestMediaFindingDaemon):
+    """键集分页查询测试"""
+    
+    def test_iter_files_keyset_pages(self):
+        """测试键集分页迭代：逐页取完全部记录，支持状态过滤和从指定 id 续读"""
+        db = self.daemon.db
+        db.insert_file_records_bulk([('/media/p{:02d}.jpg'.format(i), 'p{:02d}.jpg'.format(i), i) for i in range(25)])
+        db.update_transfer_statuses_bulk([('/media/p{:02d}.jpg'.format(i), DBFileStatus.COMPLETED, '')
+                                          for i in range(0, 25, 5)])
+
+        with patch.object(db, '_read_connection', wraps=db._read_connection) as mock_reader:
+            files = list(db.iter_files(page=10))
+        self.assertEqual([f.file_name for f in files], ['p{:02d}.jpg'.format(i) for i in range(25)])
+        self.assertEqual(mock_reader.call_count, 3)
+
+        completed = [f['filename'] for f in db.iter_file_dicts(status='transferred', page=2)]
+        self.assertEqual(completed, ['p00.jpg', 'p05.jpg', 'p10.jpg', 'p15.jpg', 'p20.jpg'])
+
+        resumed = list(db.iter_files(after_id=files[19].id, page=4))
+        self.assertEqual([f.file_name for f in resumed], ['p{:02d}.jpg'.format(i) for i in range(20, 25)])
+
+    def test_ready_and_failed_files_paged_in_time_order(self):
+        """测试待传输和失败文件按时间列键集分页，跨页顺序与单次查询一致"""
+        db = self.daemon.db
+        paths = ['/media/t{}.jpg'.format(i) for i in range(7)]
+        db.insert_file_records_bulk([(path, os.path.basename(path), 1) for path in paths])
+        with db.lock:
+            for i, path in enumerate(paths):
+                # 创建时间与插入顺序相反，并让两条记录的时间相同以覆盖 id 作为第二分页键
+                db.connection.execute(
+                    "UPDATE media_transfer_status SET download_status = 'completed', created_at = ?, updated_at = ? "
+                    "WHERE file_path = ?", ('2026-10-16 00:00:{:02d}'.format(max(10 - i, 8)),
+                                            '2026-10-16 00:00:{:02d}'.format(i), path))
+            db.connection.execute("UPDATE media_transfer_status SET transfer_status = 'failed', "
+                                  "transfer_retry_count = 1 WHERE file_path IN (?, ?, ?)", paths[4:])
+            db.connection.execute("UPDATE media_transfer_status SET transfer_retry_count = 5 WHERE file_path = ?",
+                                  (paths[5],))
+            db.connection.commit()
+
+        ready = [f.file_name for f in db.iter_ready_to_transfer_files(page=2)]
+        self.assertEqual(ready, ['t2.jpg', 't3.jpg', 't1.jpg', 't0.jpg'])
+        self.assertEqual([f.file_name for f in db.get_ready_to_transfer_files(limit=3)], ready[:3])
+
+        failed = [f.file_name for f in db.iter_failed_files(max_retry_count=3, page=1)]
+        self.assertEqual(failed, ['t4.jpg', 't6.jpg'])
+        self.assertEqual([f.file_name for f in db.get_failed_files()], failed)
+
+class TestClaimQueue(TestMediaFindingDaemon):
+    """基于租约的领取队列测试"""
+    
+    def _register(self, count: int):
+        for i in range(count):
+            self._create_test_file(f'claim_{i}.jpg', 'x' * (i + 1))
+        self.daemon.discover_and_register_files()
+    
+    def test_workers_claim_disjoint_batches(self):
+        """测试多个工作者领取的文件互不重叠，且续约只对持有者生效"""
+        self._register(5)
+        db = self.daemon.db
+        
+        first = db.claim_batch('worker-a', 2)
+        second = db.claim_batch('worker-b', 10, order='oldest_first')
+        
+        self.assertEqual([f.file_name for f in first], ['claim_0.jpg', 'claim_1.jpg'])
+        self.assertEqual(len(second), 3)
+        self.assertFalse({f.file_path for f in first} & {f.file_path for f in second})
+        self.assertEqual(db.claim_batch('worker-c', 1), [])
+        
+        paths = [f.file_path for f in first]
+        self.assertEqual(db.renew_lease('worker-a', paths), 2)
+        self.assertEqual(db.renew_lease('worker-b', paths), 0)
+    
+    def test_reclaim_expired_leases(self):
+        """测试租约过期和无租约的遗留文件被回收，完成的文件释放租约"""
+        self._register(3)
+        db = self.daemon.db
+        
+        expired = db.claim_batch('crashed-worker', 1, lease_seconds=-1)
+        active = db.claim_batch('live-worker', 1)
+        legacy = db.claim_batch('old-version', 1)
+        db.connection.execute("""
+            UPDATE media_transfer_status
+            SET lease_expires_at = NULL, transfer_start_time = datetime('now', '-2 hours')
+            WHERE file_path = ?
+        """, (legacy[0].file_path,))
+        db.connection.commit()
+        
+        self.assertEqual(db.reclaim_expired(), 2)
+        reclaimed = db.claim_batch('new-worker', 10)
+        self.assertEqual(sorted(f.file_path for f in reclaimed),
+                         sorted([expired[0].file_path, legacy[0].file_path]))
+        
+        db.update_transfer_status(active[0].file_path, DBFileStatus.COMPLETED)
+        row = db.connection.execute(
+            "SELECT claimed_by, lease_expires_at FROM media_transfer_status WHERE file_path = ?",
+            (active[0].file_path,)).fetchone()
+        self.assertEqual(row['claimed_by'], '')
+        self.assertIsNone(row['lease_expires_at'])
+    
+    def test_existing_database_is_migrated(self):
+        """测试旧版本数据库自动补充租约字段"""
+        legacy_path = os.path.join(self.test_dir, 'legacy.db')
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("""
+            CREATE TABLE media_transfer_status (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT NOT NULL UNIQUE,
+                file_name TEXT NOT NULL,
+                file_size INTEGER DEFAULT 0,
+                file_hash TEXT DEFAULT '',
+                download_status TEXT NOT NULL DEFAULT 'pending',
+                download_start_time DATETIME,
+                download_end_time DATETIME,
+                download_retry_count INTEGER DEFAULT 0,
+                transfer_status TEXT NOT NULL DEFAULT 'pending',
+                transfer_start_time DATETIME,
+                transfer_end_time DATETIME,
+                transfer_retry_count INTEGER DEFAULT 0,
+                last_error_message TEXT DEFAULT '',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            INSERT INTO media_transfer_status (file_path, file_name, download_status)
+            VALUES ('/legacy/a.mp4', 'a.mp4', 'completed')
+        """)
+        conn.commit()
+        conn.close()
+        
+        db = MediaStatusDB(legacy_path)
+        self.assertTrue(db.connect())
+        claimed = db.claim_batch('worker', 1)
+        self.assertEqual([f.file_path for f in claimed], ['/legacy/a.mp4'])
+        db.close()
+
+class TestBatchTransfer(TestMediaFindingDaemon):
+    """按日期目录批量 rsync 传输测试"""
+    
+    def test_batch_statuses_follow_itemized_output(self):
+        """测试按 rsync 逐项输出更新每个文件的状态"""
+        import subprocess
+        
+        for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+            self._create_test_file(name)
+        self.daemon.discover_and_register_files()
+        self.daemon.transfer_mode = 'batch'
+        
+        rsync_output = "<f+++++++++ a.jpg\n.f          b.jpg\n"
+        rsync_calls = []
+        
+        def fake_run(cmd, **kwargs):
+            rsync_calls.append(cmd)
+            return subprocess.CompletedProcess(cmd, 23, stdout=rsync_output, stderr='partial transfer')
+        
+        ok = subprocess.CompletedProcess([], 0, stdout='', stderr='')
+        with patch.object(self.daemon.ssh_pool, 'run', return_value=ok) as mock_mkdir, \
+             patch('media_finding_daemon.subprocess.run', side_effect=fake_run):
+            self.daemon.process_pending_files()
+        
+        # 三个文件只调用一次 rsync 和一次 mkdir
+        self.assertEqual(len(rsync_calls), 1)
+        self.assertEqual(mock_mkdir.call_count, 1)
+        self.assertTrue(any(arg.startswith('--files-from=') for arg in rsync_calls[0]))
+        self.assertEqual(rsync_calls[0].count('-ii'), 1)
+        self.assertIn('--out-format=%i %n', rsync_calls[0])
+        self.assertNotIn('--itemize-changes', rsync_calls[0])
+        
+        transferred = sorted(f['filename'] for f in self.daemon.db.get_files_by_status('completed'))
+        failed = [f['filename'] for f in self.daemon.db.get_files_by_status('failed')]
+        self.assertEqual(transferred, ['a.jpg', 'b.jpg'])
+        self.assertEqual(failed, ['c.jpg'])
+    
+    def test_duplicate_names_split_into_separate_groups(self):
+        """测试同名文件被拆分到不同的批次"""
+        from types import SimpleNamespace
+        
+        files = [
+            SimpleNamespace(file_name='x.jpg', file_path='/a/x.jpg', file_size=1),
+            SimpleNamespace(file_name='x.jpg', file_path='/b/x.jpg', file_size=1),
+            SimpleNamespace(file_name='y.jpg', file_path='/a/y.jpg', file_size=1),
+        ]
+        groups = self.daemon._group_files_by_remote_dir(files)
+        
+        self.assertEqual(len(groups), 2)
+        self.assertEqual([f.file_path for f in groups[0]], ['/a/x.jpg', '/a/y.jpg'])
+        self.assertEqual([f.file_path for f in groups[1]], ['/b/x.jpg'])
+
+    def test_itemized_names_keep_spaces_and_unescape(self):
+        """测试按固定宽度的变更项解析文件名：保留首尾空格并还原 \\#ooo 转义，跳过目录和接收方条目"""
+        output = ("<f+++++++++  lead.jpg \n"
+                  ".f          caf\\#303\\#251.jpg\n"
+                  "<f+++++++++ a\\#012b.jpg\n"
+                  "cd+++++++++ 2026/\n"
+                  ">f.st...... recv.jpg\n")
+        self.assertEqual(self.daemon._parse_rsync_itemized_output(output),
+                         {' lead.jpg ', 'café.jpg', 'a\nb.jpg'})
+
+class TestSmallFileAggregation(TestMediaFindingDaemon):
+    """小文件聚合上传测试"""
+    
+    def setUp(self):
+        super().setUp()
+        self.daemon.small_file_aggregation = True
+        self.daemon.small_file_max_bytes = 1024
+    
+    def test_small_files_grouped_by_name_into_transfer_date_directory(self):
+        """测试 tar_stream 后端下小文件进入传输当天的目录，重名文件分到下一个 tar 流，大文件留给常规传输"""
+        os.makedirs(os.path.join(self.media_dir, 'flight_02'))
+        for name in ('a.json', 'b.txt', 'c.jpg', os.path.join('flight_02', 'a.json')):
+            self._create_test_file(name)
+        self._create_test_file('big.mp4', 'x' * 4096)
+        self.daemon.discover_and_register_files()
+        self.daemon.transfer_backend = 'tar_stream'
+        
+        def fake_upload(remote_base, members):
+            return {path: (not path.endswith('c.jpg'), '' if not path.endswith('c.jpg') else '远端校验和不一致')
+                    for path, _ in members}
+        
+        with patch.object(self.daemon, '_get_date_path', return_value='2026/10/16'), \
+             patch.object(self.daemon.stream_uploader, 'upload', side_effect=fake_upload) as mock_upload, \
+             patch.object(self.daemon, '_transfer_file_to_nas', return_value=True) as mock_transfer:
+            self.daemon.process_pending_files()
+        
+        uploads = sorted((call.args[0], sorted(member for _, member in call.args[1]))
+                         for call in mock_upload.call_args_list)
+        remote_dir = f'{self.daemon.nas_destination}/2026/10/16'
+        self.assertEqual(uploads, [(remote_dir, ['a.json']), (remote_dir, ['a.json', 'b.txt', 'c.jpg'])])
+        self.assertEqual([call.args[0] for call in mock_transfer.call_args_list],
+                         [os.path.join(self.media_dir, 'big.mp4')])
+        
+        transferred = sorted(f['filename'] for f in self.daemon.db.get_files_by_status('completed'))
+        failed = self.daemon.db.get_files_by_status('failed')
+        self.assertEqual(transferred, ['a.json', 'a.json', 'b.txt', 'big.mp4'])
+        self.assertEqual([f['filename'] for f in failed], ['c.jpg'])
+    
+    def test_rsync_backend_batches_small_files(self):
+        """测试 rsync 后端下小文件一次 rsync --files-from 传到当天的目录，不使用 tar 流"""
+        import subprocess
+        
+        self._create_test_file('a.json')
+        self._create_test_file('b.txt')
+        self.daemon.discover_and_register_files()
+        
+        rsync_calls = []
+        
+        def fake_run(cmd, **kwargs):
+            rsync_calls.append(cmd)
+            return subprocess.CompletedProcess(cmd, 0, stdout="<f+++++++++ a.json\n<f+++++++++ b.txt\n", stderr='')
+        
+        ok = subprocess.CompletedProcess([], 0, stdout='', stderr='')
+        with patch.object(self.daemon, '_get_date_path', return_value='2026/10/16'), \
+             patch.object(self.daemon.ssh_pool, 'run', return_value=ok), \
+             patch.object(self.daemon.stream_uploader, 'upload') as mock_upload, \
+             patch('media_finding_daemon.subprocess.run', side_effect=fake_run):
+            self.daemon.process_pending_files()
+        
+        mock_upload.assert_not_called()
+        self.assertEqual(len(rsync_calls), 1)
+        self.assertEqual(rsync_calls[0][-1], f"{self.daemon.nas_ssh_alias}:{self.daemon.nas_destination}/2026/10/16/")
+        self.assertEqual(len(self.daemon.db.get_files_by_status('completed')), 2)
+
+class TestCompressionPolicy(TestMediaFindingDaemon):
+    """传输压缩策略测试"""
+    
+    def test_compression_chosen_by_extension_and_entropy(self):
+        """测试已压缩格式和高熵内容不压缩，文本类内容压缩"""
+        policy = self.daemon.compression_policy
+        log_file = self._create_test_file('flight.log', 'lat,lon,alt\n' * 20000)
+        random_file = os.path.join(self.media_dir, 'payload.bin')
+        with open(random_file, 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+        jpg_file = self._create_test_file('photo.jpg', 'not really a jpeg\n' * 10000)
+        
+        self.assertTrue(policy.should_compress(log_file))
+        self.assertFalse(policy.should_compress(random_file))
+        self.assertFalse(policy.should_compress(jpg_file))
+        
+        self.assertEqual(policy.rsync_args([jpg_file, random_file]), [])
+        args = policy.rsync_args([jpg_file, log_file])
+        self.assertEqual(args[0], '-z')
+        self.assertIn('mp4', args[1].split('=', 1)[1].split('/'))
+    
+    def test_global_switch_disables_compression(self):
+        """测试 enable_compression 关闭时任何文件都不压缩"""
+        with open(self.config_path) as f:
+            config = json.load(f)
+        config['dock_transfer_config'] = {'performance': {'enable_compression': False}}
+        with open(self.config_path, 'w') as f:
+            json.dump(config, f)
+        
+        daemon = MediaFindingDaemon(config_path=self.config_path)
+        try:
+            log_file = self._create_test_file('flight.log', 'lat,lon,alt\n' * 20000)
+            self.assertEqual(daemon.compression_policy.rsync_args([log_file]), [])
+        finally:
+            daemon.db.close()
+
 class TestPerformance(TestMediaFindingDaemon):
     """性能测试"""
     
@@ -493,8 +1154,18 @@ def main():
         test_classes = [
             TestFileFiltering,
             TestFileDiscovery,
+            TestInotifyDiscovery,
             TestHashCalculation,
             TestDatabaseOperations,
+            TestParallelTransfer,
+            TestBulkOperations,
+            TestDigestReuse,
+            TestReadPool,
+            TestPagedQueries,
+            TestClaimQueue,
+            TestBatchTransfer,
+            TestSmallFileAggregation,
+            TestCompressionPolicy,
             TestPerformance,
             TestConfigValidation
         ]
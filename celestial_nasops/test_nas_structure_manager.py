@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NAS目录结构管理器测试脚本
+
+使用伪造的 ssh（在本机 sh 中执行远程命令）验证：
+1. 远程目录存在性缓存，已确认的目录不再发起远程调用
+2. 批量预取目录后按日期列出目录结构
+3. 一次远程 find 建立的目录清单支撑结构报告、验证和目录大小统计
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import json
+import unittest
+from datetime import datetime, timedelta
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ssh_connection_pool import get_ssh_pool
+from nas_structure_manager import NASStructureManager, get_remote_dir_cache
+from test_ssh_connection_pool import FakeSSHTestCase
+
+
+class NASStructureTestCase(FakeSSHTestCase):
+    """NAS目录结构管理器测试基类"""
+
+    def setUp(self):
+        super().setUp()
+        self.remote_base = os.path.join(self.test_dir, 'remote')
+        os.makedirs(self.remote_base)
+
+        config_path = os.path.join(self.test_dir, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({
+                "nas_settings": {
+                    "host": "127.0.0.1",
+                    "username": "tester",
+                    "ssh_alias": "nas-test",
+                    "base_path": self.remote_base
+                },
+                "logging": {"level": "WARNING"}
+            }, f)
+
+        get_ssh_pool('nas-test', control_dir=self.control_dir)
+        get_remote_dir_cache().invalidate('nas-test')
+        self.manager = NASStructureManager(config_file=config_path)
+
+    def tearDown(self):
+        get_remote_dir_cache().invalidate('nas-test')
+        super().tearDown()
+
+    def remote_execs(self):
+        """伪造 ssh 实际执行的远程命令（不含建连探测）"""
+        return [event for event in self.read_ssh_log() if event.startswith('exec ') and event != 'exec true']
+
+
+class TestRemoteDirectoryCache(NASStructureTestCase):
+    """远程目录存在性缓存测试"""
+
+    def test_ensure_directory_once(self):
+        """测试同一日期目录只执行一次 mkdir -p"""
+        file_date = datetime(2026, 10, 16)
+        for _ in range(3):
+            self.assertTrue(self.manager.ensure_directory_exists(file_date))
+
+        self.assertTrue(os.path.isdir(os.path.join(self.remote_base, '2026/10/16')))
+        self.assertEqual(len(self.remote_execs()), 1)
+        self.assertTrue(self.manager.verify_directory_exists(file_date))
+        self.assertEqual(len(self.remote_execs()), 1)
+
+    def test_missing_directory_not_reported(self):
+        """测试不存在的目录不会被误判为存在"""
+        self.assertFalse(self.manager.verify_directory_exists(datetime(2020, 1, 1)))
+
+    def test_list_structure_without_per_day_checks(self):
+        """测试列出目录结构时不再逐日远程检查目录"""
+        today = datetime.now()
+        existing = today - timedelta(days=2)
+        os.makedirs(os.path.join(self.remote_base, existing.strftime('%Y/%m/%d')))
+
+        directories = self.manager.list_directory_structure(today - timedelta(days=9), today)
+
+        self.assertEqual(len(directories), 10)
+        self.assertEqual([d['date'] for d in directories if d['exists']], [existing.strftime('%Y-%m-%d')])
+        self.assertFalse(any(event.startswith('exec test -d') for event in self.remote_execs()))
+
+
+class TestRemoteInventory(NASStructureTestCase):
+    """远程目录清单测试"""
+
+    def _write_file(self, relative_path: str, size: int):
+        path = os.path.join(self.remote_base, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_report_uses_single_find(self):
+        """测试结构报告、验证和目录大小只需一次远程 find"""
+        today = datetime.now()
+        yesterday = today - timedelta(days=1)
+        self._write_file(os.path.join(today.strftime('%Y/%m/%d'), 'a.jpg'), 100)
+        self._write_file(os.path.join(today.strftime('%Y/%m/%d'), 'b.mp4'), 250)
+        self._write_file(os.path.join(yesterday.strftime('%Y/%m/%d'), 'c.jpg'), 50)
+
+        report = self.manager.generate_structure_report()
+        validation = self.manager.validate_structure()
+
+        self.assertIn('文件数量: 3', report)
+        self.assertEqual(validation['file_count'], 3)
+        self.assertEqual(validation['total_size'], 400)
+        self.assertEqual(self.manager.get_directory_size(today), 350)
+        self.assertIsNone(self.manager.get_directory_size(today - timedelta(days=3)))
+
+        directories = {d['date']: d for d in self.manager.list_directory_structure(today - timedelta(days=2), today)}
+        self.assertEqual(directories[today.strftime('%Y-%m-%d')]['file_count'], 2)
+        self.assertEqual(directories[yesterday.strftime('%Y-%m-%d')]['file_count'], 1)
+        self.assertFalse(directories[(today - timedelta(days=2)).strftime('%Y-%m-%d')]['exists'])
+
+        finds = [event for event in self.remote_execs() if event.startswith('exec find')]
+        self.assertEqual(len(finds), 2)  # 报告一次，显式 validate_structure 刷新一次
+        self.assertFalse(any(event.startswith(('exec du', 'exec ls', 'exec test')) for event in self.remote_execs()))
+
+    def test_missing_base_path(self):
+        """测试基础路径不存在时验证失败"""
+        self.manager.nas_base_path = os.path.join(self.test_dir, 'missing')
+        validation = self.manager.validate_structure()
+        self.assertFalse(validation['base_path_exists'])
+        self.assertTrue(validation['errors'])
+
+
+if __name__ == '__main__':
+    unittest.main()
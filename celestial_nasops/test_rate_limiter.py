@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传带宽限制测试脚本
+
+验证：
+1. 分时段上限（含跨零点窗口）
+2. 并发 rsync 进程的 --bwlimit 之和不超过上限
+3. 令牌桶按上限减去 rsync 预留带宽的速率放行
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rate_limiter import BandwidthLimiter, BandwidthSchedule, mbps_to_bytes
+
+
+class FakeClock:
+    """可手动推进的时钟，sleep 直接推进时间"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def __call__(self):
+        return self.value
+
+    def sleep(self, seconds):
+        self.value += seconds
+
+
+class TestBandwidthSchedule(unittest.TestCase):
+    """分时段上限测试"""
+
+    def test_windows_and_overnight(self):
+        """测试时段内使用窗口上限，跨零点窗口覆盖夜间，其余时间使用默认上限"""
+        schedule = BandwidthSchedule(50, [
+            {"start": "08:00", "end": "18:00", "limit_mbps": 20},
+            {"start": "22:00", "end": "06:00", "limit_mbps": 0},
+        ])
+        self.assertEqual(schedule.limit_mbps(datetime(2026, 1, 1, 9, 30)), 20)
+        self.assertEqual(schedule.limit_mbps(datetime(2026, 1, 1, 18, 0)), 50)
+        self.assertEqual(schedule.limit_mbps(datetime(2026, 1, 1, 23, 15)), 0)
+        self.assertEqual(schedule.limit_mbps(datetime(2026, 1, 1, 3, 0)), 0)
+
+        with self.assertRaises(ValueError):
+            BandwidthSchedule(0, [{"start": "25:00", "end": "06:00"}])
+
+
+class TestBandwidthLimiter(unittest.TestCase):
+    """带宽限制器测试"""
+
+    def test_concurrent_rsync_limits_stay_under_cap(self):
+        """测试并发 rsync 各自分得上限的一份，合计不超过上限；不限速时不传参数"""
+        limiter = BandwidthLimiter(BandwidthSchedule(40), streams=4)
+        with limiter.rsync_stream() as first, limiter.rsync_stream() as second, \
+                limiter.rsync_stream() as third, limiter.rsync_stream() as fourth:
+            limits = [int(args[0].split('=')[1]) for args in (first, second, third, fourth)]
+        self.assertLessEqual(sum(limits) * 1024, mbps_to_bytes(40))
+        self.assertEqual(limiter._reserved, 0)
+
+        with BandwidthLimiter(BandwidthSchedule(0)).rsync_stream() as args:
+            self.assertEqual(args, [])
+
+    def test_token_bucket_rate_excludes_rsync_reservations(self):
+        """测试令牌桶速率为上限减去 rsync 预留部分"""
+        clock = FakeClock()
+        limiter = BandwidthLimiter(BandwidthSchedule(8), streams=2, clock=clock, sleep=clock.sleep)
+        limit = mbps_to_bytes(8)
+
+        for _ in range(10):
+            limiter.consume(int(limit / 10))
+        self.assertAlmostEqual(clock.value, 1.0, places=3)
+
+        with limiter.rsync_stream():
+            start = clock.value
+            for _ in range(10):
+                limiter.consume(int(limit / 10))
+            # 上一阶段的欠额按新速率偿还，多出约 0.1 秒
+            self.assertAlmostEqual(clock.value - start, 2.0, delta=0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
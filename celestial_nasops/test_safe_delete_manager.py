@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+安全删除管理器测试脚本
+
+使用伪造的 ssh（在本机 sh 中执行远程命令）验证：
+1. 到期任务在一次远程会话中批量验证，校验不一致或远端缺失的文件保留
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import unittest
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ssh_connection_pool import get_ssh_pool
+from safe_delete_manager import SafeDeleteManager
+from test_ssh_connection_pool import FakeSSHTestCase
+
+
+class TestSafeDeleteBatchVerification(FakeSSHTestCase):
+    """安全删除批量验证测试"""
+
+    def test_pending_deletes_verified_in_one_session(self):
+        """测试到期任务只用一次远程命令验证，校验不一致或远端缺失的文件保留"""
+        local_dir = os.path.join(self.test_dir, 'local')
+        remote_dir = os.path.join(self.test_dir, 'remote')
+        os.makedirs(local_dir)
+        os.makedirs(remote_dir)
+
+        get_ssh_pool('nas-test', control_dir=self.control_dir)
+        manager = SafeDeleteManager(delay_minutes=0, nas_alias='nas-test',
+                                    pending_file=os.path.join(self.test_dir, 'pending.json'))
+
+        names = ['match.mp4', 'corrupt.mp4', 'missing.mp4', 'exists_only.mp4', "it's here.mp4"]
+        for name in names:
+            with open(os.path.join(local_dir, name), 'w') as f:
+                f.write(f'content of {name}')
+            if name != 'missing.mp4':
+                with open(os.path.join(remote_dir, name), 'w') as f:
+                    f.write('corrupted' if name == 'corrupt.mp4' else f'content of {name}')
+        for name in names:
+            checksum = '' if name == 'exists_only.mp4' else None
+            self.assertTrue(manager.schedule_delete(os.path.join(local_dir, name),
+                                                    os.path.join(remote_dir, name), checksum))
+
+        success_count, failed_count = manager.process_pending_deletes()
+
+        self.assertEqual((success_count, failed_count), (3, 0))
+        self.assertEqual(sorted(os.listdir(local_dir)), ['corrupt.mp4', 'missing.mp4'])
+        self.assertEqual(manager.get_pending_count(), 2)
+        self.assertEqual(sum(1 for event in self.read_ssh_log() if event.startswith('exec xargs')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSH 连接池测试脚本
+
+使用伪造的 ssh 可执行文件（在本机 sh 中执行远程命令）代替真实 sshd：
+1. 主连接复用
+2. 连接异常后的重建与重试，远程命令自身返回 255 时不重试
+3. 进程内共享连接池，参数冲突时记录警告
+4. 存储管理器通过连接池执行远程命令，清理规则共用一次远程 find 的清单
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import shutil
+import tempfile
+import unittest
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import ssh_connection_pool
+from ssh_connection_pool import SSHConnectionPool, get_ssh_pool
+
+FAKE_SSH_SCRIPT = '''#!/usr/bin/env python3
+import os
+import sys
+import subprocess
+
+args = sys.argv[1:]
+options = {}
+control_op = None
+i = 0
+while i < len(args):
+    arg = args[i]
+    if arg == '-o':
+        key, _, value = args[i + 1].partition('=')
+        options[key] = value
+        i += 2
+    elif arg == '-O':
+        control_op = args[i + 1]
+        i += 2
+    elif arg in ('-S', '-p', '-i', '-l', '-F'):
+        i += 2
+    elif arg.startswith('-'):
+        i += 1
+    else:
+        break
+
+command = ' '.join(args[i + 1:])
+control_path = options.get('ControlPath')
+log_path = os.environ.get('FAKE_SSH_LOG')
+fail_flag = os.environ.get('FAKE_SSH_FAIL_FLAG')
+
+def log(event):
+    if log_path:
+        with open(log_path, 'a') as f:
+            f.write(event + '\\n')
+
+if control_op == 'check':
+    sys.exit(0 if control_path and os.path.exists(control_path) else 255)
+if control_op == 'exit':
+    if control_path and os.path.exists(control_path):
+        os.remove(control_path)
+    log('exit')
+    sys.exit(0)
+
+if fail_flag and os.path.exists(fail_flag):
+    # 模拟主连接断开：控制套接字失效，ssh 输出传输错误
+    os.remove(fail_flag)
+    if control_path and os.path.exists(control_path):
+        os.remove(control_path)
+    sys.stderr.write('mux_client_request_session: read from master failed: Broken pipe\\n')
+    sys.exit(255)
+
+if control_path and options.get('ControlMaster') == 'auto' and not os.path.exists(control_path):
+    open(control_path, 'w').close()
+    log('connect')
+
+log('exec ' + command)
+sys.exit(subprocess.call(['sh', '-c', command]))
+'''
+
+
+def install_fake_ssh(directory: str) -> str:
+    """在指定目录安装伪造的 ssh，并将其加入 PATH 最前面
+
+    Args:
+        directory: 安装目录
+
+    Returns:
+        str: 伪造 ssh 的调用日志文件路径
+    """
+    bin_dir = os.path.join(directory, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    ssh_path = os.path.join(bin_dir, 'ssh')
+    with open(ssh_path, 'w') as f:
+        f.write(FAKE_SSH_SCRIPT)
+    os.chmod(ssh_path, os.stat(ssh_path).st_mode | stat.S_IEXEC)
+
+    log_path = os.path.join(directory, 'fake_ssh.log')
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    os.environ['FAKE_SSH_LOG'] = log_path
+    return log_path
+
+
+class FakeSSHTestCase(unittest.TestCase):
+    """使用伪造 ssh 的测试基类"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp(prefix='ssh_pool_test_')
+        self._saved_env = {key: os.environ.get(key) for key in ('PATH', 'FAKE_SSH_LOG', 'FAKE_SSH_FAIL_FLAG')}
+        self.ssh_log = install_fake_ssh(self.test_dir)
+        self.control_dir = os.path.join(self.test_dir, 'control')
+        ssh_connection_pool.close_all_pools()
+
+    def tearDown(self):
+        ssh_connection_pool.close_all_pools()
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def read_ssh_log(self):
+        """读取伪造 ssh 的调用记录"""
+        if not os.path.exists(self.ssh_log):
+            return []
+        with open(self.ssh_log) as f:
+            return [line.rstrip('\n') for line in f]
+
+
+class TestSSHConnectionPool(FakeSSHTestCase):
+    """SSH 连接池测试"""
+
+    def test_commands_reuse_master_connection(self):
+        """测试多条命令复用同一个主连接"""
+        pool = SSHConnectionPool('nas-test', control_dir=self.control_dir)
+        for i in range(3):
+            result = pool.run(f'echo {i}')
+            self.assertEqual(result.returncode, 0)
+            self.assertEqual(result.stdout.strip(), str(i))
+
+        events = self.read_ssh_log()
+        self.assertEqual(events.count('connect'), 1)
+        self.assertTrue(pool.is_alive())
+
+    def test_reconnect_after_connection_error(self):
+        """测试连接异常（返回码255）时重建主连接并重试"""
+        pool = SSHConnectionPool('nas-test', control_dir=self.control_dir)
+        pool.run('true')
+
+        fail_flag = os.path.join(self.test_dir, 'fail_once')
+        open(fail_flag, 'w').close()
+        os.environ['FAKE_SSH_FAIL_FLAG'] = fail_flag
+
+        result = pool.run('echo recovered')
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), 'recovered')
+        self.assertEqual(self.read_ssh_log().count('connect'), 2)
+
+    def test_remote_exit_255_not_retried(self):
+        """测试远程命令自身返回255（主连接正常）时不重建连接也不重复执行"""
+        pool = SSHConnectionPool('nas-test', control_dir=self.control_dir)
+        pool.run('true')
+
+        result = pool.run('echo once; exit 255')
+        self.assertEqual(result.returncode, 255)
+        self.assertEqual(result.stdout.strip(), 'once')
+        events = self.read_ssh_log()
+        self.assertEqual(events.count('exec echo once; exit 255'), 1)
+        self.assertNotIn('exit', events)
+
+    def test_stdin_is_forwarded(self):
+        """测试标准输入透传到远程命令"""
+        pool = SSHConnectionPool('nas-test', control_dir=self.control_dir)
+        result = pool.run('wc -l', input='a\nb\nc\n')
+        self.assertEqual(result.stdout.strip(), '3')
+
+    def test_shared_pool_per_target(self):
+        """测试同一目标共享连接池实例"""
+        pool_a = get_ssh_pool('nas-test', control_dir=self.control_dir)
+        pool_b = get_ssh_pool('nas-test')
+        pool_c = get_ssh_pool('other-nas', control_dir=self.control_dir)
+        self.assertIs(pool_a, pool_b)
+        self.assertIsNot(pool_a, pool_c)
+        self.assertNotEqual(pool_a.control_path, pool_c.control_path)
+
+    def test_conflicting_pool_settings_logged(self):
+        """测试同一目标再次传入不同参数时记录警告并返回已有实例"""
+        pool = get_ssh_pool('nas-test', control_dir=self.control_dir, connect_timeout=10)
+        with self.assertLogs('SSHConnectionPool', level='WARNING') as logs:
+            self.assertIs(get_ssh_pool('nas-test', control_dir=self.control_dir, connect_timeout=30), pool)
+        self.assertIn('connect_timeout=30', logs.output[0])
+        self.assertEqual(pool.connect_timeout, 10)
+
+
+class TestStorageManagerOverPool(FakeSSHTestCase):
+    """存储管理器通过连接池执行远程命令"""
+
+    def test_storage_info_via_pool(self):
+        """测试通过连接池获取存储信息"""
+        from storage_manager import StorageManager
+
+        config_path = os.path.join(self.test_dir, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({
+                "nas_settings": {"ssh_alias": "nas-test", "base_path": self.test_dir},
+                "storage_management": {"status_file": os.path.join(self.test_dir, 'status.json')}
+            }, f)
+
+        get_ssh_pool('nas-test', control_dir=self.control_dir)
+        manager = StorageManager(config_file=config_path)
+        info = manager.get_storage_info()
+
+        self.assertIsNotNone(info)
+        self.assertGreater(info.total_space, 0)
+        self.assertIn(f'exec df -B1 {self.test_dir}', self.read_ssh_log())
+
+    def test_cleanup_rules_share_inventory(self):
+        """测试多个清理规则共用一次远程 find 的清单"""
+        from storage_manager import StorageManager, CleanupRule
+
+        base = os.path.join(self.test_dir, 'nas')
+        old_time = time.time() - 10 * 86400
+        for relative in ('logs/a.log', 'logs/new.log', 'media/2026/b.jpg', 'media/2026/c.mp4'):
+            path = os.path.join(base, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+            if 'new' not in relative:
+                os.utime(path, (old_time, old_time))
+
+        config_path = os.path.join(self.test_dir, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({"nas_settings": {"ssh_alias": "nas-test", "base_path": base}}, f)
+
+        get_ssh_pool('nas-test', control_dir=self.control_dir)
+        manager = StorageManager(config_file=config_path)
+        inventory = manager.get_inventory()
+
+        logs = manager.find_files_to_cleanup(CleanupRule('*/logs/*', '.log', 7, 1), inventory)
+        media = manager.find_files_to_cleanup(CleanupRule('*/media/*', '.jpg', 7, 2), inventory)
+
+        self.assertEqual(logs, [os.path.join(base, 'logs/a.log')])
+        self.assertEqual(media, [os.path.join(base, 'media/2026/b.jpg')])
+        self.assertEqual(sum(1 for event in self.read_ssh_log() if event.startswith('exec find')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tar 流上传测试脚本
+
+使用伪造的 ssh（在本机 sh 中执行远程命令）验证：
+1. 多个文件（含子目录成员）在一次远程会话中上传，并逐个比对远端校验和
+2. 成员先解包到临时目录，只有校验一致的成员被移动到最终路径
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import sys
+import unittest
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ssh_connection_pool import get_ssh_pool
+from stream_uploader import TarStreamUploader
+from test_ssh_connection_pool import FakeSSHTestCase
+
+
+class TestTarStreamUpload(FakeSSHTestCase):
+    """tar 流上传测试"""
+
+    def test_members_uploaded_in_one_session(self):
+        """测试多个文件（含子目录成员）在一次会话中上传并逐个确认，缺失的源文件单独失败"""
+        source_dir = os.path.join(self.test_dir, 'source')
+        remote_base = os.path.join(self.test_dir, 'nas')
+        os.makedirs(source_dir)
+        contents = {'a.json': b'{"a": 1}', 'b.jpg': os.urandom(300 * 1024), 'c.txt': b''}
+        members = []
+        for name, data in contents.items():
+            path = os.path.join(source_dir, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            members.append((path, f'2026/10/16/{name}'))
+        missing = os.path.join(source_dir, 'missing.txt')
+        members.append((missing, '2026/10/16/missing.txt'))
+
+        pool = get_ssh_pool('nas-test', control_dir=self.control_dir)
+        results = TarStreamUploader(pool).upload(remote_base, members)
+
+        self.assertEqual(results[missing], (False, "源文件不存在"))
+        for path, member in members[:3]:
+            self.assertEqual(results[path], (True, ""))
+            with open(os.path.join(remote_base, member), 'rb') as f:
+                self.assertEqual(f.read(), contents[os.path.basename(path)])
+        self.assertEqual(sum(1 for event in self.read_ssh_log() if event.startswith('exec mkdir')), 1)
+        self.assertEqual(os.listdir(remote_base), ['2026'])
+
+    def test_unverified_member_not_moved_to_final_path(self):
+        """测试校验不一致的成员不会出现在最终路径，临时解包目录被删除"""
+        source_dir = os.path.join(self.test_dir, 'source')
+        remote_base = os.path.join(self.test_dir, 'nas')
+        os.makedirs(source_dir)
+        good, bad = os.path.join(source_dir, 'good.json'), os.path.join(source_dir, 'bad.json')
+        for path in (good, bad):
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1024))
+
+        uploader = TarStreamUploader(get_ssh_pool('nas-test', control_dir=self.control_dir))
+        write_stream = uploader._write_stream
+
+        def corrupt_digest(process, pending, local_digests):
+            error = write_stream(process, pending, local_digests)
+            local_digests[bad] = '0' * 64
+            return error
+
+        uploader._write_stream = corrupt_digest
+        results = uploader.upload(remote_base, [(good, 'good.json'), (bad, 'bad.json')])
+
+        self.assertEqual(results[good], (True, ""))
+        self.assertEqual(results[bad], (False, "远端校验和不一致"))
+        self.assertEqual(os.listdir(remote_base), ['good.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
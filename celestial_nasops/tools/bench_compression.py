@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传输压缩基准：始终 rsync -z vs 按文件压缩策略
+
+用途：
+- 在临时目录生成合成数据（默认 MP4/JPG/DNG/ZIP 类随机内容，加上 LOG/CSV 文本和 LAS 类结构化二进制）；
+- 按 rsync -z 的默认压缩（zlib 级别 6）分别统计 "全部压缩" 和 CompressionPolicy 选择后的
+  CPU 时间、挂钟时间和发送字节数；
+- 按给定链路带宽估算传输耗时（压缩与发送流水线进行，取两者中较大者）。
+
+运行示例：
+  python celestial_nasops/tools/bench_compression.py --media-mb 256 --text-mb 32 --link-mbps 100
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import argparse
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from transfer_policy import CompressionPolicy
+
+BLOCK_SIZE = 256 * 1024
+RSYNC_ZLIB_LEVEL = 6
+
+MEDIA_SUFFIXES = ('.mp4', '.jpg', '.dng', '.zip')
+
+
+def write_random(path, size):
+    """已压缩媒体的替身：随机内容"""
+    with open(path, 'wb') as f:
+        for _ in range(0, size, BLOCK_SIZE):
+            f.write(os.urandom(min(BLOCK_SIZE, size - f.tell())))
+
+
+def write_text(path, size, seed):
+    """飞行日志 / CSV 的替身"""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        while f.tell() < size:
+            f.write(f"{time.time():.3f},{rng.uniform(-90, 90):.6f},{rng.uniform(-180, 180):.6f},"
+                    f"{rng.uniform(0, 120):.2f},OK\n")
+
+
+def write_point_cloud(path, size, seed):
+    """LAS 点云的替身：缓慢变化的定长坐标记录"""
+    rng = random.Random(seed)
+    x = y = z = 0
+    with open(path, 'wb') as f:
+        while f.tell() < size:
+            x += rng.randint(0, 3)
+            y += rng.randint(-2, 2)
+            z += rng.randint(-1, 1)
+            f.write(struct.pack('<iiiHBB', x, y, z, rng.randint(0, 255), 1, 2))
+
+
+def generate_dataset(root, media_mb, text_mb, files_per_kind):
+    """生成合成数据集，返回文件路径列表"""
+    paths = []
+    media_size = media_mb * 1024 * 1024 // (len(MEDIA_SUFFIXES) * files_per_kind)
+    text_size = text_mb * 1024 * 1024 // (2 * files_per_kind)
+    for i in range(files_per_kind):
+        for suffix in MEDIA_SUFFIXES:
+            path = os.path.join(root, f'DJI_{i:04d}{suffix}')
+            write_random(path, media_size)
+            paths.append(path)
+        path = os.path.join(root, f'flight_{i:04d}.log')
+        write_text(path, text_size, i)
+        paths.append(path)
+        path = os.path.join(root, f'survey_{i:04d}.las')
+        write_point_cloud(path, text_size, i)
+        paths.append(path)
+    return paths
+
+
+def compress_file(path):
+    """以 rsync -z 默认级别压缩文件，返回压缩后字节数"""
+    compressor = zlib.compressobj(RSYNC_ZLIB_LEVEL)
+    out = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            out += len(compressor.compress(block))
+    return out + len(compressor.flush())
+
+
+def run(paths, decide):
+    """按 decide(path) 决定是否压缩，返回 (CPU 秒, 挂钟秒, 发送字节数)"""
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    sent = 0
+    for path in paths:
+        if decide(path):
+            sent += compress_file(path)
+        else:
+            # 不压缩时仍需读取文件（与压缩路径的读取成本保持一致）
+            with open(path, 'rb') as f:
+                while f.read(BLOCK_SIZE):
+                    pass
+            sent += os.path.getsize(path)
+    return time.process_time() - cpu_start, time.perf_counter() - wall_start, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='传输压缩基准')
+    parser.add_argument('--media-mb', type=int, default=256, help='合成媒体数据总量（MB）')
+    parser.add_argument('--text-mb', type=int, default=32, help='合成文本和点云数据总量（MB）')
+    parser.add_argument('--files-per-kind', type=int, default=4, help='每种类型的文件数')
+    parser.add_argument('--link-mbps', type=float, default=100.0, help='估算传输耗时使用的链路带宽（Mbit/s）')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_compression_')
+    try:
+        paths = generate_dataset(root, args.media_mb, args.text_mb, args.files_per_kind)
+        total = sum(os.path.getsize(path) for path in paths)
+        print(f"文件数: {len(paths)}, 数据量: {total / 1024 / 1024:.1f} MB, 链路带宽: {args.link_mbps} Mbit/s")
+
+        policy = CompressionPolicy()
+        decisions = {path: policy.should_compress(path) for path in paths}
+        compressed_count = sum(decisions.values())
+        print(f"策略选择压缩的文件: {compressed_count}/{len(paths)}")
+
+        link_bytes_per_second = args.link_mbps * 1e6 / 8
+        results = {}
+        for label, decide in (('始终 -z', lambda path: True),
+                              ('按文件策略', lambda path: policy.should_compress(path)),
+                              ('不压缩', lambda path: False)):
+            cpu, wall, sent = run(paths, decide)
+            link = sent / link_bytes_per_second
+            results[label] = (cpu, wall, sent, max(wall, link))
+            print(f"{label:<8} CPU {cpu:7.2f}s  挂钟 {wall:7.2f}s  发送 {sent / 1024 / 1024:8.1f} MB  "
+                  f"估计传输 {max(wall, link):7.2f}s")
+
+        always, policy_result = results['始终 -z'], results['按文件策略']
+        print(f"\n策略相对始终压缩: CPU 节省 {always[0] - policy_result[0]:.2f}s "
+              f"({(1 - policy_result[0] / always[0]) * 100 if always[0] else 0:.0f}%), "
+              f"发送字节增加 {(policy_result[2] - always[2]) / 1024 / 1024:.1f} MB, "
+              f"估计传输 {always[3]:.2f}s -> {policy_result[3]:.2f}s")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件过滤微基准：逐模式 fnmatch 循环 vs 预编译过滤器
+
+用途：
+- 生成合成文件名列表（默认 100 万个，混合媒体、文档、隐藏和临时文件）；
+- 分别用原实现（逐个排除模式 fnmatch + startswith）和 FileFilter 过滤；
+- 校验两者结果一致，并输出耗时和加速比。
+
+运行示例：
+  python celestial_nasops/tools/bench_file_filter.py --count 1000000 --strategy extended
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_filter import (FileFilter, MEDIA_EXTENSIONS, EXTENDED_EXTENSIONS,
+                         DEFAULT_EXCLUDE_PATTERNS, FILTER_STRATEGIES)
+
+NAME_TEMPLATES = [
+    'DJI_{n:04d}.JPG', 'DJI_{n:04d}.MP4', 'DJI_{n:04d}.DNG', 'survey_{n}.las',
+    'flight_{n}.log', 'report_{n}.pdf', 'track_{n}.kml', 'README_{n}',
+    '.hidden_{n}', '.tmp_upload_{n}.mp4', 'cache_{n}.tmp', 'Thumbs.db',
+    'archive_{n}.bin', 'notes_{n}.md',
+]
+
+
+def legacy_should_process(filename, strategy, custom_extensions, exclude_patterns):
+    """原 _should_process_file 实现（逐模式匹配）"""
+    for pattern in exclude_patterns:
+        if fnmatch.fnmatch(filename, pattern) or filename.startswith(pattern.rstrip('*')):
+            return False
+    if strategy == 'all_files':
+        return True
+    file_ext = os.path.splitext(filename)[1].lower()
+    if strategy == 'media_only':
+        return file_ext in MEDIA_EXTENSIONS
+    if strategy == 'custom':
+        return not file_ext or file_ext in custom_extensions
+    return not file_ext or file_ext in EXTENDED_EXTENSIONS
+
+
+def generate_names(count, seed=42):
+    """生成合成文件名列表"""
+    rng = random.Random(seed)
+    return [rng.choice(NAME_TEMPLATES).format(n=i) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件过滤微基准')
+    parser.add_argument('--count', type=int, default=1_000_000, help='合成文件名数量')
+    parser.add_argument('--strategy', choices=FILTER_STRATEGIES, default='extended', help='过滤策略')
+    args = parser.parse_args()
+
+    custom_extensions = {'.mp4', '.jpg', '.txt', '.las'}
+    patterns = list(DEFAULT_EXCLUDE_PATTERNS)
+    names = generate_names(args.count)
+    print(f"文件名数量: {len(names)}, 策略: {args.strategy}, 排除模式: {len(patterns)} 个")
+
+    start = time.perf_counter()
+    legacy = [legacy_should_process(name, args.strategy, custom_extensions, patterns) for name in names]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    file_filter = FileFilter(args.strategy, custom_extensions, patterns)
+    compile_time = time.perf_counter() - start
+    should_process = file_filter.should_process
+    start = time.perf_counter()
+    compiled = [should_process(name) for name in names]
+    compiled_time = time.perf_counter() - start
+
+    if legacy != compiled:
+        mismatches = [name for name, a, b in zip(names, legacy, compiled) if a != b]
+        print(f"结果不一致: {len(mismatches)} 个，例如 {mismatches[:5]}")
+        return 1
+
+    print(f"通过过滤: {sum(compiled)} 个")
+    print(f"逐模式 fnmatch: {legacy_time:.3f} 秒 ({legacy_time / len(names) * 1e9:.0f} ns/个)")
+    print(f"预编译过滤器:   {compiled_time:.3f} 秒 ({compiled_time / len(names) * 1e9:.0f} ns/个), "
+          f"编译 {compile_time * 1e3:.2f} 毫秒")
+    print(f"加速比: {legacy_time / compiled_time:.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小文件上传基准：每文件一次 rsync / 每文件一次 SSH 会话 vs 一个 tar 流
+
+用途：
+- 使用测试中的伪造 ssh（在本机 sh 中执行远程命令）作为 sshd 替身，"远端" 为本机临时目录；
+- 生成一批小文件（默认 500 个 4KB~256KB 的 JSON / 缩略图替身）；
+- 分别以每文件一次 rsync（本机安装 rsync 时）、每文件一次 SSH 会话（cat > 文件）和
+  TarStreamUploader（一个会话 + 读取时校验）上传，输出耗时和吞吐量，并校验远端内容。
+
+替身下每次会话的固定开销是启动一个 Python 进程，与真实 SSH 复用连接上新开会话的开销同一量级；
+真实链路上 rsync 每个文件还有远端 rsync 启动和文件列表交换的往返，差距会更大。
+
+运行示例：
+  python celestial_nasops/tools/bench_stream_upload.py --count 500 --max-kb 256
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssh_connection_pool import SSHConnectionPool
+from stream_uploader import TarStreamUploader
+from test_ssh_connection_pool import install_fake_ssh
+
+
+def generate_files(directory, count, max_kb, seed=7):
+    """生成小文件，返回路径列表"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        suffix = rng.choice(('.json', '.txt', '.jpg'))
+        path = os.path.join(directory, f'item_{i:05d}{suffix}')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(rng.randint(4, max_kb) * 1024))
+        paths.append(path)
+    return paths
+
+
+def upload_rsync_per_file(pool, paths, remote_dir):
+    os.makedirs(remote_dir, exist_ok=True)
+    for path in paths:
+        subprocess.run(['rsync', '-a', '-e', pool.rsync_rsh(), path, f"{pool.target}:{remote_dir}/"],
+                       check=True, capture_output=True)
+
+
+def upload_ssh_per_file(pool, paths, remote_dir):
+    pool.run(f"mkdir -p {remote_dir}")
+    for path in paths:
+        with open(path, 'rb') as f:
+            result = pool.run(f"cat > {remote_dir}/{os.path.basename(path)}", input=f.read(), text=False)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+
+
+def upload_tar_stream(pool, paths, remote_dir):
+    results = TarStreamUploader(pool).upload(remote_dir, [(path, os.path.basename(path)) for path in paths])
+    failed = [path for path, (ok, _) in results.items() if not ok]
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个文件上传失败")
+
+
+def verify(paths, remote_dir):
+    """校验远端内容与本地一致"""
+    return all(filecmp.cmp(path, os.path.join(remote_dir, os.path.basename(path)), shallow=False)
+               for path in paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='小文件上传基准')
+    parser.add_argument('--count', type=int, default=500, help='小文件数量')
+    parser.add_argument('--max-kb', type=int, default=256, help='单个文件最大大小（KB）')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_stream_upload_')
+    try:
+        install_fake_ssh(os.path.join(root, 'ssh'))
+        os.environ.pop('FAKE_SSH_LOG', None)
+        pool = SSHConnectionPool('nas-bench', control_dir=os.path.join(root, 'control'))
+
+        source = os.path.join(root, 'source')
+        os.makedirs(source)
+        paths = generate_files(source, args.count, args.max_kb)
+        total = sum(os.path.getsize(path) for path in paths)
+        print(f"文件数: {len(paths)}, 数据量: {total / 1024 / 1024:.1f} MB")
+
+        methods = [('每文件 SSH 会话', upload_ssh_per_file), ('tar 流', upload_tar_stream)]
+        if shutil.which('rsync'):
+            methods.insert(0, ('每文件 rsync', upload_rsync_per_file))
+        else:
+            print("未安装 rsync，跳过每文件 rsync")
+
+        timings = {}
+        for label, upload in methods:
+            remote_dir = os.path.join(root, 'nas', label.replace(' ', '_'))
+            start = time.perf_counter()
+            upload(pool, paths, remote_dir)
+            elapsed = time.perf_counter() - start
+            timings[label] = elapsed
+            print(f"{label:<12} 耗时 {elapsed:7.2f}s  {len(paths) / elapsed:8.1f} 文件/s  "
+                  f"{total / 1024 / 1024 / elapsed:7.1f} MB/s  一致: {verify(paths, remote_dir)}")
+
+        baseline = next(iter(timings.values()))
+        print(f"\ntar 流相对 {next(iter(timings))} 加速: {baseline / timings['tar 流']:.1f}x")
+        pool.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
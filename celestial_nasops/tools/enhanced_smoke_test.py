@@ -23,7 +23,6 @@ import os
 import sys
 import time
 import subprocess
-import hashlib
 import shutil
 import socket
 import threading
@@ -41,6 +40,7 @@ DEFAULT_CONFIG = f"{PROJECT_ROOT}/celestial_nasops/unified_config.json"
 # 添加项目路径以导入数据库模块
 sys.path.insert(0, PROJECT_ROOT)
 from celestial_nasops.media_status_db import MediaStatusDB
+from celestial_nasops.file_hasher import get_file_hasher
 
 
 class TestStatus(Enum):
@@ -217,13 +217,9 @@ class FileManager:
         return self._generate_binary_content(size_bytes)
     
     def _calculate_file_hash(self, file_path: str) -> str:
-        """计算文件SHA256哈希值"""
-        hash_sha256 = hashlib.sha256()
+        """计算文件SHA256哈希值（大块缓冲区读取）"""
         try:
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_sha256.update(chunk)
-            return hash_sha256.hexdigest()
+            return get_file_hasher().hash_file(file_path, ('sha256',))['sha256']
         except Exception:
             return ""
     
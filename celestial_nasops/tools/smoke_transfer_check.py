@@ -33,7 +33,6 @@ import os
 import sys
 import time
 import subprocess
-import hashlib
 import shutil
 import socket
 from datetime import datetime
@@ -47,6 +46,7 @@ DEFAULT_CONFIG = f"{PROJECT_ROOT}/celestial_nasops/unified_config.json"
 # 添加项目路径以导入数据库模块
 sys.path.insert(0, PROJECT_ROOT)
 from celestial_nasops.media_status_db import MediaStatusDB
+from celestial_nasops.file_hasher import get_file_hasher
 
 
 def load_config(path: str) -> Dict:
@@ -108,23 +108,19 @@ def expected_remote_path(cfg: Dict, filename: str) -> str:
     return f"{base}/{dt.year:04d}/{dt.month:02d}/{dt.day:02d}/{filename}"
 
 
-def calculate_file_hash(file_path: str) -> str:
-    """计算文件的SHA256哈希值
+def calculate_file_digests(file_path: str) -> Dict[str, str]:
+    """一次读取计算文件的SHA256和MD5摘要
     
     参数：
         file_path: 文件路径
     返回：
-        文件的SHA256哈希值（十六进制字符串）
+        算法 -> 十六进制摘要，失败时返回空字典
     """
-    hash_sha256 = hashlib.sha256()
     try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+        return get_file_hasher().hash_file(file_path, ('sha256', 'md5'))
     except Exception as e:
         print(f"计算文件哈希失败: {e}")
-        return ""
+        return {}
 
 
 def write_local_file(local_dir: str, filename: str, size_bytes: int = 1024) -> tuple[str, int]:
@@ -728,7 +724,8 @@ def main() -> int:
                 db = None
             else:
                 # 计算文件哈希值
-                file_hash = calculate_file_hash(local_path)
+                file_digests = calculate_file_digests(local_path)
+                file_hash = file_digests.get('sha256', '')
                 
                 # 插入文件记录到数据库（将下载状态标记为completed，以便守护进程拾取）
                 if file_hash:
@@ -738,7 +735,8 @@ def main() -> int:
                         file_size=actual_size,
                         file_hash=file_hash,
                         download_status='completed',
-                        transfer_status='pending'
+                        transfer_status='pending',
+                        file_digests=file_digests
                     )
                     if success:
                         print(f"✓ 已将测试文件记录插入数据库并标记为下载完成: {filename}")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发传输引擎
+
+功能说明：
+1. 使用有界线程池并发执行 N 个传输任务（security.max_concurrent_transfers）
+2. 通过在途字节数上限控制同时传输的数据量，避免大文件挤占带宽和内存
+3. 每个工作线程从 MediaStatusDB 原子领取文件（带租约），保证同一文件不会被重复传输，
+   崩溃遗留的文件在租约过期后由 reclaim_expired 回收
+4. 单个文件超过在途字节上限时，在没有其他在途传输时仍允许单独传输
+5. 支持以"文件组"为单位并发执行批量传输任务（如按日期目录分组的 rsync）
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+from media_status_db import MediaStatusDB, MediaFileInfo
+
+
+class InflightBytesLimiter:
+    """在途字节数限制器"""
+
+    def __init__(self, max_bytes: int):
+        """初始化限制器
+
+        Args:
+            max_bytes: 同时在途的最大字节数，<=0 表示不限制
+        """
+        self.max_bytes = max_bytes
+        self._inflight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def inflight(self) -> int:
+        """当前在途字节数"""
+        with self._cond:
+            return self._inflight
+
+    def acquire(self, nbytes: int):
+        """占用在途字节额度，额度不足时阻塞等待
+
+        Args:
+            nbytes: 需要占用的字节数
+        """
+        with self._cond:
+            if self.max_bytes > 0:
+                while self._inflight > 0 and self._inflight + nbytes > self.max_bytes:
+                    self._cond.wait()
+            self._inflight += nbytes
+
+    def release(self, nbytes: int):
+        """释放在途字节额度
+
+        Args:
+            nbytes: 需要释放的字节数
+        """
+        with self._cond:
+            self._inflight = max(0, self._inflight - nbytes)
+            self._cond.notify_all()
+
+
+class TransferEngine:
+    """有界并发传输引擎"""
+
+    def __init__(self,
+                 db: MediaStatusDB,
+                 transfer_func: Callable[[MediaFileInfo], bool],
+                 max_workers: int = 1,
+                 max_inflight_bytes: int = 0,
+                 lease_seconds: float = None,
+                 logger: logging.Logger = None):
+        """初始化传输引擎
+
+        Args:
+            db: 媒体状态数据库，用于原子领取待传输文件
+            transfer_func: 传输单个已领取文件的函数，返回是否成功（负责更新最终状态）
+            max_workers: 最大并发传输数
+            max_inflight_bytes: 在途字节上限，<=0 表示不限制
+            lease_seconds: 领取租约时长（秒），None 使用数据库默认值
+            logger: 日志记录器
+        """
+        self.db = db
+        self.transfer_func = transfer_func
+        self.max_workers = max(1, int(max_workers))
+        self.limiter = InflightBytesLimiter(max_inflight_bytes)
+        self.lease_seconds = lease_seconds
+        self.logger = logger or logging.getLogger('TransferEngine')
+
+        self._budget_lock = threading.Lock()
+        self._remaining = 0
+
+    def run(self, max_files: int) -> Tuple[int, int]:
+        """执行一轮传输，直到达到文件数上限或队列为空
+
+        Args:
+            max_files: 本轮最多传输的文件数
+
+        Returns:
+            (成功数量, 失败数量)
+        """
+        if max_files <= 0:
+            return 0, 0
+
+        self._remaining = max_files
+        worker_count = min(self.max_workers, max_files)
+
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='transfer') as pool:
+            futures = [pool.submit(self._worker) for _ in range(worker_count)]
+            results = [future.result() for future in futures]
+
+        success_count = sum(result[0] for result in results)
+        failed_count = sum(result[1] for result in results)
+        return success_count, failed_count
+
+    def run_jobs(self,
+                 jobs: List[List[MediaFileInfo]],
+                 job_func: Callable[[List[MediaFileInfo]], Tuple[int, int]]) -> Tuple[int, int]:
+        """并发执行一组已领取文件的批量传输任务
+
+        每个任务占用其全部文件大小之和的在途字节额度。
+
+        Args:
+            jobs: 任务列表，每个任务是一组已领取的文件
+            job_func: 执行单个任务的函数，返回 (成功数量, 失败数量)，负责更新最终状态
+
+        Returns:
+            (成功数量, 失败数量)
+        """
+        if not jobs:
+            return 0, 0
+
+        def run_job(files: List[MediaFileInfo]) -> Tuple[int, int]:
+            job_bytes = sum(file_info.file_size for file_info in files)
+            self.limiter.acquire(job_bytes)
+            try:
+                return job_func(files)
+            except Exception as e:
+                self.logger.error(f"批量传输任务异常: {len(files)} 个文件, 错误: {e}")
+                return 0, len(files)
+            finally:
+                self.limiter.release(job_bytes)
+
+        worker_count = min(self.max_workers, len(jobs))
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='transfer') as pool:
+            results = list(pool.map(run_job, jobs))
+
+        return sum(result[0] for result in results), sum(result[1] for result in results)
+
+    def _take_budget(self) -> bool:
+        """从本轮文件数额度中取出一个"""
+        with self._budget_lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def _worker(self) -> Tuple[int, int]:
+        """工作线程：循环领取并传输文件"""
+        success_count = 0
+        failed_count = 0
+
+        worker_id = self.db.default_worker_id()
+        while self._take_budget():
+            claimed = self.db.claim_batch(worker_id, 1, lease_seconds=self.lease_seconds)
+            if not claimed:
+                break
+
+            file_info = claimed[0]
+            self.limiter.acquire(file_info.file_size)
+            try:
+                success = self.transfer_func(file_info)
+            except Exception as e:
+                self.logger.error(f"传输任务异常: {file_info.file_name}, 错误: {e}")
+                success = False
+            finally:
+                self.limiter.release(file_info.file_size)
+
+            if success:
+                success_count += 1
+            else:
+                failed_count += 1
+
+        return success_count, failed_count
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传输压缩策略 - 按文件决定 rsync 是否启用压缩
+
+功能说明：
+1. 已压缩格式（file_filter.COMPRESSED_EXTENSIONS：视频、JPEG、DNG、ZIP 等）不再压缩，
+   避免在边缘端 ARM 核上消耗 CPU 却几乎不减少传输字节数
+2. 其他文件读取中部的一段样本计算字节熵，接近 8 bit/字节的内容（加密、未知压缩格式）同样不压缩
+3. 需要压缩时使用 -z 并通过 --skip-compress 传入已压缩格式的后缀，
+   批量传输中的媒体文件由 rsync 逐个跳过压缩
+4. 遵循 dock_transfer_config.performance.enable_compression 总开关
+
+作者: Celestial
+日期: 2026-10-16
+"""
+
+import os
+import math
+import logging
+from collections import Counter
+from typing import Iterable, List
+
+from file_filter import COMPRESSED_EXTENSIONS
+
+COMPRESSION_MODES = ('auto', 'always', 'never')
+
+DEFAULT_ENTROPY_THRESHOLD = 7.5      # bit/字节，不低于该值视为不可压缩
+DEFAULT_SAMPLE_BYTES = 64 * 1024     # 熵采样大小
+DEFAULT_MIN_SAMPLE_SIZE = 64 * 1024  # 小于该大小的文件不采样，按扩展名决定
+
+
+def byte_entropy(data: bytes) -> float:
+    """计算字节序列的香农熵（bit/字节，0~8）"""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def skip_compress_suffixes(extensions: Iterable[str] = COMPRESSED_EXTENSIONS) -> str:
+    """rsync --skip-compress 参数值（不含点的后缀，以 / 分隔）"""
+    return '/'.join(sorted(ext.lstrip('.') for ext in extensions))
+
+
+class CompressionPolicy:
+    """传输压缩策略"""
+
+    def __init__(self,
+                 enabled: bool = True,
+                 mode: str = 'auto',
+                 skip_extensions: Iterable[str] = COMPRESSED_EXTENSIONS,
+                 entropy_threshold: float = DEFAULT_ENTROPY_THRESHOLD,
+                 sample_bytes: int = DEFAULT_SAMPLE_BYTES,
+                 min_sample_size: int = DEFAULT_MIN_SAMPLE_SIZE):
+        """初始化压缩策略
+
+        Args:
+            enabled: 压缩总开关（dock_transfer_config.performance.enable_compression）
+            mode: auto（按扩展名和熵采样决定）、always（始终 -z）或 never
+            skip_extensions: 不压缩的扩展名
+            entropy_threshold: 熵阈值（bit/字节）
+            sample_bytes: 熵采样大小（字节）
+            min_sample_size: 小于该大小的文件不采样
+        """
+        self.enabled = enabled
+        self.mode = mode if mode in COMPRESSION_MODES else 'auto'
+        self.skip_extensions = frozenset(ext.lower() for ext in skip_extensions)
+        self.entropy_threshold = entropy_threshold
+        self.sample_bytes = sample_bytes
+        self.min_sample_size = min_sample_size
+        self.logger = logging.getLogger('CompressionPolicy')
+
+        self._skip_compress_arg = f"--skip-compress={skip_compress_suffixes(self.skip_extensions)}"
+
+    def _sample_entropy(self, file_path: str, file_size: int) -> float:
+        """读取文件中部的样本计算熵（文件头通常是低熵的结构化数据）"""
+        offset = max(0, file_size // 2 - self.sample_bytes // 2)
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            return byte_entropy(f.read(self.sample_bytes))
+
+    def should_compress(self, file_path: str, file_size: int = None) -> bool:
+        """判断文件传输时是否值得压缩
+
+        Args:
+            file_path: 文件路径
+            file_size: 已知的文件大小，None 时重新获取
+
+        Returns:
+            bool: 需要压缩返回True
+        """
+        if not self.enabled or self.mode == 'never':
+            return False
+        if self.mode == 'always':
+            return True
+
+        if os.path.splitext(file_path)[1].lower() in self.skip_extensions:
+            return False
+
+        try:
+            if file_size is None:
+                file_size = os.path.getsize(file_path)
+            if file_size < self.min_sample_size:
+                return True
+            entropy = self._sample_entropy(file_path, file_size)
+        except OSError as e:
+            self.logger.debug(f"熵采样失败，按可压缩处理: {file_path}, 错误: {e}")
+            return True
+
+        if entropy >= self.entropy_threshold:
+            self.logger.debug(f"内容接近随机 ({entropy:.2f} bit/字节)，不压缩: {file_path}")
+            return False
+        return True
+
+    def rsync_args(self, file_paths: Iterable[str]) -> List[str]:
+        """一次 rsync 调用的压缩参数
+
+        任一文件值得压缩时启用 -z，并用 --skip-compress 让 rsync 跳过其中的已压缩格式；
+        全部文件都不值得压缩时不传 -z。
+
+        Args:
+            file_paths: 本次传输的文件
+
+        Returns:
+            List[str]: rsync 参数
+        """
+        if self.enabled and self.mode == 'always':
+            return ['-z']
+        if any(self.should_compress(path) for path in file_paths):
+            return ['-z', self._skip_compress_arg]
+        return []